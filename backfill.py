@@ -0,0 +1,100 @@
+"""
+Исторический бэкфилл: классификация истории чатов с возобновляемыми чекпоинтами
+"""
+import logging
+import time
+from typing import List, Dict, Any, Optional
+from telethon import utils as telethon_utils
+from config import config
+
+
+class HistoryBackfill:
+    """Прогоняет историю выбранных чатов через фильтры и классификатор пачками"""
+
+    def __init__(self, bot, page_size: int = None):
+        self.bot = bot
+        self.page_size = page_size or config.backfill.page_size
+
+    async def run(self, chats: List[str], limit: Optional[int] = None) -> Dict[str, Any]:
+        """Запускает бэкфилл по списку чатов и возвращает сводку"""
+        summary = {'chats': 0, 'scanned': 0, 'saved': 0, 'forwardable': 0, 'seconds': 0.0}
+        started = time.perf_counter()
+
+        for chat in chats:
+            try:
+                chat_stats = await self.backfill_chat(chat, limit)
+            except Exception as e:
+                logging.error(f"❌ Ошибка бэкфилла чата {chat}: {e}")
+                continue
+
+            summary['chats'] += 1
+            for key in ('scanned', 'saved', 'forwardable'):
+                summary[key] += chat_stats[key]
+
+        summary['seconds'] = time.perf_counter() - started
+        summary['messages_per_second'] = summary['scanned'] / summary['seconds'] if summary['seconds'] else 0.0
+        logging.info(
+            f"✅ Бэкфилл завершен: чатов {summary['chats']}, просмотрено {summary['scanned']}, "
+            f"сохранено {summary['saved']}, {summary['messages_per_second']:.1f} сообщ./с"
+        )
+        return summary
+
+    async def backfill_chat(self, chat: str, limit: Optional[int] = None) -> Dict[str, Any]:
+        """Бэкфилл одного чата от сохраненного чекпоинта к новым сообщениям"""
+        client = self.bot.client
+        entity = await client.get_entity(self._parse_chat(chat))
+        chat_id = telethon_utils.get_peer_id(entity)
+        checkpoint = self.bot.db_manager.get_backfill_checkpoint(chat_id)
+
+        logging.info(f"📥 Бэкфилл чата {chat} (ID: {chat_id}) с сообщения {checkpoint}")
+
+        stats = {'scanned': 0, 'saved': 0, 'forwardable': 0}
+        started = time.perf_counter()
+        page = []
+
+        # reverse=True идет от старых к новым, поэтому чекпоинт растет монотонно
+        async for message in client.iter_messages(entity, min_id=checkpoint, reverse=True, limit=limit):
+            page.append(message)
+            if len(page) >= self.page_size:
+                await self._process_page(chat_id, page, stats)
+                page = []
+                self._report(chat, stats, started)
+
+        if page:
+            await self._process_page(chat_id, page, stats)
+            self._report(chat, stats, started)
+
+        return stats
+
+    async def _process_page(self, chat_id: int, page: list, stats: Dict[str, int]):
+        """Классифицирует страницу и записывает ее вместе с чекпоинтом одной транзакцией"""
+        classified = [(analysis, record) for _, analysis, record in await self.bot.classify_batch(page) if record]
+        # История не пересылается: forwarded в БД означает, что сообщение кто-то получил
+        records = [{**record, 'forwarded': False} for _, record in classified]
+        last_message_id = max(message.id for message in page)
+
+        if not self.bot.db_manager.save_messages_batch(records, checkpoint=(chat_id, last_message_id)):
+            raise RuntimeError(f"не удалось сохранить страницу до сообщения {last_message_id}")
+
+        stats['scanned'] += len(page)
+        stats['saved'] += len(records)
+        stats['forwardable'] += sum(1 for analysis, _ in classified if analysis['should_forward'])
+
+    @staticmethod
+    def _report(chat: str, stats: Dict[str, int], started: float):
+        """Логирует прогресс и скорость обработки"""
+        elapsed = time.perf_counter() - started
+        rate = stats['scanned'] / elapsed if elapsed else 0.0
+        logging.info(
+            f"📊 {chat}: просмотрено {stats['scanned']}, сохранено {stats['saved']}, "
+            f"подходящих {stats['forwardable']}, {rate:.1f} сообщ./с"
+        )
+
+    @staticmethod
+    def _parse_chat(chat: str):
+        """Преобразует идентификатор чата из CLI в формат Telethon"""
+        chat = chat.strip()
+        try:
+            return int(chat)
+        except ValueError:
+            return chat
@@ -0,0 +1,97 @@
+"""
+Бенчмарк записи сообщений: подключение на каждый вызов против долгоживущего настроенного
+
+Режим "legacy" воспроизводит прежний DatabaseManager: sqlite3.connect на каждый вызов,
+журнал отката по умолчанию и commit (с fsync) на каждую запись. Режим "tuned" использует
+текущий DatabaseManager с общим подключением, WAL и настроенными PRAGMA. Запуск:
+    python -m benchmarks.db_write --messages 2000
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import DatabaseManager
+
+
+def make_message(i: int) -> dict:
+    return {
+        'message_id': i,
+        'chat_id': -1000000000000 - i % 20,
+        'sender_id': 100000 + i % 500,
+        'text': f'Ищем подрядчика на видеопродакшн полного цикла, сообщение номер {i}',
+        'message_date': '01.01.2024 10:00',
+        'similarity_score': 0.5,
+        'is_full_cycle': False,
+        'ml_probability': 0.3,
+        'forwarded': False
+    }
+
+
+def bench_legacy(db_path: str, count: int) -> float:
+    """Подключение и commit на каждое сообщение, как в исходной реализации"""
+    DatabaseManager(db_path).close()
+    conn = sqlite3.connect(db_path)
+    conn.execute('PRAGMA journal_mode=DELETE')
+    conn.close()
+
+    started = time.perf_counter()
+    for i in range(count):
+        conn = sqlite3.connect(db_path)
+        try:
+            conn.execute(DatabaseManager.INSERT_MESSAGE_SQL, DatabaseManager._message_row(make_message(i)))
+            conn.commit()
+        finally:
+            conn.close()
+    return time.perf_counter() - started
+
+
+def bench_tuned(db_path: str, count: int) -> float:
+    """Общее подключение DatabaseManager с WAL и настроенными PRAGMA"""
+    db_manager = DatabaseManager(db_path)
+    started = time.perf_counter()
+    for i in range(count):
+        db_manager.save_message(make_message(i))
+    elapsed = time.perf_counter() - started
+    db_manager.close()
+    return elapsed
+
+
+def bench_reads(db_path: str, count: int) -> float:
+    """Чтение по ID через общее подключение"""
+    db_manager = DatabaseManager(db_path)
+    started = time.perf_counter()
+    for i in range(count):
+        db_manager.get_message(i, make_message(i)['chat_id'])
+    elapsed = time.perf_counter() - started
+    db_manager.close()
+    return elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Бенчмарк записи в bot_database.db')
+    parser.add_argument('--messages', type=int, default=2000)
+    parser.add_argument('--dir', help='каталог для временных БД (по умолчанию системный temp)')
+    args = parser.parse_args(argv)
+
+    directory = args.dir or tempfile.mkdtemp()
+    results = {}
+    for name, bench in (('legacy', bench_legacy), ('tuned', bench_tuned)):
+        db_path = os.path.join(directory, f'bench_{name}.db')
+        elapsed = bench(db_path, args.messages)
+        results[name] = elapsed
+        print(f"💾 {name}: {args.messages} записей за {elapsed:.3f} с "
+              f"({args.messages / elapsed:.0f} записей/с, {elapsed / args.messages * 1e6:.0f} мкс/запись)")
+
+    read_elapsed = bench_reads(os.path.join(directory, 'bench_tuned.db'), args.messages)
+    print(f"🔎 tuned get_message: {args.messages / read_elapsed:.0f} чтений/с")
+    print(f"🚀 Ускорение записи: x{results['legacy'] / results['tuned']:.1f}")
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+"""
+Общие части оффлайн-стендов: поддельный клиент Telethon и замер стадий конвейера
+"""
+import asyncio
+import functools
+import inspect
+import itertools
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+
+class FakeSender:
+    """Отправитель с полями, которые читает TelegramBot._format_sender"""
+
+    def __init__(self, name: str = '', username: str = ''):
+        self.first_name = name
+        self.last_name = None
+        self.username = username or None
+
+
+class FakeChat:
+    """Чат с названием"""
+
+    def __init__(self, title: str = ''):
+        self.title = title
+
+
+class FakeMessage:
+    """Минимальная замена telethon Message для прогона через TelegramBot"""
+
+    def __init__(self, message_id: int, chat_id: int, sender_id: int, text: str,
+                 date: Optional[datetime] = None, chat_title: str = '', sender_name: str = '',
+                 client: 'FakeClient' = None):
+        self.id = message_id
+        self.chat_id = chat_id
+        self.sender_id = sender_id
+        self.text = text
+        self.date = date or datetime.now(timezone.utc)
+        self.out = False
+        self.media = None
+        self.chat = None
+        self._chat = FakeChat(chat_title)
+        self._sender = FakeSender(sender_name)
+        self._client = client
+
+    async def get_sender(self):
+        if self._client:
+            self._client.record('get_sender')
+        return self._sender
+
+    async def get_chat(self):
+        if self._client:
+            self._client.record('get_chat')
+        return self._chat
+
+
+class FakeEvent:
+    """Замена events.NewMessage.Event"""
+
+    def __init__(self, message: FakeMessage):
+        self.message = message
+        self.chat_id = message.chat_id
+        self.sender_id = message.sender_id
+        self.replies = []
+
+    async def reply(self, text: str):
+        self.replies.append(text)
+
+
+class FakeClient:
+    """Клиент, который записывает вызовы API вместо обращения к Telegram"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = Counter()
+        self.sent = []
+        self._ids = itertools.count(1)
+        # История чатов для iter_messages: chat_id -> сообщения
+        self.history = defaultdict(list)
+
+    def add_history(self, messages: List['FakeMessage']):
+        """Кладет сообщения в историю их чатов"""
+        for message in messages:
+            self.history[message.chat_id].append(message)
+
+    def record(self, method: str):
+        self.calls[method] += 1
+
+    async def _call(self, method: str):
+        self.record(method)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def get_entity(self, entity):
+        await self._call('get_entity')
+        return entity
+
+    async def get_dialogs(self, *args, **kwargs):
+        await self._call('get_dialogs')
+        return []
+
+    async def iter_messages(self, entity, limit: Optional[int] = None, min_id: int = 0,
+                            reverse: bool = False):
+        """Как у Telethon: от новых к старым (reverse=True - наоборот), только ID больше min_id"""
+        await self._call('iter_messages')
+        messages = sorted(
+            (message for message in self.history.get(entity, []) if message.id > min_id),
+            key=lambda message: message.id, reverse=not reverse
+        )
+        for message in messages[:limit]:
+            yield message
+
+    async def forward_messages(self, entity, message):
+        await self._call('forward_messages')
+        self.sent.append(('forward', entity, message.id))
+        return FakeMessage(next(self._ids), 0, 0, message.text)
+
+    async def send_message(self, entity, text, reply_to=None):
+        await self._call('send_message')
+        self.sent.append(('send', entity, text))
+        return FakeMessage(next(self._ids), 0, 0, text)
+
+    async def send_file(self, entity, file, reply_to=None):
+        await self._call('send_file')
+        self.sent.append(('file', entity, None))
+        return FakeMessage(next(self._ids), 0, 0, '')
+
+    async def disconnect(self):
+        self.record('disconnect')
+
+
+class StageTimer:
+    """Оборачивает методы объекта и собирает задержки по стадиям"""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+
+    def wrap(self, owner: Any, attribute: str, stage: str = None):
+        """Подменяет owner.attribute оберткой с замером времени"""
+        stage = stage or attribute.lstrip('_')
+        original = getattr(owner, attribute)
+        samples = self.samples[stage]
+
+        if inspect.iscoroutinefunction(original):
+            @functools.wraps(original)
+            async def timed(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await original(*args, **kwargs)
+                finally:
+                    samples.append(time.perf_counter() - started)
+        else:
+            @functools.wraps(original)
+            def timed(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return original(*args, **kwargs)
+                finally:
+                    samples.append(time.perf_counter() - started)
+
+        setattr(owner, attribute, timed)
+        return timed
+
+    def add(self, stage: str, seconds: float):
+        self.samples[stage].append(seconds)
+
+    def report(self) -> Dict[str, Dict[str, float]]:
+        """Перцентили задержек по стадиям в миллисекундах"""
+        return {stage: latency_percentiles(values) for stage, values in self.samples.items() if values}
+
+
+def latency_percentiles(values: List[float]) -> Dict[str, float]:
+    """p50/p90/p99/max в миллисекундах"""
+    data = np.asarray(values, dtype=np.float64) * 1000.0
+    p50, p90, p99 = np.percentile(data, [50, 90, 99])
+    return {
+        'count': int(data.size),
+        'p50_ms': float(p50),
+        'p90_ms': float(p90),
+        'p99_ms': float(p99),
+        'max_ms': float(data.max()),
+        'mean_ms': float(data.mean())
+    }
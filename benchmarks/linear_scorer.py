@@ -0,0 +1,65 @@
+"""
+Микробенчмарк инференса: sklearn predict_proba против LinearScorer на numpy
+Запуск:
+    python -m benchmarks.linear_scorer [--dim 384] [--batch 64] [--repeat 2000]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fast_scorer import LinearScorer
+
+
+def _timeit(func, repeat: int) -> float:
+    """Среднее время вызова в микросекундах"""
+    func()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - started) / repeat * 1e6
+
+
+def main(argv=None):
+    from sklearn.linear_model import LogisticRegression
+
+    parser = argparse.ArgumentParser(description='Бенчмарк инференса линейной модели')
+    parser.add_argument('--dim', type=int, default=384)
+    parser.add_argument('--batch', type=int, default=64)
+    parser.add_argument('--repeat', type=int, default=2000)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(2000, args.dim)).astype(np.float32)
+    y = (X[:, 0] + 0.1 * rng.normal(size=len(X)) > 0).astype(int)
+    model = LogisticRegression(max_iter=1000).fit(X, y)
+    scorer = LinearScorer.from_estimator(model)
+
+    single = X[0]
+    batch = X[:args.batch]
+    max_error = float(np.abs(scorer.score(X) - model.predict_proba(X)[:, 1]).max())
+
+    results = {
+        'sklearn_single_us': _timeit(lambda: model.predict_proba([single])[0][1], args.repeat),
+        'scorer_single_us': _timeit(lambda: scorer.score(single), args.repeat),
+        'sklearn_batch_us': _timeit(lambda: model.predict_proba(batch)[:, 1], args.repeat),
+        'scorer_batch_us': _timeit(lambda: scorer.score(batch), args.repeat),
+        'max_abs_error': max_error
+    }
+
+    print(f"⚡ Одиночное сообщение: sklearn {results['sklearn_single_us']:.1f} мкс, "
+          f"LinearScorer {results['scorer_single_us']:.1f} мкс "
+          f"(x{results['sklearn_single_us'] / results['scorer_single_us']:.1f})")
+    print(f"⚡ Пачка из {args.batch}: sklearn {results['sklearn_batch_us']:.1f} мкс, "
+          f"LinearScorer {results['scorer_batch_us']:.1f} мкс "
+          f"(x{results['sklearn_batch_us'] / results['scorer_batch_us']:.1f})")
+    print(f"🎯 Максимальное расхождение вероятностей: {max_error:.2e}")
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,295 @@
+"""
+Синтетическая нагрузка на TelegramBot: задержка обработчика и лаг event loop под конкуренцией
+
+Генератор открытого цикла подает синтетические NewMessage-события с заданной частотой
+(ступенями), распределяя их по нескольким чатам, и измеряет сквозную задержку обработчика,
+лаг event loop, рост очереди необработанных событий и память во времени. Запуск:
+    python -m benchmarks.loadgen --rates 5,10,20,50 --step-seconds 20 --chats 50 --json run.json
+    python -m benchmarks.loadgen --rates 5,10 --compare run.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.harness import FakeClient, FakeEvent, FakeMessage, latency_percentiles
+
+FILLER_WORDS = [
+    'нужен', 'ищем', 'проект', 'срочно', 'бюджет', 'команда', 'задача', 'клиент', 'сроки',
+    'опыт', 'работа', 'вакансия', 'предложение', 'компания', 'подрядчик', 'обсудить', 'детали'
+]
+
+
+class MessageFactory:
+    """Генерирует тексты с логнормальным распределением длины в словах"""
+
+    def __init__(self, keywords: List[str], mean_words: float = 30.0, sigma: float = 0.8,
+                 max_words: int = 600, keyword_ratio: float = 0.2, seed: int = 42):
+        self.random = random.Random(seed)
+        self.keywords = [kw for kw in keywords if kw] or ['проект']
+        self.mu = max(mean_words, 1.0)
+        self.sigma = sigma
+        self.max_words = max_words
+        self.keyword_ratio = keyword_ratio
+
+    def text(self) -> str:
+        length = int(min(self.max_words, max(1, self.random.lognormvariate(0, self.sigma) * self.mu)))
+        words = [self.random.choice(FILLER_WORDS) for _ in range(length)]
+        if self.random.random() < self.keyword_ratio:
+            words.insert(self.random.randrange(len(words) + 1), self.random.choice(self.keywords))
+        return ' '.join(words)
+
+
+class LoopLagMonitor:
+    """Измеряет опоздание пробуждения event loop относительно ожидаемого"""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.samples = []
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - expected))
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._run())
+
+    def drain(self) -> List[float]:
+        samples, self.samples = self.samples, []
+        return samples
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+
+def current_rss_mb() -> float:
+    """Текущий RSS процесса в МБ (Linux: /proc, иначе пиковый через resource)"""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+    except (OSError, ValueError, AttributeError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class LoadGenerator:
+    """Подает события с постоянной частотой по ступеням и снимает метрики"""
+
+    def __init__(self, bot, factory: MessageFactory, chats: int = 10, sample_interval: float = 1.0):
+        self.bot = bot
+        self.factory = factory
+        self.chats = max(1, chats)
+        self.sample_interval = sample_interval
+        self.monitor = LoopLagMonitor()
+        self.in_flight = set()
+        self._next_id = 1
+
+    async def run(self, rates: List[float], step_seconds: float) -> Dict[str, Any]:
+        self.monitor.start()
+        steps = []
+        try:
+            for rate in rates:
+                steps.append(await self._run_step(rate, step_seconds))
+                # Даем очереди рассосаться, чтобы ступени не влияли друг на друга
+                if self.in_flight:
+                    await asyncio.wait(self.in_flight)
+                self.monitor.drain()
+        finally:
+            await self.monitor.stop()
+
+        saturated = [step['rate'] for step in steps if step['falling_behind']]
+        return {
+            'steps': steps,
+            'saturation_rate': saturated[0] if saturated else None,
+            'max_sustained_rate': max((step['rate'] for step in steps if not step['falling_behind']), default=None)
+        }
+
+    async def _run_step(self, rate: float, duration: float) -> Dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        latencies = []
+        timeline = []
+        lag_samples = []
+        sent = 0
+        started = loop.time()
+        next_sample = started + self.sample_interval
+        completed_before = 0
+
+        def on_done(task, scheduled_at):
+            self.in_flight.discard(task)
+            latencies.append(loop.time() - scheduled_at)
+
+        while True:
+            now = loop.time()
+            if now - started >= duration:
+                break
+
+            # Открытый цикл: догоняем расписание, даже если loop опаздывает
+            due = int((now - started) * rate) + 1
+            while sent < due:
+                scheduled_at = started + sent / rate
+                task = asyncio.ensure_future(self.bot._handle_message(FakeEvent(self._make_message())))
+                task.add_done_callback(lambda t, at=scheduled_at: on_done(t, at))
+                self.in_flight.add(task)
+                sent += 1
+
+            if now >= next_sample:
+                step_lag = self.monitor.drain()
+                lag_samples.extend(step_lag)
+                timeline.append({
+                    't': round(now - started, 3),
+                    'sent': sent,
+                    'completed': len(latencies),
+                    'in_flight': len(self.in_flight),
+                    'throughput': (len(latencies) - completed_before) / self.sample_interval,
+                    'loop_lag_ms': max(step_lag, default=0.0) * 1000,
+                    'rss_mb': round(current_rss_mb(), 1)
+                })
+                completed_before = len(latencies)
+                next_sample += self.sample_interval
+
+            await asyncio.sleep(min(1.0 / rate, 0.01))
+
+        elapsed = loop.time() - started
+        lag_samples.extend(self.monitor.drain())
+        completed = len(latencies)
+        backlog = len(self.in_flight)
+
+        step = {
+            'rate': rate,
+            'seconds': elapsed,
+            'sent': sent,
+            'completed': completed,
+            'achieved_throughput': completed / elapsed if elapsed else 0.0,
+            'backlog_at_end': backlog,
+            'latency': latency_percentiles(latencies) if latencies else {},
+            'loop_lag': latency_percentiles(lag_samples) if lag_samples else {},
+            'rss_mb_end': round(current_rss_mb(), 1),
+            'timeline': timeline,
+            # Отстаем, если не успеваем обработать 95% поданного или очередь растет
+            'falling_behind': completed < 0.95 * sent or _is_growing([p['in_flight'] for p in timeline])
+        }
+        summary_line = (
+            f"⚡ {rate:g} сообщ./с: обработано {completed}/{sent}, очередь {backlog}, "
+            f"p99 {step['latency'].get('p99_ms', 0):.1f} мс, лаг loop p99 {step['loop_lag'].get('p99_ms', 0):.1f} мс"
+        )
+        print(summary_line + (" ⚠️ отстает" if step['falling_behind'] else ""))
+        return step
+
+    def _make_message(self) -> FakeMessage:
+        message_id = self._next_id
+        self._next_id += 1
+        chat_index = message_id % self.chats
+        return FakeMessage(
+            message_id=message_id,
+            chat_id=-1000000000000 - chat_index,
+            sender_id=100000 + message_id % (self.chats * 20),
+            text=self.factory.text(),
+            date=datetime.now(timezone.utc),
+            chat_title=f'Синтетический чат {chat_index}',
+            sender_name=f'user{message_id % 1000}',
+            client=self.bot.client
+        )
+
+
+def _is_growing(values: List[int]) -> bool:
+    """Очередь растет, если во второй половине ступени она устойчиво больше, чем в первой"""
+    if len(values) < 4:
+        return False
+    half = len(values) // 2
+    first, second = values[:half], values[half:]
+    return min(second) > max(first) and second[-1] > 0
+
+
+def run_metadata(args: argparse.Namespace) -> Dict[str, Any]:
+    """Параметры прогона и версия кода, чтобы отчеты можно было сравнивать"""
+    try:
+        revision = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                           stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        revision = None
+    return {
+        'started_at': datetime.now(timezone.utc).isoformat(),
+        'git_revision': revision,
+        'python': sys.version.split()[0],
+        'params': {key: value for key, value in vars(args).items() if key not in ('json', 'compare')}
+    }
+
+
+def compare_reports(current: Dict[str, Any], baseline: Dict[str, Any]):
+    """Печатает разницу p50/p99 и пропускной способности по совпадающим ступеням"""
+    baseline_steps = {step['rate']: step for step in baseline.get('steps', [])}
+    print(f"\n📊 Сравнение с {baseline.get('meta', {}).get('git_revision')}:")
+    for step in current['steps']:
+        old = baseline_steps.get(step['rate'])
+        if not old:
+            continue
+        for metric in ('p50_ms', 'p99_ms'):
+            new_value = step['latency'].get(metric, 0.0)
+            old_value = old['latency'].get(metric, 0.0)
+            change = (new_value - old_value) / old_value * 100 if old_value else 0.0
+            print(f"   • {step['rate']:g} сообщ./с {metric}: {old_value:.1f} → {new_value:.1f} ({change:+.1f}%)")
+        print(f"   • {step['rate']:g} сообщ./с throughput: "
+              f"{old['achieved_throughput']:.1f} → {step['achieved_throughput']:.1f}")
+
+
+async def main(argv: Optional[List[str]] = None) -> Dict[str, Any]:
+    parser = argparse.ArgumentParser(description='Синтетическая нагрузка на TelegramBot')
+    parser.add_argument('--rates', default='5,10,20,50', help='частоты ступеней, сообщ./с')
+    parser.add_argument('--step-seconds', type=float, default=20.0, help='длительность ступени')
+    parser.add_argument('--chats', type=int, default=20, help='число чатов-источников')
+    parser.add_argument('--mean-words', type=float, default=30.0, help='медиана длины сообщения в словах')
+    parser.add_argument('--sigma', type=float, default=0.8, help='разброс логнормального распределения длины')
+    parser.add_argument('--max-words', type=int, default=600, help='максимальная длина сообщения')
+    parser.add_argument('--keyword-ratio', type=float, default=0.2, help='доля сообщений с ключевым словом')
+    parser.add_argument('--send-latency', type=float, default=0.05, help='задержка заглушки отправки, с')
+    parser.add_argument('--sample-interval', type=float, default=1.0, help='шаг временного ряда, с')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', help='сохранить отчет в JSON')
+    parser.add_argument('--compare', help='сравнить с предыдущим JSON-отчетом')
+    args = parser.parse_args(argv)
+
+    from config import config
+    from benchmarks.replay import build_bot
+
+    client = FakeClient(latency=args.send_latency)
+    bot = build_bot(client=client)
+    factory = MessageFactory(config.business.keywords, args.mean_words, args.sigma,
+                             args.max_words, args.keyword_ratio, args.seed)
+    generator = LoadGenerator(bot, factory, chats=args.chats, sample_interval=args.sample_interval)
+
+    rates = [float(rate) for rate in args.rates.split(',') if rate.strip()]
+    report = await generator.run(rates, args.step_seconds)
+    report['meta'] = run_metadata(args)
+    report['api_calls'] = dict(client.calls)
+
+    print(f"\n🏁 Максимальная устойчивая частота: {report['max_sustained_rate']}, "
+          f"отставание начинается с: {report['saturation_rate']}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            compare_reports(report, json.load(f))
+    return report
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
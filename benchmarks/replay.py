@@ -0,0 +1,203 @@
+"""
+Оффлайн-реплей записанного корпуса сообщений через TelegramBot
+
+Формат корпуса (JSONL, одна запись на строку):
+    {"message_id": 1, "chat_id": -100, "chat_title": "...", "sender_id": 42,
+     "sender_name": "...", "text": "...", "date": "2024-01-01T10:00:00", "label": 1}
+
+Поле label (1 - должно быть переслано, 0 - нет) необязательно и нужно только для
+расчета precision/recall. Запуск:
+    python -m benchmarks.replay corpus.jsonl [--realtime] [--speed 10] [--json report.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.harness import FakeClient, FakeEvent, FakeMessage, StageTimer, latency_percentiles
+
+
+def load_corpus(path: str) -> List[Dict[str, Any]]:
+    """Читает JSONL-корпус и сортирует записи по времени"""
+    records = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            record.setdefault('message_id', record.get('id', line_number))
+            record['date'] = _parse_date(record.get('date') or record.get('timestamp'))
+            records.append(record)
+    records.sort(key=lambda record: record['date'])
+    return records
+
+
+def _parse_date(value) -> datetime:
+    """Дата записи в UTC с часовым поясом: ISO-строка (в т.ч. с суффиксом Z) или unix-время"""
+    if value is None:
+        return datetime.now(timezone.utc)
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value, tz=timezone.utc)
+    value = value.strip()
+    if value.endswith(('Z', 'z')):
+        # fromisoformat до Python 3.11 не понимает Z
+        value = value[:-1] + '+00:00'
+    date = datetime.fromisoformat(value)
+    # Даты без пояса считаются UTC, иначе их нельзя сравнивать с остальными при сортировке
+    if date.tzinfo is None:
+        return date.replace(tzinfo=timezone.utc)
+    return date.astimezone(timezone.utc)
+
+
+class ReplayHarness:
+    """Прогоняет корпус через TelegramBot._process_message с поддельным клиентом"""
+
+    def __init__(self, bot, client: FakeClient):
+        self.bot = bot
+        self.client = client
+        self.timer = StageTimer()
+        # (chat_id, message_id): ID сообщений уникальны только внутри чата
+        self.forwarded_ids = set()
+
+        self.timer.wrap(bot, '_filter_reason', 'filters')
+        self.timer.wrap(bot, '_analyze_message', 'analyze')
+        self.timer.wrap(bot.message_writer, 'submit', 'db_enqueue')
+        deliver = self.timer.wrap(bot, '_deliver', 'deliver')
+
+        async def tracked_deliver(message, analysis, message_data):
+            self.forwarded_ids.add((message.chat_id, message.id))
+            return await deliver(message, analysis, message_data)
+
+        bot._deliver = tracked_deliver
+
+    async def run(self, corpus: List[Dict[str, Any]], realtime: bool = False,
+                  speed: float = 1.0) -> Dict[str, Any]:
+        """Прогоняет корпус и возвращает отчет"""
+        started = time.perf_counter()
+        first_date = corpus[0]['date'] if corpus else None
+
+        for record in corpus:
+            if realtime:
+                # Воспроизводим записанные интервалы (с ускорением speed)
+                offset = (record['date'] - first_date).total_seconds() / max(speed, 1e-9)
+                delay = offset - (time.perf_counter() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+            event = FakeEvent(self._make_message(record))
+            message_started = time.perf_counter()
+            await self.bot._process_message(event)
+            self.timer.add('end_to_end', time.perf_counter() - message_started)
+
+        await self.bot.message_writer.flush()
+        elapsed = time.perf_counter() - started
+        return self._report(corpus, elapsed)
+
+    def _make_message(self, record: Dict[str, Any]) -> FakeMessage:
+        return FakeMessage(
+            message_id=int(record['message_id']),
+            chat_id=int(record.get('chat_id', 0)),
+            sender_id=int(record.get('sender_id', 0)),
+            text=record.get('text', ''),
+            date=record['date'],
+            chat_title=record.get('chat_title', ''),
+            sender_name=record.get('sender_name', ''),
+            client=self.client
+        )
+
+    def _report(self, corpus: List[Dict[str, Any]], elapsed: float) -> Dict[str, Any]:
+        report = {
+            'messages': len(corpus),
+            'seconds': elapsed,
+            'throughput_msg_per_s': len(corpus) / elapsed if elapsed else 0.0,
+            'forwarded': len(self.forwarded_ids),
+            'stages': self.timer.report(),
+            'api_calls': dict(self.client.calls)
+        }
+        labeled = [record for record in corpus if record.get('label') is not None]
+        if labeled:
+            report['accuracy'] = forward_metrics(labeled, self.forwarded_ids)
+        return report
+
+
+def forward_metrics(labeled: List[Dict[str, Any]], forwarded_ids: set) -> Dict[str, float]:
+    """Precision/recall пересылки относительно разметки; forwarded_ids - пары (chat_id, message_id)"""
+    tp = fp = fn = tn = 0
+    for record in labeled:
+        predicted = (int(record.get('chat_id', 0)), int(record['message_id'])) in forwarded_ids
+        actual = bool(record['label'])
+        if predicted and actual:
+            tp += 1
+        elif predicted:
+            fp += 1
+        elif actual:
+            fn += 1
+        else:
+            tn += 1
+
+    precision = tp / (tp + fp) if tp + fp else 0.0
+    recall = tp / (tp + fn) if tp + fn else 0.0
+    return {
+        'labeled': len(labeled),
+        'tp': tp, 'fp': fp, 'fn': fn, 'tn': tn,
+        'precision': precision,
+        'recall': recall,
+        'f1': 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    }
+
+
+def build_bot(db_path: Optional[str] = None, client: FakeClient = None):
+    """Собирает TelegramBot с поддельным клиентом и отдельной БД"""
+    from database import DatabaseManager
+    from ml_classifier import UniversalMessageClassifier
+    from telegram_bot import TelegramBot
+
+    db_manager = DatabaseManager(db_path or os.path.join(tempfile.mkdtemp(), 'replay.db'))
+    classifier = UniversalMessageClassifier(db_manager=db_manager)
+    return TelegramBot(db_manager=db_manager, classifier=classifier, client=client or FakeClient())
+
+
+def print_report(report: Dict[str, Any]):
+    print(f"📨 Сообщений: {report['messages']} за {report['seconds']:.2f} с "
+          f"({report['throughput_msg_per_s']:.1f} сообщ./с), переслано: {report['forwarded']}")
+    for stage, stats in report['stages'].items():
+        print(f"   • {stage}: p50 {stats['p50_ms']:.2f} мс, p90 {stats['p90_ms']:.2f} мс, "
+              f"p99 {stats['p99_ms']:.2f} мс (n={stats['count']})")
+    if 'accuracy' in report:
+        accuracy = report['accuracy']
+        print(f"🎯 Precision: {accuracy['precision']:.3f}, Recall: {accuracy['recall']:.3f}, "
+              f"F1: {accuracy['f1']:.3f} (размечено: {accuracy['labeled']})")
+    print(f"📡 Вызовы API: {report['api_calls']}")
+
+
+async def main(argv=None):
+    parser = argparse.ArgumentParser(description='Оффлайн-реплей корпуса сообщений')
+    parser.add_argument('corpus', help='JSONL-файл с записанными сообщениями')
+    parser.add_argument('--realtime', action='store_true', help='воспроизводить с записанной скоростью')
+    parser.add_argument('--speed', type=float, default=1.0, help='ускорение для --realtime')
+    parser.add_argument('--db', help='путь к БД (по умолчанию временная)')
+    parser.add_argument('--json', help='сохранить отчет в JSON')
+    args = parser.parse_args(argv)
+
+    corpus = load_corpus(args.corpus)
+    client = FakeClient()
+    harness = ReplayHarness(build_bot(args.db, client), client)
+    report = await harness.run(corpus, realtime=args.realtime, speed=args.speed)
+
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return report
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,115 @@
+"""
+Счетчики статистики бота с инкрементальной записью в базу данных
+"""
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+# Исходы обработки сообщения, которые считаются в роллапах
+OUTCOMES = ('processed', 'forwarded', 'rejected')
+
+
+def utc_date() -> str:
+    """Текущая дата в UTC (совпадает с date('now') в SQLite)"""
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d')
+
+
+def hour_bucket(when: Optional[datetime] = None) -> str:
+    """Часовой бакет в UTC в формате 'YYYY-MM-DD HH:00'"""
+    when = when or datetime.now(timezone.utc)
+    if when.tzinfo is not None:
+        when = when.astimezone(timezone.utc)
+    return when.strftime('%Y-%m-%d %H:00')
+
+
+class DailyStatsCounter:
+    """Копит приращения статистики в памяти и сбрасывает их в БД пачкой
+
+    Кроме дневных счетчиков ведет часовые роллапы по чатам и причинам решения,
+    чтобы /stats читал небольшие предагрегированные таблицы, а не сканировал messages.
+    """
+
+    KEYS = ('processed', 'forwarded', 'rejected', 'training_examples')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._pending_rollups = {}
+        self._today_date = utc_date()
+        self._today = dict.fromkeys(self.KEYS, 0)
+
+    def increment(self, key: str, count: int = 1, date: Optional[str] = None):
+        """Увеличивает счетчик; приращение привязывается к дате события"""
+        if not count:
+            return
+        date = date or utc_date()
+        with self._lock:
+            self._increment_locked(key, count, date)
+
+    def _increment_locked(self, key: str, count: int, date: str):
+        pending = self._pending.setdefault(date, dict.fromkeys(self.KEYS, 0))
+        pending[key] += count
+
+        # Счетчики за сегодня обнуляются при смене суток
+        if date > self._today_date:
+            self._today_date = date
+            self._today = dict.fromkeys(self.KEYS, 0)
+        if date == self._today_date:
+            self._today[key] += count
+
+    def record(self, chat_id: Optional[int], reason: str, outcome: str, when: Optional[datetime] = None):
+        """Учитывает обработанное сообщение: дневные счетчики и часовой роллап по чату и причине"""
+        bucket = hour_bucket(when)
+        with self._lock:
+            date = bucket[:10]
+            self._increment_locked('processed', 1, date)
+            self._increment_locked(outcome, 1, date)
+
+            key = (bucket, chat_id or 0, reason)
+            counts = self._pending_rollups.setdefault(key, dict.fromkeys(OUTCOMES, 0))
+            counts['processed'] += 1
+            counts[outcome] += 1
+
+    def __getitem__(self, key: str) -> int:
+        return self.today[key]
+
+    @property
+    def today(self) -> Dict[str, int]:
+        """Счетчики за текущие сутки (UTC) с момента запуска"""
+        with self._lock:
+            if self._today_date != utc_date():
+                return dict.fromkeys(self.KEYS, 0)
+            return dict(self._today)
+
+    def take_pending(self) -> Tuple[Dict[str, Dict[str, int]], Dict[tuple, Dict[str, int]]]:
+        """Забирает накопленные дневные приращения и роллапы"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            rollups, self._pending_rollups = self._pending_rollups, {}
+            return pending, rollups
+
+    def restore(self, pending: Dict[str, Dict[str, int]], rollups: Dict[tuple, Dict[str, int]] = None):
+        """Возвращает приращения обратно, если запись в БД не удалась"""
+        with self._lock:
+            for date, deltas in pending.items():
+                current = self._pending.setdefault(date, dict.fromkeys(self.KEYS, 0))
+                for key, value in deltas.items():
+                    current[key] += value
+            for key, deltas in (rollups or {}).items():
+                current = self._pending_rollups.setdefault(key, dict.fromkeys(OUTCOMES, 0))
+                for outcome, value in deltas.items():
+                    current[outcome] += value
+
+    def flush(self, db_manager) -> bool:
+        """Записывает накопленные приращения атомарными UPSERT-инкрементами"""
+        pending, rollups = self.take_pending()
+        if not pending and not rollups:
+            return True
+
+        if db_manager.increment_stats(pending, rollups):
+            return True
+
+        logging.warning("⚠️ Не удалось сохранить статистику, повторим при следующем сбросе")
+        self.restore(pending, rollups)
+        return False
@@ -1,4 +1,5 @@
 import os
+import logging
 from typing import List, Dict, Any
 from dataclasses import dataclass
 from dotenv import load_dotenv
@@ -11,6 +12,7 @@ class TelegramConfig:
     api_hash: str
     phone_number: str
     session_file: str = 'session.txt'
+    entity_cache_size: int = 1024
 
 @dataclass
 class MLConfig:
@@ -19,6 +21,28 @@ class MLConfig:
     min_training_examples: int = 3
     auto_train_threshold: int = 2
     classifier_model: str = 'production_classifier'
+    training_store_path: str = ''
+    store_embeddings: bool = True
+    online_learning: bool = False
+    full_refit_interval: int = 100
+    retrain_debounce_seconds: float = 5.0
+    retrain_max_delay_seconds: float = 60.0
+    model_dir: str = ''
+    model_keep_versions: int = 10
+    classifier_mode: str = 'linear'
+    knn_k: int = 7
+    knn_index_threshold: int = 20000
+    similar_index: bool = True
+    similar_ivf_threshold: int = 50000
+    similar_nprobe: int = 16
+    keyword_ivf_threshold: int = 2000
+    keyword_nprobe: int = 8
+    long_text_mode: bool = False
+    chunk_tokens: int = 0
+    chunk_overlap: int = 32
+    max_chunks: int = 8
+    chunk_pooling: str = 'mean'
+    background_load: bool = True
 
 @dataclass
 class FilterConfig:
@@ -35,6 +59,60 @@ class FilterConfig:
                 r'было переслано', r'forwarded from'
             ]
 
+@dataclass
+class DatabaseConfig:
+    path: str = 'bot_database.db'
+    journal_mode: str = 'WAL'
+    synchronous: str = 'NORMAL'
+    cache_size_kb: int = 20000
+    mmap_size_mb: int = 256
+    busy_timeout_ms: int = 5000
+    cached_statements: int = 256
+    write_batch_size: int = 100
+    write_flush_interval_ms: int = 200
+
+@dataclass
+class StatsConfig:
+    flush_interval_seconds: int = 30
+
+@dataclass
+class RetentionConfig:
+    messages_days: int = 30
+    bot_stats_days: int = 365
+    stats_hourly_days: int = 14
+    stats_daily_days: int = 365
+    model_metrics_days: int = 0
+    message_embeddings_days: int = 7
+    batch_size: int = 1000
+    pause_ms: int = 20
+    vacuum_pages: int = 1000
+    interval_hours: float = 6.0
+    
+    def policy(self) -> Dict[str, int]:
+        """Срок хранения по таблицам в днях (0 - бессрочно)"""
+        return {
+            'messages': self.messages_days,
+            'bot_stats': self.bot_stats_days,
+            'stats_hourly': self.stats_hourly_days,
+            'stats_daily': self.stats_daily_days,
+            'model_metrics': self.model_metrics_days,
+            'message_embeddings': self.message_embeddings_days
+        }
+
+@dataclass
+class BackfillConfig:
+    page_size: int = 200
+
+@dataclass
+class CatchupConfig:
+    enabled: bool = True
+    concurrency: int = 4
+    max_messages_per_chat: int = 1000
+
+@dataclass
+class SubscriptionsConfig:
+    path: str = ''
+
 @dataclass
 class BusinessConfig:
     keywords: List[str]
@@ -56,7 +134,8 @@ class Config:
             api_id=os.getenv('TELEGRAM_API_ID', ''),
             api_hash=os.getenv('TELEGRAM_API_HASH', ''),
             phone_number=os.getenv('TELEGRAM_PHONE', ''),
-            session_file=os.getenv('TELEGRAM_SESSION_FILE', 'session.txt')
+            session_file=os.getenv('TELEGRAM_SESSION_FILE', 'session.txt'),
+            entity_cache_size=int(os.getenv('TELEGRAM_ENTITY_CACHE_SIZE', '1024'))
         )
         
         self.ml = MLConfig(
@@ -64,7 +143,29 @@ class Config:
             similarity_threshold=float(os.getenv('ML_SIMILARITY_THRESHOLD', '0.7')),
             min_training_examples=int(os.getenv('ML_MIN_TRAINING_EXAMPLES', '3')),
             auto_train_threshold=int(os.getenv('ML_AUTO_TRAIN_THRESHOLD', '2')),
-            classifier_model=os.getenv('ML_CLASSIFIER_MODEL', 'production_classifier')
+            classifier_model=os.getenv('ML_CLASSIFIER_MODEL', 'production_classifier'),
+            training_store_path=os.getenv('ML_TRAINING_STORE_PATH', ''),
+            store_embeddings=os.getenv('ML_STORE_EMBEDDINGS', 'true').lower() == 'true',
+            online_learning=os.getenv('ML_ONLINE_LEARNING', 'false').lower() == 'true',
+            full_refit_interval=int(os.getenv('ML_FULL_REFIT_INTERVAL', '100')),
+            retrain_debounce_seconds=float(os.getenv('ML_RETRAIN_DEBOUNCE_SECONDS', '5')),
+            retrain_max_delay_seconds=float(os.getenv('ML_RETRAIN_MAX_DELAY_SECONDS', '60')),
+            model_dir=os.getenv('ML_MODEL_DIR', ''),
+            model_keep_versions=int(os.getenv('ML_MODEL_KEEP_VERSIONS', '10')),
+            classifier_mode=os.getenv('ML_CLASSIFIER_MODE', 'linear').lower(),
+            knn_k=int(os.getenv('ML_KNN_K', '7')),
+            knn_index_threshold=int(os.getenv('ML_KNN_INDEX_THRESHOLD', '20000')),
+            similar_index=os.getenv('ML_SIMILAR_INDEX', 'true').lower() == 'true',
+            similar_ivf_threshold=int(os.getenv('ML_SIMILAR_IVF_THRESHOLD', '50000')),
+            similar_nprobe=int(os.getenv('ML_SIMILAR_NPROBE', '16')),
+            keyword_ivf_threshold=int(os.getenv('ML_KEYWORD_IVF_THRESHOLD', '2000')),
+            keyword_nprobe=int(os.getenv('ML_KEYWORD_NPROBE', '8')),
+            long_text_mode=os.getenv('ML_LONG_TEXT_MODE', 'false').lower() == 'true',
+            chunk_tokens=int(os.getenv('ML_CHUNK_TOKENS', '0')),
+            chunk_overlap=int(os.getenv('ML_CHUNK_OVERLAP', '32')),
+            max_chunks=int(os.getenv('ML_MAX_CHUNKS', '8')),
+            chunk_pooling=os.getenv('ML_CHUNK_POOLING', 'mean').lower(),
+            background_load=os.getenv('ML_BACKGROUND_LOAD', 'true').lower() == 'true'
         )
         
         self.filter = FilterConfig(
@@ -74,8 +175,54 @@ class Config:
                 'пересланное сообщение,forwarded message,было переслано'))
         )
         
+        self.database = DatabaseConfig(
+            path=os.getenv('DB_PATH', 'bot_database.db'),
+            journal_mode=os.getenv('DB_JOURNAL_MODE', 'WAL'),
+            synchronous=os.getenv('DB_SYNCHRONOUS', 'NORMAL'),
+            cache_size_kb=int(os.getenv('DB_CACHE_SIZE_KB', '20000')),
+            mmap_size_mb=int(os.getenv('DB_MMAP_SIZE_MB', '256')),
+            busy_timeout_ms=int(os.getenv('DB_BUSY_TIMEOUT_MS', '5000')),
+            cached_statements=int(os.getenv('DB_CACHED_STATEMENTS', '256')),
+            write_batch_size=int(os.getenv('DB_WRITE_BATCH_SIZE', '100')),
+            write_flush_interval_ms=int(os.getenv('DB_WRITE_FLUSH_INTERVAL_MS', '200'))
+        )
+        
+        self.stats = StatsConfig(
+            flush_interval_seconds=int(os.getenv('STATS_FLUSH_INTERVAL', '30'))
+        )
+        
+        self.retention = RetentionConfig(
+            messages_days=int(os.getenv('RETENTION_MESSAGES_DAYS', '30')),
+            bot_stats_days=int(os.getenv('RETENTION_BOT_STATS_DAYS', '365')),
+            stats_hourly_days=int(os.getenv('RETENTION_STATS_HOURLY_DAYS', '14')),
+            stats_daily_days=int(os.getenv('RETENTION_STATS_DAILY_DAYS', '365')),
+            model_metrics_days=int(os.getenv('RETENTION_MODEL_METRICS_DAYS', '0')),
+            message_embeddings_days=int(os.getenv('RETENTION_MESSAGE_EMBEDDINGS_DAYS', '7')),
+            batch_size=int(os.getenv('RETENTION_BATCH_SIZE', '1000')),
+            pause_ms=int(os.getenv('RETENTION_PAUSE_MS', '20')),
+            vacuum_pages=int(os.getenv('RETENTION_VACUUM_PAGES', '1000')),
+            interval_hours=float(os.getenv('RETENTION_INTERVAL_HOURS', '6'))
+        )
+        
+        self.backfill = BackfillConfig(
+            page_size=int(os.getenv('BACKFILL_PAGE_SIZE', '200'))
+        )
+        
+        self.catchup = CatchupConfig(
+            enabled=os.getenv('CATCHUP_ENABLED', 'true').lower() in ('1', 'true', 'yes'),
+            concurrency=int(os.getenv('CATCHUP_CONCURRENCY', '4')),
+            max_messages_per_chat=int(os.getenv('CATCHUP_MAX_MESSAGES', '1000'))
+        )
+        
+        self.subscriptions = SubscriptionsConfig(
+            path=os.getenv('SUBSCRIPTIONS_FILE', '')
+        )
+        
         self.business = BusinessConfig(
-            keywords=self._parse_list(os.getenv('BUSINESS_KEYWORDS', '')),
+            keywords=self._merge_lists(
+                self._parse_list(os.getenv('BUSINESS_KEYWORDS', '')),
+                self._read_lines(os.getenv('BUSINESS_KEYWORDS_FILE', ''))
+            ),
             target_user_ids=self._parse_list(os.getenv('TARGET_USER_IDS', '')),
             business_domain=os.getenv('BUSINESS_DOMAIN', 'general'),
             full_cycle_phrases=self._parse_list(os.getenv('FULL_CYCLE_PHRASES', 
@@ -87,6 +234,23 @@ class Config:
             return []
         return [item.strip() for item in value.split(',') if item.strip()]
     
+    def _read_lines(self, path: str) -> List[str]:
+        """Словарь фраз из файла: одна фраза на строку, # - комментарий"""
+        if not path:
+            return []
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                lines = [line.strip() for line in f]
+            return [line for line in lines if line and not line.startswith('#')]
+        except OSError as e:
+            logging.error(f"❌ Не удалось прочитать словарь фраз {path}: {e}")
+            return []
+    
+    @staticmethod
+    def _merge_lists(*lists: List[str]) -> List[str]:
+        """Объединяет списки без повторов, сохраняя порядок"""
+        return list(dict.fromkeys(item for items in lists for item in items))
+    
     def validate(self) -> bool:
         errors = []
         
@@ -3,138 +3,416 @@
 """
 import sqlite3
 import json
+import re
 import logging
-from datetime import datetime
-from typing import List, Dict, Any, Optional
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import List, Dict, Any, Optional, Tuple
 from contextlib import contextmanager
+from urllib.request import pathname2url
 import numpy as np
+from config import config
+from migrations import apply_migrations
 
 class DatabaseManager:
     """Менеджер базы данных для хранения данных бота"""
     
-    def __init__(self, db_path: str = 'bot_database.db'):
-        self.db_path = db_path
+    def __init__(self, db_path: str = None):
+        self.db_path = db_path or config.database.path
+        # Одно долгоживущее подключение на менеджер; доступ сериализуется блокировкой,
+        # поэтому менеджер можно использовать из рабочих потоков
+        self._conn = None
+        self._lock = threading.RLock()
+        # Отдельное подключение только для чтения: в WAL оно не ждет пачек фоновой записи
+        self._read_conn = None
+        self._read_lock = threading.Lock()
         self.init_database()
     
     def init_database(self):
-        """Инициализация базы данных и создание таблиц"""
+        """Инициализация базы данных: применяет недостающие миграции схемы"""
         with self.get_connection() as conn:
-            cursor = conn.cursor()
-            
-            # Таблица для сообщений
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS messages (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    message_id INTEGER UNIQUE NOT NULL,
-                    text TEXT NOT NULL,
-                    sender_info TEXT,
-                    chat_title TEXT,
-                    message_date TEXT,
-                    similarity_score REAL,
-                    is_full_cycle BOOLEAN,
-                    ml_probability REAL,
-                    forwarded BOOLEAN,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # Таблица для обучения классификатора
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS training_data (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    text TEXT NOT NULL,
-                    embedding BLOB NOT NULL,
-                    label INTEGER NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # Таблица для метрик модели
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS model_metrics (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    model_name TEXT NOT NULL,
-                    accuracy REAL,
-                    precision_score REAL,
-                    recall_score REAL,
-                    f1_score REAL,
-                    training_examples INTEGER,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # Таблица для статистики бота
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS bot_stats (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    date TEXT NOT NULL,
-                    messages_processed INTEGER DEFAULT 0,
-                    messages_forwarded INTEGER DEFAULT 0,
-                    messages_rejected INTEGER DEFAULT 0,
-                    training_examples_added INTEGER DEFAULT 0,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            conn.commit()
-            logging.info("✅ База данных инициализирована")
+            version = apply_migrations(conn)
+            self.fulltext_enabled = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'messages_fts'"
+            ).fetchone() is not None
+            logging.info(f"✅ База данных инициализирована (схема v{version})")
+    
+    def _open_connection(self, read_only: bool = False) -> sqlite3.Connection:
+        """Открывает подключение и применяет настройки производительности"""
+        db_config = config.database
+        if read_only:
+            database = f"file:{pathname2url(os.path.abspath(self.db_path))}?mode=ro"
+        else:
+            database = self.db_path
+        conn = sqlite3.connect(
+            database,
+            uri=read_only,
+            check_same_thread=False,
+            cached_statements=db_config.cached_statements
+        )
+        conn.row_factory = sqlite3.Row
+        
+        if read_only:
+            conn.execute('PRAGMA query_only=ON')
+        else:
+            # WAL: читатели не блокируют писателя, а synchronous=NORMAL убирает fsync на каждый commit
+            conn.execute(f'PRAGMA journal_mode={db_config.journal_mode}')
+            conn.execute(f'PRAGMA synchronous={db_config.synchronous}')
+        conn.execute(f'PRAGMA cache_size=-{int(db_config.cache_size_kb)}')
+        conn.execute(f'PRAGMA mmap_size={int(db_config.mmap_size_mb) * 1024 * 1024}')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        conn.execute(f'PRAGMA busy_timeout={int(db_config.busy_timeout_ms)}')
+        return conn
     
     @contextmanager
     def get_connection(self):
-        """Контекстный менеджер для работы с подключением к БД"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        try:
-            yield conn
-        finally:
-            conn.close()
+        """Контекстный менеджер для работы с общим подключением к БД"""
+        with self._lock:
+            if self._conn is None:
+                self._conn = self._open_connection()
+            conn = self._conn
+            try:
+                yield conn
+            finally:
+                # Незакоммиченные изменения отбрасываются, как раньше при закрытии подключения
+                if conn.in_transaction:
+                    conn.rollback()
+    
+    @contextmanager
+    def read_connection(self):
+        """Контекстный менеджер для запросов только на чтение (команды, ссылки разметки)
+        
+        Общее подключение занято, пока фоновый писатель коммитит пачку; отдельное
+        подключение в режиме WAL читает последний закоммиченный снимок без ожидания.
+        """
+        if self.db_path == ':memory:':
+            # Второе подключение к базе в памяти увидело бы другую, пустую базу
+            with self.get_connection() as conn:
+                yield conn
+            return
+        with self._read_lock:
+            if self._read_conn is None:
+                self._read_conn = self._open_connection(read_only=True)
+            yield self._read_conn
+    
+    def close(self):
+        """Закрывает подключения к БД"""
+        with self._read_lock:
+            if self._read_conn is not None:
+                self._read_conn.close()
+                self._read_conn = None
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+    
+    INSERT_MESSAGE_SQL = '''
+        INSERT INTO messages 
+        (message_id, chat_id, sender_id, text, sender_info, chat_title, message_date, 
+         similarity_score, is_full_cycle, ml_probability, forwarded)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(chat_id, message_id) DO UPDATE SET
+            sender_id = excluded.sender_id,
+            text = excluded.text,
+            sender_info = excluded.sender_info,
+            chat_title = excluded.chat_title,
+            message_date = excluded.message_date,
+            similarity_score = excluded.similarity_score,
+            is_full_cycle = excluded.is_full_cycle,
+            ml_probability = excluded.ml_probability,
+            -- Повторная классификация (бэкфилл, догрузка) не снимает отметку о пересылке
+            forwarded = MAX(messages.forwarded, excluded.forwarded)
+    '''
+    
+    INSERT_EMBEDDING_SQL = '''
+        INSERT INTO message_embeddings (chat_id, message_id, embedding)
+        VALUES (?, ?, ?)
+        ON CONFLICT(chat_id, message_id) DO UPDATE SET
+            embedding = excluded.embedding,
+            created_at = CURRENT_TIMESTAMP
+    '''
+    
+    @staticmethod
+    def _embedding_rows(messages: List[Dict[str, Any]]) -> List[tuple]:
+        """Строки message_embeddings для сообщений, у которых есть эмбеддинг (float16)"""
+        return [
+            (m.get('chat_id') or 0, m['message_id'], np.asarray(m['embedding'], dtype=np.float16).tobytes())
+            for m in messages if m.get('embedding') is not None
+        ]
+    
+    @staticmethod
+    def _message_row(message_data: Dict[str, Any]) -> tuple:
+        """Преобразует словарь сообщения в строку для INSERT"""
+        return (
+            message_data['message_id'],
+            message_data.get('chat_id') or 0,
+            message_data.get('sender_id'),
+            message_data['text'],
+            message_data.get('sender_info', ''),
+            message_data.get('chat_title', ''),
+            message_data.get('message_date', ''),
+            message_data.get('similarity_score', 0.0),
+            message_data.get('is_full_cycle', False),
+            message_data.get('ml_probability', 0.0),
+            message_data.get('forwarded', False)
+        )
     
     def save_message(self, message_data: Dict[str, Any]) -> bool:
         """Сохраняет сообщение в базу данных"""
         try:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
-                cursor.execute('''
-                    INSERT OR REPLACE INTO messages 
-                    (message_id, text, sender_info, chat_title, message_date, 
-                     similarity_score, is_full_cycle, ml_probability, forwarded)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    message_data['message_id'],
-                    message_data['text'],
-                    message_data.get('sender_info', ''),
-                    message_data.get('chat_title', ''),
-                    message_data.get('message_date', ''),
-                    message_data.get('similarity_score', 0.0),
-                    message_data.get('is_full_cycle', False),
-                    message_data.get('ml_probability', 0.0),
-                    message_data.get('forwarded', False)
-                ))
+                cursor.execute(self.INSERT_MESSAGE_SQL, self._message_row(message_data))
+                cursor.executemany(self.INSERT_EMBEDDING_SQL, self._embedding_rows([message_data]))
                 conn.commit()
                 return True
         except Exception as e:
             logging.error(f"❌ Ошибка сохранения сообщения: {e}")
             return False
     
-    def get_message(self, message_id: int) -> Optional[Dict[str, Any]]:
-        """Получает сообщение по ID"""
+    def save_messages_batch(self, messages: List[Dict[str, Any]],
+                            checkpoint: Optional[Tuple[int, int]] = None,
+                            processed: Optional[Dict[int, int]] = None) -> bool:
+        """Сохраняет пачку сообщений одной транзакцией
+        
+        checkpoint - чекпоинт бэкфилла (chat_id, message_id); processed - последние
+        обработанные ID по чатам, с которых догрузка продолжит работу после перезапуска.
+        """
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                if messages:
+                    cursor.executemany(self.INSERT_MESSAGE_SQL, [self._message_row(m) for m in messages])
+                    cursor.executemany(self.INSERT_EMBEDDING_SQL, self._embedding_rows(messages))
+                if checkpoint is not None:
+                    cursor.execute('''
+                        INSERT OR REPLACE INTO backfill_checkpoints (chat_id, last_message_id, updated_at)
+                        VALUES (?, ?, CURRENT_TIMESTAMP)
+                    ''', checkpoint)
+                if processed:
+                    cursor.executemany('''
+                        INSERT INTO processed_checkpoints (chat_id, last_message_id, updated_at)
+                        VALUES (?, ?, CURRENT_TIMESTAMP)
+                        ON CONFLICT(chat_id) DO UPDATE SET
+                            last_message_id = MAX(last_message_id, excluded.last_message_id),
+                            updated_at = CURRENT_TIMESTAMP
+                    ''', list(processed.items()))
+                conn.commit()
+                return True
+        except Exception as e:
+            logging.error(f"❌ Ошибка пакетного сохранения сообщений: {e}")
+            return False
+    
+    def get_message_embedding(self, message_id: int, chat_id: int = 0) -> Optional[np.ndarray]:
+        """Сохраненный эмбеддинг сообщения (float32) или None, если его нет или срок хранения истек"""
+        try:
+            with self.read_connection() as conn:
+                row = conn.execute(
+                    'SELECT embedding FROM message_embeddings WHERE chat_id = ? AND message_id = ?',
+                    (chat_id or 0, message_id)
+                ).fetchone()
+                if row is None:
+                    return None
+                return np.frombuffer(row['embedding'], dtype=np.float16).astype(np.float32)
+        except Exception as e:
+            logging.error(f"❌ Ошибка получения эмбеддинга сообщения: {e}")
+            return None
+    
+    def count_message_embeddings(self) -> int:
+        """Число сохраненных эмбеддингов сообщений"""
+        with self.get_connection() as conn:
+            return conn.execute('SELECT COUNT(*) FROM message_embeddings').fetchone()[0]
+    
+    def get_message_embedding_rows(self, after: Tuple[int, int] = (-2 ** 63, -2 ** 63),
+                                   limit: int = 5000) -> List[Tuple[int, int, bytes]]:
+        """Строки (chat_id, message_id, embedding) после ключа after в порядке первичного ключа"""
+        with self.get_connection() as conn:
+            rows = conn.execute('''
+                SELECT chat_id, message_id, embedding FROM message_embeddings
+                WHERE (chat_id, message_id) > (?, ?)
+                ORDER BY chat_id, message_id
+                LIMIT ?
+            ''', (after[0], after[1], limit)).fetchall()
+            return [(row[0], row[1], row[2]) for row in rows]
+    
+    def sample_message_embeddings(self, limit: int) -> List[bytes]:
+        """Случайная выборка эмбеддингов сообщений (для обучения центроидов индекса)"""
+        with self.get_connection() as conn:
+            rows = conn.execute(
+                'SELECT embedding FROM message_embeddings ORDER BY random() LIMIT ?', (limit,)
+            ).fetchall()
+            return [row[0] for row in rows]
+    
+    def get_backfill_checkpoint(self, chat_id: int) -> int:
+        """Возвращает ID последнего обработанного бэкфиллом сообщения в чате"""
         try:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
-                cursor.execute('SELECT * FROM messages WHERE message_id = ?', (message_id,))
+                cursor.execute(
+                    'SELECT last_message_id FROM backfill_checkpoints WHERE chat_id = ?', (chat_id,)
+                )
                 row = cursor.fetchone()
-                return dict(row) if row else None
+                return row['last_message_id'] if row else 0
+        except Exception as e:
+            logging.error(f"❌ Ошибка получения чекпоинта бэкфилла: {e}")
+            return 0
+    
+    def get_message(self, message_id: int, chat_id: int) -> Optional[Dict[str, Any]]:
+        """Получает сообщение по паре (chat_id, message_id) вместе с именами отправителя и чата
+        
+        ID сообщений Telegram уникальны только внутри чата, поэтому чат обязателен.
+        """
+        return self._fetch_message('m.chat_id = ? AND m.message_id = ?', (chat_id or 0, message_id))
+    
+    def get_message_by_id(self, row_id: int) -> Optional[Dict[str, Any]]:
+        """Получает сообщение по ID строки messages.id (его печатают команды /correct_ и др.)"""
+        return self._fetch_message('m.id = ?', (row_id,))
+    
+    def get_message_row_id(self, message_id: int, chat_id: int) -> Optional[int]:
+        """ID строки messages.id для сообщения; None, если оно еще не сохранено"""
+        try:
+            with self.read_connection() as conn:
+                row = conn.execute(
+                    'SELECT id FROM messages WHERE chat_id = ? AND message_id = ?', (chat_id or 0, message_id)
+                ).fetchone()
+                return row[0] if row else None
+        except Exception as e:
+            logging.error(f"❌ Ошибка получения сообщения: {e}")
+            return None
+    
+    def _fetch_message(self, condition: str, params: tuple) -> Optional[Dict[str, Any]]:
+        """Одно сообщение с именами отправителя и чата по условию на messages m"""
+        try:
+            with self.read_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(f'''
+                    SELECT m.*, s.display_name AS sender_name, c.display_name AS chat_name
+                    FROM messages m
+                    LEFT JOIN entity_names s ON s.kind = 'sender' AND s.entity_id = m.sender_id
+                    LEFT JOIN entity_names c ON c.kind = 'chat' AND c.entity_id = m.chat_id
+                    WHERE {condition}
+                ''', params)
+                row = cursor.fetchone()
+                if not row:
+                    return None
+                
+                data = dict(row)
+                sender_name = data.pop('sender_name')
+                chat_name = data.pop('chat_name')
+                # Имена хранятся отдельно и подставляются только по запросу
+                if not data.get('sender_info') and sender_name:
+                    data['sender_info'] = sender_name
+                if not data.get('chat_title') and chat_name:
+                    data['chat_title'] = chat_name
+                return data
         except Exception as e:
             logging.error(f"❌ Ошибка получения сообщения: {e}")
             return None
     
+    # Сколько последних совпадений ранжируется по BM25
+    SEARCH_RANK_WINDOW = 2000
+    
+    def search_messages(self, query: str, limit: int = 10, chat_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Полнотекстовый поиск по истории: лучшие совпадения (BM25) со сниппетами
+        
+        Каждое слово запроса ищется как префикс, что частично заменяет морфологию.
+        Для частых слов BM25 считается только по SEARCH_RANK_WINDOW самым свежим совпадениям,
+        иначе ранжирование всех совпадений занимало бы сотни миллисекунд.
+        """
+        terms = re.findall(r'\w+', query.lower().replace('ё', 'е'))
+        if not terms:
+            return []
+        
+        chat_filter = 'AND m.chat_id = ?' if chat_id is not None else ''
+        try:
+            with self.read_connection() as conn:
+                if self.fulltext_enabled:
+                    match = ' '.join(f'"{term}"*' for term in terms)
+                    # Поиск по rowid в обратном порядке дешев и не требует ранжирования;
+                    # фильтр по чату применяется до отсечения окна, иначе окно заняли бы другие чаты
+                    window_join = 'JOIN messages m ON m.id = messages_fts.rowid' if chat_id is not None else ''
+                    window_params = (match, chat_id) if chat_id is not None else (match,)
+                    window = conn.execute(f'''
+                        SELECT messages_fts.rowid FROM messages_fts {window_join}
+                        WHERE messages_fts MATCH ? {chat_filter}
+                        ORDER BY messages_fts.rowid DESC LIMIT 1 OFFSET ?
+                    ''', window_params + (self.SEARCH_RANK_WINDOW - 1,)).fetchone()
+                    min_rowid = window[0] if window else 0
+                    params = (match, min_rowid, chat_id, limit) if chat_id is not None else (match, min_rowid, limit)
+                    rows = conn.execute(f'''
+                        SELECT m.id, m.message_id, m.chat_id, m.message_date, m.forwarded,
+                               COALESCE(NULLIF(m.chat_title, ''), c.display_name, '') AS chat_title,
+                               snippet(messages_fts, 0, '«', '»', '…', 12) AS snippet
+                        FROM messages_fts
+                        JOIN messages m ON m.id = messages_fts.rowid
+                        LEFT JOIN entity_names c ON c.kind = 'chat' AND c.entity_id = m.chat_id
+                        WHERE messages_fts MATCH ? AND messages_fts.rowid >= ? {chat_filter}
+                        ORDER BY messages_fts.rank
+                        LIMIT ?
+                    ''', params).fetchall()
+                else:
+                    # Без FTS5 - медленный запасной вариант через LIKE
+                    like = '%' + '%'.join(terms) + '%'
+                    params = (like, chat_id, limit) if chat_id is not None else (like, limit)
+                    rows = conn.execute(f'''
+                        SELECT m.id, m.message_id, m.chat_id, m.message_date, m.forwarded,
+                               COALESCE(NULLIF(m.chat_title, ''), c.display_name, '') AS chat_title,
+                               substr(m.text, 1, 120) AS snippet
+                        FROM messages m
+                        LEFT JOIN entity_names c ON c.kind = 'chat' AND c.entity_id = m.chat_id
+                        WHERE m.text LIKE ? {chat_filter}
+                        ORDER BY m.id DESC
+                        LIMIT ?
+                    ''', params).fetchall()
+                return [dict(row) for row in rows]
+        except Exception as e:
+            logging.error(f"❌ Ошибка полнотекстового поиска: {e}")
+            return []
+    
+    def get_last_message_ids(self) -> Dict[int, int]:
+        """Возвращает ID последнего увиденного сообщения по каждому чату"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT chat_id, MAX(last_id) AS last_id FROM (
+                        SELECT chat_id, MAX(message_id) AS last_id FROM messages
+                        WHERE chat_id != 0 GROUP BY chat_id
+                        UNION ALL
+                        SELECT chat_id, last_message_id AS last_id FROM backfill_checkpoints
+                        UNION ALL
+                        SELECT chat_id, last_message_id AS last_id FROM processed_checkpoints
+                    ) GROUP BY chat_id
+                ''')
+                return {row['chat_id']: row['last_id'] for row in cursor.fetchall()}
+        except Exception as e:
+            logging.error(f"❌ Ошибка получения последних ID сообщений: {e}")
+            return {}
+    
+    def save_entity_name(self, kind: str, entity_id: int, display_name: str) -> bool:
+        """Сохраняет отображаемое имя отправителя (kind='sender') или чата (kind='chat')"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    INSERT OR REPLACE INTO entity_names (kind, entity_id, display_name, updated_at)
+                    VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+                ''', (kind, entity_id, display_name))
+                conn.commit()
+                return True
+        except Exception as e:
+            logging.error(f"❌ Ошибка сохранения имени сущности: {e}")
+            return False
+    
     def save_training_example(self, text: str, embedding: np.ndarray, label: int) -> bool:
         """Сохраняет пример для обучения"""
         try:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
                 # Конвертируем numpy array в bytes
-                embedding_bytes = embedding.tobytes()
+                embedding_bytes = np.asarray(embedding, dtype=np.float32).tobytes()
                 cursor.execute('''
                     INSERT INTO training_data (text, embedding, label)
                     VALUES (?, ?, ?)
@@ -163,6 +441,24 @@ class DatabaseManager:
             logging.error(f"❌ Ошибка получения данных обучения: {e}")
             return []
     
+    def get_training_state(self, up_to_id: int = 0) -> Tuple[int, int]:
+        """Максимальный id в training_data и число строк с id <= up_to_id"""
+        with self.get_connection() as conn:
+            row = conn.execute(
+                'SELECT COALESCE(MAX(id), 0), COALESCE(SUM(id <= ?), 0) FROM training_data',
+                (up_to_id,)
+            ).fetchone()
+            return row[0], row[1]
+    
+    def get_training_rows(self, after_id: int = 0, limit: int = 5000) -> List[Tuple[int, bytes, int]]:
+        """Строки (id, embedding, label) с id > after_id по возрастанию id"""
+        with self.get_connection() as conn:
+            rows = conn.execute(
+                'SELECT id, embedding, label FROM training_data WHERE id > ? ORDER BY id LIMIT ?',
+                (after_id, limit)
+            ).fetchall()
+            return [(row[0], row[1], row[2]) for row in rows]
+    
     def save_model_metrics(self, model_name: str, metrics: Dict[str, Any]) -> bool:
         """Сохраняет метрики модели"""
         try:
@@ -203,32 +499,109 @@ class DatabaseManager:
             logging.error(f"❌ Ошибка получения метрик: {e}")
             return None
     
-    def update_daily_stats(self, date: str, stats: Dict[str, int]) -> bool:
-        """Обновляет дневную статистику"""
+    def increment_daily_stats(self, deltas_by_date: Dict[str, Dict[str, int]]) -> bool:
+        """Атомарно прибавляет приращения к дневной статистике (по датам)"""
+        return self.increment_stats(deltas_by_date, {})
+    
+    def increment_stats(self, deltas_by_date: Dict[str, Dict[str, int]],
+                        rollups: Dict[tuple, Dict[str, int]]) -> bool:
+        """Одной транзакцией прибавляет дневную статистику и часовые/дневные роллапы
+        
+        Ключ роллапа - (часовой бакет 'YYYY-MM-DD HH:00', chat_id, причина решения).
+        """
         try:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
-                cursor.execute('''
-                    INSERT OR REPLACE INTO bot_stats 
+                cursor.executemany('''
+                    INSERT INTO bot_stats 
                     (date, messages_processed, messages_forwarded, messages_rejected, training_examples_added)
                     VALUES (?, ?, ?, ?, ?)
-                ''', (
-                    date,
-                    stats.get('processed', 0),
-                    stats.get('forwarded', 0),
-                    stats.get('rejected', 0),
-                    stats.get('training_examples', 0)
-                ))
+                    ON CONFLICT(date) DO UPDATE SET
+                        messages_processed = messages_processed + excluded.messages_processed,
+                        messages_forwarded = messages_forwarded + excluded.messages_forwarded,
+                        messages_rejected = messages_rejected + excluded.messages_rejected,
+                        training_examples_added = training_examples_added + excluded.training_examples_added
+                ''', [
+                    (
+                        date,
+                        deltas.get('processed', 0),
+                        deltas.get('forwarded', 0),
+                        deltas.get('rejected', 0),
+                        deltas.get('training_examples', 0)
+                    )
+                    for date, deltas in deltas_by_date.items()
+                ])
+                
+                for table, bucket_length in (('stats_hourly', 16), ('stats_daily', 10)):
+                    cursor.executemany(f'''
+                        INSERT INTO {table} (bucket, chat_id, reason, processed, forwarded, rejected)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                        ON CONFLICT(bucket, chat_id, reason) DO UPDATE SET
+                            processed = processed + excluded.processed,
+                            forwarded = forwarded + excluded.forwarded,
+                            rejected = rejected + excluded.rejected
+                    ''', [
+                        (
+                            bucket[:bucket_length],
+                            chat_id,
+                            reason,
+                            counts.get('processed', 0),
+                            counts.get('forwarded', 0),
+                            counts.get('rejected', 0)
+                        )
+                        for (bucket, chat_id, reason), counts in rollups.items()
+                    ])
+                
                 conn.commit()
                 return True
         except Exception as e:
-            logging.error(f"❌ Ошибка обновления статистики: {e}")
+            logging.error(f"❌ Ошибка инкремента статистики: {e}")
             return False
     
+    def get_rollup_summary(self, since: str, until: Optional[str] = None, granularity: str = 'hour',
+                           chat_id: Optional[int] = None) -> Dict[str, Any]:
+        """Сводка по роллапам за диапазон бакетов с разбивкой по причинам решения
+        
+        since/until - границы бакетов ('YYYY-MM-DD HH:00' для часов, 'YYYY-MM-DD' для дней),
+        until не включается.
+        """
+        table = 'stats_hourly' if granularity == 'hour' else 'stats_daily'
+        conditions = ['bucket >= ?']
+        params = [since]
+        if until:
+            conditions.append('bucket < ?')
+            params.append(until)
+        if chat_id is not None:
+            conditions.append('chat_id = ?')
+            params.append(chat_id)
+        
+        try:
+            with self.read_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(f'''
+                    SELECT reason, SUM(processed) AS processed, SUM(forwarded) AS forwarded,
+                           SUM(rejected) AS rejected
+                    FROM {table}
+                    WHERE {' AND '.join(conditions)}
+                    GROUP BY reason
+                    ORDER BY processed DESC
+                ''', params)
+                by_reason = {row['reason']: dict(row) for row in cursor.fetchall()}
+                
+                totals = {
+                    key: sum(item[key] or 0 for item in by_reason.values())
+                    for key in ('processed', 'forwarded', 'rejected')
+                }
+                totals['by_reason'] = by_reason
+                return totals
+        except Exception as e:
+            logging.error(f"❌ Ошибка получения роллапов статистики: {e}")
+            return {}
+    
     def get_stats_summary(self, days: int = 7) -> Dict[str, Any]:
         """Получает сводную статистику за последние дни"""
         try:
-            with self.get_connection() as conn:
+            with self.read_connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     SELECT 
@@ -256,26 +629,82 @@ class DatabaseManager:
             logging.error(f"❌ Ошибка получения статистики: {e}")
             return {}
     
-    def clear_old_data(self, days: int = 30) -> bool:
-        """Очищает старые данные"""
-        try:
+    # Таблицы с ограниченным сроком хранения: колонка времени, ее формат и ключ строки
+    RETENTION_TABLES = {
+        'messages': ('created_at', '%Y-%m-%d %H:%M:%S', 'id'),
+        'bot_stats': ('date', '%Y-%m-%d', 'id'),
+        'stats_hourly': ('bucket', '%Y-%m-%d %H:00', 'bucket, chat_id, reason'),
+        'stats_daily': ('bucket', '%Y-%m-%d', 'bucket, chat_id, reason'),
+        'model_metrics': ('created_at', '%Y-%m-%d %H:%M:%S', 'id'),
+        'message_embeddings': ('created_at', '%Y-%m-%d %H:%M:%S', 'chat_id, message_id'),
+    }
+    
+    def delete_expired(self, table: str, days: int, batch_size: int = None, pause_ms: int = None) -> int:
+        """Удаляет строки старше days небольшими порциями с паузами между ними
+        
+        Каждая порция - отдельная короткая транзакция, поэтому запись новых сообщений
+        не останавливается на все время очистки.
+        """
+        column, time_format, key = self.RETENTION_TABLES[table]
+        batch_size = batch_size or config.retention.batch_size
+        pause = (config.retention.pause_ms if pause_ms is None else pause_ms) / 1000.0
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=days)).strftime(time_format)
+        
+        deleted = 0
+        while True:
             with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    DELETE FROM messages 
-                    WHERE created_at < datetime('now', '-{} days')
-                '''.format(days))
-                deleted_messages = cursor.rowcount
-                
-                cursor.execute('''
-                    DELETE FROM bot_stats 
-                    WHERE date < date('now', '-{} days')
-                '''.format(days))
-                deleted_stats = cursor.rowcount
-                
+                cursor = conn.execute(f'''
+                    DELETE FROM {table}
+                    WHERE ({key}) IN (
+                        SELECT {key} FROM {table} WHERE {column} < ? LIMIT ?
+                    )
+                ''', (cutoff, batch_size))
+                batch_deleted = cursor.rowcount
                 conn.commit()
-                logging.info(f"✅ Очищено {deleted_messages} сообщений и {deleted_stats} записей статистики")
-                return True
+            
+            deleted += batch_deleted
+            if batch_deleted < batch_size:
+                return deleted
+            # Отдаем блокировку и диск другим писателям
+            time.sleep(pause)
+    
+    def apply_retention(self, policy: Dict[str, int] = None) -> Dict[str, int]:
+        """Применяет политику хранения {таблица: дней}; 0 или меньше - хранить бессрочно"""
+        policy = policy if policy is not None else config.retention.policy()
+        deleted = {}
+        for table, days in policy.items():
+            if not days or days <= 0 or table not in self.RETENTION_TABLES:
+                continue
+            try:
+                deleted[table] = self.delete_expired(table, days)
+            except Exception as e:
+                logging.error(f"❌ Ошибка очистки таблицы {table}: {e}")
+        
+        if any(deleted.values()):
+            logging.info(f"🧹 Очистка по сроку хранения: {deleted}")
+        return deleted
+    
+    def incremental_vacuum(self, pages: int = None) -> int:
+        """Возвращает файловой системе до pages свободных страниц, возвращает их число"""
+        pages = config.retention.vacuum_pages if pages is None else pages
+        try:
+            with self.get_connection() as conn:
+                freelist = conn.execute('PRAGMA freelist_count').fetchone()[0]
+                if not freelist:
+                    return 0
+                conn.execute(f'PRAGMA incremental_vacuum({int(pages)})').fetchall()
+                return freelist - conn.execute('PRAGMA freelist_count').fetchone()[0]
+        except Exception as e:
+            logging.error(f"❌ Ошибка инкрементального VACUUM: {e}")
+            return 0
+    
+    def clear_old_data(self, days: int = 30) -> bool:
+        """Очищает старые сообщения и статистику порциями"""
+        try:
+            deleted_messages = self.delete_expired('messages', days)
+            deleted_stats = self.delete_expired('bot_stats', days)
+            logging.info(f"✅ Очищено {deleted_messages} сообщений и {deleted_stats} записей статистики")
+            return True
         except Exception as e:
             logging.error(f"❌ Ошибка очистки данных: {e}")
             return False
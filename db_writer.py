@@ -0,0 +1,154 @@
+"""
+Фоновая пакетная запись сообщений в базу данных
+"""
+import asyncio
+import logging
+import queue
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional
+from config import config
+from database import DatabaseManager
+
+# Маркер остановки потока записи
+_STOP = object()
+# Отметка "сообщение обработано" для чекпоинта догрузки (пишется вместе с пачкой)
+_Processed = namedtuple('_Processed', ['chat_id', 'message_id'])
+
+
+class BatchedMessageWriter:
+    """Очередь write-behind: один поток группирует записи в транзакции executemany"""
+
+    def __init__(self, db_manager: DatabaseManager, batch_size: int = None, flush_interval_ms: int = None,
+                 on_commit: Callable[[List[Dict[str, Any]]], None] = None):
+        self.db_manager = db_manager
+        # Вызывается в потоке записи с записями каждой успешно закоммиченной пачки
+        self.on_commit = on_commit
+        self.batch_size = max(1, batch_size or config.database.write_batch_size)
+        self.flush_interval = (flush_interval_ms or config.database.write_flush_interval_ms) / 1000.0
+        self._queue = queue.Queue()
+        self._thread = None
+        self.batches_written = 0
+        self.records_written = 0
+
+    def start(self):
+        """Запускает поток записи"""
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+            self._thread.start()
+
+    def submit(self, message_data: Dict[str, Any]) -> Future:
+        """Ставит сообщение в очередь; Future завершается после коммита пачки"""
+        self.start()
+        future = Future()
+        self._queue.put((message_data, future))
+        return future
+
+    def submit_many(self, messages: List[Dict[str, Any]]) -> List[Future]:
+        """Ставит в очередь несколько сообщений"""
+        return [self.submit(message_data) for message_data in messages]
+
+    def mark_processed(self, chat_id: Optional[int], message_id: int):
+        """Сдвигает чекпоинт обработки чата (в том числе для отклоненных сообщений)"""
+        if not chat_id:
+            return
+        self.start()
+        self._queue.put((_Processed(chat_id, message_id), None))
+
+    async def wait(self, futures: List[Future]) -> bool:
+        """Ожидает коммита переданных записей (нужно только когда важна надежность)"""
+        if not futures:
+            return True
+        if not all(future.done() for future in futures):
+            # Не ждем таймаута пачки: ожидающий вызывающий код просит записать сразу
+            self.flush_nowait()
+        results = await asyncio.gather(*[asyncio.wrap_future(future) for future in futures])
+        return all(results)
+
+    def flush_nowait(self) -> Future:
+        """Возвращает Future, который завершится после записи всего, что уже в очереди"""
+        self.start()
+        future = Future()
+        self._queue.put((None, future))
+        return future
+
+    async def flush(self) -> bool:
+        """Дожидается записи всего, что уже поставлено в очередь"""
+        return await asyncio.wrap_future(self.flush_nowait())
+
+    async def close(self):
+        """Сбрасывает очередь и останавливает поток"""
+        if self._thread is None:
+            return
+        await self.flush()
+        self._queue.put(_STOP)
+        await asyncio.get_running_loop().run_in_executor(None, self._thread.join)
+        self._thread = None
+        logging.info(f"💾 Фоновая запись остановлена: {self.records_written} записей, {self.batches_written} пачек")
+
+    def _run(self):
+        """Цикл потока: собирает пачку по размеру или по таймауту и пишет одной транзакцией"""
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            stop = False
+            # Явный flush в начале пачки тоже не ждет таймаута
+            while item[0] is not None and len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    next_item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if next_item is _STOP:
+                    stop = True
+                    break
+                batch.append(next_item)
+                # Явный flush не ждет таймаута
+                if next_item[0] is None:
+                    break
+
+            self._write(batch)
+            if stop:
+                return
+
+    def _write(self, batch: List[tuple]):
+        records = [item for item, _ in batch if isinstance(item, dict)]
+        processed = {}
+        for item, _ in batch:
+            if isinstance(item, _Processed):
+                processed[item.chat_id] = max(processed.get(item.chat_id, 0), item.message_id)
+        success = True
+        if records or processed:
+            try:
+                success = self.db_manager.save_messages_batch(records, processed=processed)
+            except Exception as e:
+                logging.error(f"❌ Ошибка фоновой записи сообщений: {e}")
+                success = False
+            if success and records:
+                self.batches_written += 1
+                self.records_written += len(records)
+                if self.on_commit is not None:
+                    try:
+                        self.on_commit(records)
+                    except Exception as e:
+                        logging.error(f"❌ Ошибка обработчика записанной пачки: {e}")
+
+        for _, future in batch:
+            if future is not None and not future.done():
+                future.set_result(success)
+
+    def get_stats(self) -> Dict[str, Optional[int]]:
+        """Статистика очереди записи"""
+        return {
+            'pending': self._queue.qsize(),
+            'batches_written': self.batches_written,
+            'records_written': self.records_written
+        }
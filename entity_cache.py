@@ -0,0 +1,52 @@
+"""
+Ограниченный LRU-кэш отображаемых имен отправителей и чатов
+"""
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+
+class EntityInfoCache:
+    """LRU-кэш имен сущностей Telegram по ключам ('sender', sender_id) / ('chat', chat_id)"""
+
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max(1, max_size)
+        self._items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, entity_id: Optional[Hashable]) -> Optional[str]:
+        """Возвращает имя из кэша и помечает запись как недавно использованную"""
+        if entity_id is None or entity_id not in self._items:
+            self.misses += 1
+            return None
+
+        self._items.move_to_end(entity_id)
+        self.hits += 1
+        return self._items[entity_id]
+
+    def put(self, entity_id: Optional[Hashable], name: str):
+        """Добавляет имя в кэш, вытесняя самую старую запись при переполнении"""
+        if entity_id is None:
+            return
+
+        self._items[entity_id] = name
+        self._items.move_to_end(entity_id)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def __contains__(self, entity_id) -> bool:
+        return entity_id in self._items
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get_stats(self) -> dict:
+        """Статистика попаданий в кэш"""
+        total = self.hits + self.misses
+        return {
+            'size': len(self._items),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0
+        }
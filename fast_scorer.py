@@ -0,0 +1,132 @@
+"""
+Быстрый инференс на numpy без sklearn: линейная модель и ближайшие размеченные примеры
+"""
+from typing import Dict, Union
+import numpy as np
+from vector_index import ExactIndex, IVFIndex, normalize_rows
+
+
+class LinearScorer:
+    """sigmoid(x @ w + b) на непрерывных float32-массивах
+
+    Эквивалент predict_proba(...)[:, 1] бинарной логистической модели (LogisticRegression,
+    SGDClassifier с log_loss), но без проверок входа sklearn и преобразования списков.
+    """
+
+    def __init__(self, coef: np.ndarray, intercept: float):
+        self.weights = np.ascontiguousarray(np.asarray(coef, dtype=np.float32).ravel())
+        self.intercept = np.float32(intercept)
+        self.dim = self.weights.shape[0]
+
+    @classmethod
+    def from_estimator(cls, model) -> 'LinearScorer':
+        """Снимает коэффициенты с обученной sklearn-модели"""
+        return cls(model.coef_, float(np.ravel(model.intercept_)[0]))
+
+    @classmethod
+    def from_snapshot(cls, arrays: Dict[str, np.ndarray]) -> 'LinearScorer':
+        """Создает скорер из снимка ModelStore (coef, intercept)"""
+        return cls(arrays['coef'], float(np.ravel(arrays['intercept'])[0]))
+
+    def decision(self, X: np.ndarray) -> Union[np.ndarray, np.float32]:
+        """Линейная часть x @ w + b для вектора или матрицы"""
+        X = np.asarray(X, dtype=np.float32)
+        return X @ self.weights + self.intercept
+
+    def score(self, X: np.ndarray) -> Union[np.ndarray, float]:
+        """Вероятность положительного класса: float для вектора, массив для матрицы"""
+        z = self.decision(X)
+        # Форма через tanh не переполняется при больших |z|
+        probabilities = 0.5 * (1.0 + np.tanh(0.5 * z))
+        return float(probabilities) if np.ndim(probabilities) == 0 else probabilities
+
+
+class NeighborScorer:
+    """Оценка по ближайшим размеченным примерам (k-NN) или по центроидам классов
+
+    Позиции в индексе совпадают со строками EmbeddingBuffer, поэтому метки и id строк
+    training_data берутся из буфера без копирования. Пока примеров меньше ivf_threshold,
+    используется точный перебор, дальше - IVF-разбиение.
+    """
+
+    # Крутизна сигмоиды для разности сходств с центроидами
+    PROTOTYPE_SCALE = 10.0
+
+    def __init__(self, buffer, k: int = 7, prototypes: bool = False, ivf_threshold: int = 20000):
+        self.buffer = buffer
+        self.k = k
+        self.prototypes = prototypes
+        embeddings, labels = buffer.arrays()
+
+        if len(labels) >= ivf_threshold:
+            self.index = IVFIndex(nlist=int(np.sqrt(len(labels))), nprobe=8)
+            self.index.train(embeddings[::max(1, len(labels) // 50000)])
+        else:
+            self.index = ExactIndex()
+        self.index.add(embeddings, np.arange(len(labels)))
+
+        normalized = normalize_rows(embeddings)
+        positive = labels == 1
+        self._sums = np.stack([normalized[~positive].sum(axis=0), normalized[positive].sum(axis=0)])
+        self._size = len(labels)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, embedding: np.ndarray, position: int, label: int):
+        """Добавляет пример, уже записанный в буфер на позицию position"""
+        normalized = normalize_rows(embedding)
+        self.index.add(normalized, [position])
+        self._sums[int(label == 1)] += normalized[0]
+        self._size += 1
+
+    def sync(self):
+        """Догоняет строки, добавленные в буфер после построения"""
+        embeddings, labels = self.buffer.arrays()
+        for position in range(self._size, len(labels)):
+            self.add(embeddings[position], position, labels[position])
+
+    def neighbors(self, X: np.ndarray, k: int = None):
+        """Сходства и позиции k ближайших примеров (позиция -1 - соседа нет)"""
+        return self.index.search(X, k or self.k)
+
+    def score(self, X: np.ndarray) -> Union[np.ndarray, float]:
+        """Вероятность положительного класса: float для вектора, массив для матрицы"""
+        single = np.ndim(X) == 1
+        probabilities = self._score(X)[0]
+        return float(probabilities[0]) if single else probabilities
+
+    def _score(self, X: np.ndarray):
+        if self.prototypes:
+            centroids = normalize_rows(self._sums)
+            similarities = normalize_rows(X) @ centroids.T
+            z = self.PROTOTYPE_SCALE * (similarities[:, 1] - similarities[:, 0])
+            return 0.5 * (1.0 + np.tanh(0.5 * z)), None, None
+
+        similarities, positions = self.neighbors(X)
+        labels = self.buffer.labels
+        found = positions >= 0
+        # Голос соседа пропорционален сходству; отрицательные сходства не голосуют
+        weights = np.where(found, np.clip(similarities, 0.0, None), 0.0) + found * 1e-6
+        votes = np.where(found, labels[np.where(found, positions, 0)], 0)
+        probabilities = (weights * votes).sum(axis=1) / np.maximum(weights.sum(axis=1), 1e-12)
+        return probabilities, similarities, positions
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """Метки 0/1 (для расчета метрик)"""
+        return (self._score(X)[0] > 0.5).astype(int)
+
+    def explain(self, X: np.ndarray, k: int = 3):
+        """Вероятности и ближайшие примеры-доказательства: (id строки training_data, сходство, метка)"""
+        probabilities, similarities, positions = self._score(X)
+        if positions is None:
+            similarities, positions = self.neighbors(X, k)
+        ids, labels = self.buffer.ids, self.buffer.labels
+        evidence = [
+            [
+                (int(ids[position]), float(similarity), int(labels[position]))
+                for similarity, position in zip(row_similarities[:k], row_positions[:k]) if position >= 0
+            ]
+            for row_similarities, row_positions in zip(similarities, positions)
+        ]
+        return probabilities, evidence
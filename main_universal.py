@@ -3,12 +3,16 @@ import logging
 import sys
 from datetime import datetime
 
+from startup_timer import startup_timer
 from config import config
 from database import DatabaseManager
 from ml_classifier import UniversalMessageClassifier
 from telegram_bot import TelegramBot
 from utils import validate_config, get_business_domain_examples
 
+# Тяжелый ML-стек импортируется лениво, здесь остаются только Telethon и numpy
+startup_timer.record('импорт', startup_timer.elapsed())
+
 logging.basicConfig(
     level=logging.INFO,
     format='[%(levelname)s] %(asctime)s: %(message)s',
@@ -74,25 +78,24 @@ async def main():
     
     print_config_info()
     
+    bot = None
     try:
         logging.info("🚀 Инициализация компонентов...")
         
-        db_manager = DatabaseManager()
+        with startup_timer.phase('база данных'):
+            db_manager = DatabaseManager()
         logging.info("✅ База данных инициализирована")
         
-        classifier = UniversalMessageClassifier(db_manager=db_manager)
+        # Модель и выборка грузятся в фоне, пока подключается клиент
+        classifier = UniversalMessageClassifier(
+            db_manager=db_manager, load_in_background=config.ml.background_load
+        )
         logging.info("✅ Классификатор инициализирован")
         
-        bot = TelegramBot(db_manager=db_manager, classifier=classifier)
+        with startup_timer.phase('клиент'):
+            bot = TelegramBot(db_manager=db_manager, classifier=classifier)
         logging.info("✅ Telegram бот инициализирован")
         
-        stats = classifier.get_stats()
-        logging.info(f"📊 Модель: {'обучена' if stats['is_trained'] else 'не обучена'}")
-        logging.info(f"📚 Примеров для обучения: {stats['training_examples']}")
-        
-        if stats.get('accuracy'):
-            logging.info(f"🎯 Точность модели: {stats['accuracy']:.2%}")
-        
         logging.info("🚀 Запуск бота...")
         await bot.run()
         
@@ -102,8 +105,48 @@ async def main():
         logging.error(f"❌ Критическая ошибка: {e}")
         sys.exit(1)
     finally:
+        if bot:
+            # Дописывает очередь фоновой записи и накопленную статистику
+            await bot.stop()
         logging.info("👋 Завершение работы")
 
+async def backfill(chats, limit=None):
+    from backfill import HistoryBackfill
+    
+    print_banner()
+    
+    if not setup_configuration():
+        print("❌ Не удалось настроить конфигурацию. Завершение работы.")
+        return
+    
+    bot = None
+    try:
+        db_manager = DatabaseManager()
+        classifier = UniversalMessageClassifier(
+            db_manager=db_manager, load_in_background=config.ml.background_load
+        )
+        bot = TelegramBot(db_manager=db_manager, classifier=classifier)
+        
+        await bot.connect()
+        # История классифицируется только полной моделью
+        await bot.wait_for_model()
+        logging.info(f"📥 Запуск бэкфилла по чатам: {', '.join(chats)}")
+        await HistoryBackfill(bot).run(chats, limit=limit)
+        
+    except Exception as e:
+        logging.error(f"❌ Ошибка бэкфилла: {e}")
+        sys.exit(1)
+    finally:
+        if bot:
+            await bot.stop()
+
+def parse_backfill_args(args):
+    chats = [chat.strip() for chat in args[0].split(',') if chat.strip()] if args else []
+    limit = None
+    if '--limit' in args:
+        limit = int(args[args.index('--limit') + 1])
+    return chats, limit
+
 def print_help():
     help_text = """
 🤖 **УНИВЕРСАЛЬНЫЙ TELEGRAM-БОТ**
@@ -132,6 +175,9 @@ def print_help():
 • /train - переобучение модели
 • /correct_<id> - отметить сообщение как релевантное
 • /wrong_<id> - отметить сообщение как нерелевантное
+• /search <запрос> - поиск по истории сообщений
+• /similar_<id> - похожие сообщения из истории
+• /rollback[_<версия>] - откатить модель к предыдущей версии
 • /clear_history - очистить старую историю
 
 **Примеры сфер:**
@@ -143,12 +189,24 @@ def print_help():
 
 **Запуск:**
 python main_universal.py
+
+**Бэкфилл истории:**
+python main_universal.py --backfill chat1,chat2 [--limit N]
 """
     print(help_text)
 
 if __name__ == "__main__":
     if len(sys.argv) > 1 and sys.argv[1] in ['--help', '-h', 'help']:
         print_help()
+    elif len(sys.argv) > 1 and sys.argv[1] == '--backfill':
+        chats, limit = parse_backfill_args(sys.argv[2:])
+        if not chats:
+            print("❌ Укажите чаты: python main_universal.py --backfill chat1,chat2")
+            sys.exit(1)
+        try:
+            asyncio.run(backfill(chats, limit))
+        except KeyboardInterrupt:
+            print("\n👋 Бэкфилл прерван, прогресс сохранен в чекпоинтах")
     else:
         try:
             asyncio.run(main())
@@ -0,0 +1,156 @@
+"""
+Индекс эмбеддингов сохраненных сообщений для поиска похожих (/similar_<id>)
+"""
+import logging
+import threading
+import time
+from typing import List, Optional, Tuple
+import numpy as np
+from config import config
+from vector_index import ExactIndex, IVFIndex, _GrowableRows
+
+# Сколько строк message_embeddings читать из SQLite за один запрос при построении
+LOAD_CHUNK_SIZE = 5000
+# Размер выборки для обучения центроидов IVF
+TRAIN_SAMPLE_SIZE = 50000
+
+
+class MessageIndex:
+    """Векторы сообщений (float16) в памяти с ключами (chat_id, message_id)
+
+    Пока сообщений меньше ivf_threshold, поиск идет полным перебором, дальше индекс
+    в фоне перестраивается в IVF. Новые сообщения добавляются после записи в БД без
+    перестроения. Удаленные по сроку хранения векторы остаются до следующей пересборки,
+    поэтому результаты сверяются с БД вызывающим кодом.
+    """
+
+    def __init__(self, db_manager, ivf_threshold: int = None, nprobe: int = None):
+        self.db_manager = db_manager
+        self.ivf_threshold = ivf_threshold or config.ml.similar_ivf_threshold
+        self.nprobe = nprobe or config.ml.similar_nprobe
+        self.dim = None
+        self._lock = threading.Lock()
+        self._index = ExactIndex(dtype=np.float16)
+        # Позиция в индексе -> (chat_id, message_id)
+        self._keys = _GrowableRows(2, np.int64)
+        # Пока идет пересборка, новые записи копятся здесь и доливаются в новый индекс
+        self._pending: Optional[list] = None
+        self._rebuild_thread = None
+
+    def __len__(self) -> int:
+        return self._keys.count
+
+    @property
+    def is_ivf(self) -> bool:
+        return isinstance(self._index, IVFIndex)
+
+    def rebuild(self) -> int:
+        """Строит индекс заново из таблицы message_embeddings; возвращает число векторов"""
+        with self._lock:
+            if self._pending is not None:
+                return len(self)
+            self._pending = []
+
+        started = time.perf_counter()
+        try:
+            count = self.db_manager.count_message_embeddings()
+            if count >= self.ivf_threshold:
+                sample = [np.frombuffer(blob, dtype=np.float16) for blob in
+                          self.db_manager.sample_message_embeddings(TRAIN_SAMPLE_SIZE)]
+                index = IVFIndex(nlist=int(np.sqrt(count)), nprobe=self.nprobe, dtype=np.float16)
+                index.train(self._stack(sample))
+            else:
+                index = ExactIndex(dtype=np.float16)
+            keys = _GrowableRows(2, np.int64)
+
+            after = (-2 ** 63, -2 ** 63)
+            while True:
+                rows = self.db_manager.get_message_embedding_rows(after, LOAD_CHUNK_SIZE)
+                if not rows:
+                    break
+                self._add_rows(index, keys, [
+                    (chat_id, message_id, np.frombuffer(blob, dtype=np.float16)) for chat_id, message_id, blob in rows
+                ])
+                after = rows[-1][:2]
+
+            with self._lock:
+                # Записи, сохраненные во время пересборки
+                self._add_rows(index, keys, self._pending)
+                self._index, self._keys = index, keys
+                self._pending = None
+
+            logging.info(
+                f"✅ Индекс похожих сообщений построен: {keys.count} векторов "
+                f"({'IVF' if self.is_ivf else 'перебор'}, {time.perf_counter() - started:.1f} с)"
+            )
+            return keys.count
+
+        except Exception as e:
+            with self._lock:
+                self._pending = None
+            logging.error(f"❌ Ошибка построения индекса похожих сообщений: {e}")
+            return len(self)
+
+    def rebuild_async(self):
+        """Запускает пересборку в фоновом потоке (если она еще не идет)"""
+        if self._rebuild_thread is not None and self._rebuild_thread.is_alive():
+            return
+        self._rebuild_thread = threading.Thread(target=self.rebuild, name='message-index', daemon=True)
+        self._rebuild_thread.start()
+
+    def _stack(self, vectors: List[np.ndarray]) -> np.ndarray:
+        """Матрица из векторов текущей размерности (векторы другой модели пропускаются)"""
+        if self.dim is None and vectors:
+            self.dim = len(vectors[0])
+        vectors = [vector for vector in vectors if len(vector) == self.dim]
+        return np.vstack(vectors) if vectors else np.empty((0, self.dim or 0), dtype=np.float16)
+
+    def _add_rows(self, index, keys: _GrowableRows, rows: List[Tuple[int, int, np.ndarray]]):
+        """Добавляет строки (chat_id, message_id, вектор) в индекс и таблицу ключей"""
+        if self.dim is None and rows:
+            self.dim = len(rows[0][2])
+        rows = [row for row in rows if len(row[2]) == self.dim]
+        if not rows:
+            return
+        positions = np.arange(keys.count, keys.count + len(rows))
+        index.add(np.vstack([vector for _, _, vector in rows]), positions)
+        keys.add(np.array([(chat_id, message_id) for chat_id, message_id, _ in rows], dtype=np.int64), positions)
+
+    def add_records(self, records: List[dict]):
+        """Добавляет сохраненные сообщения с эмбеддингами (вызывается после коммита)"""
+        rows = [
+            (record.get('chat_id') or 0, record['message_id'], np.asarray(record['embedding'], dtype=np.float16))
+            for record in records if record.get('embedding') is not None
+        ]
+        if not rows:
+            return
+        with self._lock:
+            if self._pending is not None:
+                self._pending.extend(rows)
+            self._add_rows(self._index, self._keys, rows)
+            grow = not self.is_ivf and len(self) >= self.ivf_threshold
+        if grow:
+            # Полный перебор перестал укладываться в бюджет - переходим на IVF
+            self.rebuild_async()
+
+    def similar(self, chat_id: int, message_id: int, k: int = 10) -> Optional[List[Tuple[int, int, float]]]:
+        """Ближайшие сообщения (chat_id, message_id, сходство); None, если эмбеддинга нет"""
+        query = self.db_manager.get_message_embedding(message_id, chat_id)
+        if query is None:
+            return None
+
+        with self._lock:
+            index, keys = self._index, self._keys
+            # Запас на само сообщение и повторы после перезаписи
+            scores, positions = index.search(query, k * 2 + 1)
+            found = keys.view()[0][positions[0][positions[0] >= 0]]
+
+        results, seen = [], {(chat_id or 0, message_id)}
+        for (found_chat, found_message), score in zip(found.tolist(), scores[0].tolist()):
+            if (found_chat, found_message) in seen:
+                continue
+            seen.add((found_chat, found_message))
+            results.append((found_chat, found_message, score))
+            if len(results) == k:
+                break
+        return results
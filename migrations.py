@@ -0,0 +1,409 @@
+"""
+Версионированные миграции схемы bot_database.db
+"""
+import logging
+import sqlite3
+from typing import Callable, List, NamedTuple
+
+# Размер порции при перекладке больших таблиц: между порциями транзакция коммитится,
+# чтобы не держать блокировку на запись все время миграции
+COPY_CHUNK_SIZE = 5000
+
+# Полный VACUUM для включения auto_vacuum делается в миграции только для небольших баз;
+# большие переводятся при ближайшем ручном VACUUM
+AUTO_VACUUM_MAX_PAGES = 50000
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    apply: Callable[[sqlite3.Connection], None]
+    # Нетранзакционные миграции сами управляют коммитами (например, порционное копирование)
+    transactional: bool = True
+
+
+def _ensure_column(conn: sqlite3.Connection, table: str, column: str, column_type: str):
+    """Добавляет колонку в существующую таблицу, если ее еще нет"""
+    columns = [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]
+    if column not in columns:
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {column_type}')
+
+
+def _table_exists(conn: sqlite3.Connection, table: str) -> bool:
+    row = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()
+    return row is not None
+
+
+def _baseline(conn: sqlite3.Connection):
+    """Схема до введения миграций; идемпотентна для баз любых предыдущих версий"""
+    # Таблица для сообщений
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            message_id INTEGER UNIQUE NOT NULL,
+            chat_id INTEGER,
+            sender_id INTEGER,
+            text TEXT NOT NULL,
+            sender_info TEXT,
+            chat_title TEXT,
+            message_date TEXT,
+            similarity_score REAL,
+            is_full_cycle BOOLEAN,
+            ml_probability REAL,
+            forwarded BOOLEAN,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Таблица для обучения классификатора
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS training_data (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            text TEXT NOT NULL,
+            embedding BLOB NOT NULL,
+            label INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Таблица для метрик модели
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS model_metrics (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            model_name TEXT NOT NULL,
+            accuracy REAL,
+            precision_score REAL,
+            recall_score REAL,
+            f1_score REAL,
+            training_examples INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Таблица для статистики бота
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS bot_stats (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT NOT NULL,
+            messages_processed INTEGER DEFAULT 0,
+            messages_forwarded INTEGER DEFAULT 0,
+            messages_rejected INTEGER DEFAULT 0,
+            training_examples_added INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Таблица отображаемых имен отправителей и чатов (заполняется лениво)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS entity_names (
+            entity_id INTEGER PRIMARY KEY,
+            display_name TEXT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Чекпоинты исторического бэкфилла по чатам
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS backfill_checkpoints (
+            chat_id INTEGER PRIMARY KEY,
+            last_message_id INTEGER NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Одна строка статистики на дату: схлопываем дубликаты старых версий
+    conn.execute('''
+        DELETE FROM bot_stats
+        WHERE id NOT IN (SELECT MAX(id) FROM bot_stats GROUP BY date)
+    ''')
+    conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_bot_stats_date ON bot_stats(date)')
+
+    # Предагрегированные роллапы: по часу/дню, чату и причине решения
+    for table in ('stats_hourly', 'stats_daily'):
+        conn.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table} (
+                bucket TEXT NOT NULL,
+                chat_id INTEGER NOT NULL DEFAULT 0,
+                reason TEXT NOT NULL,
+                processed INTEGER NOT NULL DEFAULT 0,
+                forwarded INTEGER NOT NULL DEFAULT 0,
+                rejected INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (bucket, chat_id, reason)
+            ) WITHOUT ROWID
+        ''')
+        conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_chat ON {table}(chat_id, bucket)')
+
+    # Колонки, добавленные после первого релиза
+    _ensure_column(conn, 'messages', 'chat_id', 'INTEGER')
+    _ensure_column(conn, 'messages', 'sender_id', 'INTEGER')
+
+
+def _lookup_indexes(conn: sqlite3.Connection):
+    """Индексы под реальные запросы: последние метрики, обучение, очистка истории"""
+    # get_latest_metrics: WHERE model_name = ? ORDER BY created_at DESC LIMIT 1
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_model_metrics_name_created
+        ON model_metrics(model_name, created_at)
+    ''')
+    # get_training_data: ORDER BY created_at DESC
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_training_data_created ON training_data(created_at)')
+
+
+MESSAGES_COLUMNS = (
+    'id, message_id, chat_id, sender_id, text, sender_info, chat_title, message_date, '
+    'similarity_score, is_full_cycle, ml_probability, forwarded, created_at'
+)
+
+
+def _create_chat_scoped_messages(conn: sqlite3.Connection, table: str):
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS {table} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            message_id INTEGER NOT NULL,
+            chat_id INTEGER NOT NULL DEFAULT 0,
+            sender_id INTEGER,
+            text TEXT NOT NULL,
+            sender_info TEXT,
+            chat_title TEXT,
+            message_date TEXT,
+            similarity_score REAL,
+            is_full_cycle BOOLEAN,
+            ml_probability REAL,
+            forwarded BOOLEAN,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE (chat_id, message_id)
+        )
+    ''')
+
+
+def _copy_messages_chunk(conn: sqlite3.Connection, after_id: int, limit: int = None) -> int:
+    """Копирует порцию строк messages с id > after_id, возвращает последний id"""
+    select_columns = MESSAGES_COLUMNS.replace('chat_id', 'COALESCE(chat_id, 0)', 1)
+    limit_clause = f'LIMIT {int(limit)}' if limit else ''
+    rows = conn.execute(f'''
+        SELECT {select_columns} FROM messages WHERE id > ? ORDER BY id {limit_clause}
+    ''', (after_id,)).fetchall()
+    if not rows:
+        return after_id
+    placeholders = ', '.join('?' * len(rows[0]))
+    conn.executemany(
+        f'INSERT OR REPLACE INTO messages_new ({MESSAGES_COLUMNS}) VALUES ({placeholders})',
+        [tuple(row) for row in rows]
+    )
+    return rows[-1][0]
+
+
+def _chat_scoped_message_key(conn: sqlite3.Connection):
+    """Ключ (chat_id, message_id) вместо глобального message_id UNIQUE
+
+    SQLite не умеет снимать ограничения, поэтому таблица пересоздается. Строки копируются
+    порциями с коммитом между ними; в финальной короткой транзакции докопируется хвост,
+    появившийся за время копирования, и таблицы меняются местами.
+    """
+    _create_chat_scoped_messages(conn, 'messages_new')
+    conn.commit()
+
+    last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM messages_new').fetchone()[0]
+    while True:
+        copied_to = _copy_messages_chunk(conn, last_id, COPY_CHUNK_SIZE)
+        conn.commit()
+        if copied_to == last_id:
+            break
+        last_id = copied_to
+
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        _copy_messages_chunk(conn, last_id)
+        conn.execute('DROP TABLE messages')
+        conn.execute('ALTER TABLE messages_new RENAME TO messages')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_messages_message_id ON messages(message_id)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_messages_created ON messages(created_at)')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def _incremental_auto_vacuum(conn: sqlite3.Connection):
+    """Режим auto_vacuum=INCREMENTAL, чтобы очистка могла порциями возвращать место на диске"""
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+        return
+    conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    page_count = conn.execute('PRAGMA page_count').fetchone()[0]
+    if page_count > AUTO_VACUUM_MAX_PAGES:
+        logging.warning(
+            f"⚠️ База слишком большая ({page_count} страниц) для VACUUM при запуске; "
+            f"auto_vacuum включится после ручного VACUUM"
+        )
+        return
+    # VACUUM нельзя выполнить внутри транзакции
+    conn.commit()
+    conn.execute('VACUUM')
+
+
+def _message_embeddings(conn: sqlite3.Connection):
+    """Эмбеддинги классифицированных сообщений (float16) для разметки без повторного кодирования"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS message_embeddings (
+            chat_id INTEGER NOT NULL,
+            message_id INTEGER NOT NULL,
+            embedding BLOB NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (chat_id, message_id)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_message_embeddings_created ON message_embeddings(created_at)')
+
+
+# Текст, который попадает в полнотекстовый индекс (ё и е ищутся одинаково)
+FTS_TEXT = "replace(replace({0}.text, 'ё', 'е'), 'Ё', 'Е')"
+
+
+def _fts5_available(conn: sqlite3.Connection) -> bool:
+    try:
+        conn.execute('CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(text)')
+        conn.execute('DROP TABLE temp.fts5_probe')
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+def _messages_fulltext(conn: sqlite3.Connection):
+    """Полнотекстовый индекс FTS5 по messages.text, синхронизируемый триггерами
+
+    unicode61 приводит кириллицу к нижнему регистру, но не склеивает ё/е (remove_diacritics
+    действует только на латиницу), поэтому в индекс текст попадает с заменой ё на е.
+    Префиксные индексы ускоряют поиск по началу слова вместо морфологии.
+    """
+    if not _fts5_available(conn):
+        logging.warning("⚠️ SQLite собран без FTS5, /search будет работать через LIKE")
+        return
+
+    conn.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+            text,
+            content='messages',
+            content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2',
+            prefix='2 3 4'
+        )
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+            INSERT INTO messages_fts (rowid, text) VALUES (new.id, {FTS_TEXT.format('new')});
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, text) VALUES ('delete', old.id, {FTS_TEXT.format('old')});
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF text ON messages BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, text) VALUES ('delete', old.id, {FTS_TEXT.format('old')});
+            INSERT INTO messages_fts (rowid, text) VALUES (new.id, {FTS_TEXT.format('new')});
+        END
+    ''')
+    # 'rebuild' взял бы текст без замены ё, поэтому индекс заполняется явно
+    conn.execute(f"INSERT INTO messages_fts (rowid, text) SELECT id, {FTS_TEXT.format('messages')} FROM messages")
+
+
+def _entity_name_kinds(conn: sqlite3.Connection):
+    """Имена отправителей и чатов в разных пространствах ключей (kind, entity_id)
+
+    В личном чате chat_id совпадает с ID собеседника, поэтому общий ключ подставлял имя
+    отправителя вместо названия чата. Старые записи с отрицательными ID (группы и каналы)
+    могли попасть туда в обеих ролях и копируются в обе, положительные - только отправители.
+    """
+    conn.execute('''
+        CREATE TABLE entity_names_new (
+            kind TEXT NOT NULL,
+            entity_id INTEGER NOT NULL,
+            display_name TEXT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (kind, entity_id)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        INSERT INTO entity_names_new (kind, entity_id, display_name, updated_at)
+        SELECT 'sender', entity_id, display_name, updated_at FROM entity_names
+    ''')
+    conn.execute('''
+        INSERT INTO entity_names_new (kind, entity_id, display_name, updated_at)
+        SELECT 'chat', entity_id, display_name, updated_at FROM entity_names WHERE entity_id < 0
+    ''')
+    conn.execute('DROP TABLE entity_names')
+    conn.execute('ALTER TABLE entity_names_new RENAME TO entity_names')
+
+
+def _processed_checkpoints(conn: sqlite3.Connection):
+    """Последнее обработанное сообщение по чату, включая отклоненные фильтрами (их нет в messages)"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS processed_checkpoints (
+            chat_id INTEGER PRIMARY KEY,
+            last_message_id INTEGER NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, 'базовая схема', _baseline),
+    Migration(2, 'индексы для метрик и данных обучения', _lookup_indexes),
+    Migration(3, 'ключ сообщений (chat_id, message_id)', _chat_scoped_message_key, transactional=False),
+    Migration(4, 'инкрементальный auto_vacuum', _incremental_auto_vacuum, transactional=False),
+    Migration(5, 'эмбеддинги сообщений', _message_embeddings),
+    Migration(6, 'полнотекстовый поиск по сообщениям', _messages_fulltext),
+    Migration(7, 'имена отправителей и чатов раздельно', _entity_name_kinds),
+    Migration(8, 'чекпоинты обработанных сообщений', _processed_checkpoints),
+]
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    """Текущая версия схемы (0 для баз без таблицы schema_version)"""
+    if not _table_exists(conn, 'schema_version'):
+        return 0
+    return conn.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version').fetchone()[0]
+
+
+def apply_migrations(conn: sqlite3.Connection, migrations: List[Migration] = None) -> int:
+    """Применяет недостающие миграции по порядку, возвращает итоговую версию схемы"""
+    migrations = sorted(migrations or MIGRATIONS, key=lambda migration: migration.version)
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.commit()
+    current = get_schema_version(conn)
+
+    for migration in migrations:
+        if migration.version <= current:
+            continue
+
+        logging.info(f"🔧 Миграция схемы {migration.version}: {migration.description}")
+        if migration.transactional:
+            conn.execute('BEGIN')
+            try:
+                migration.apply(conn)
+                conn.execute(
+                    'INSERT INTO schema_version (version, description) VALUES (?, ?)',
+                    (migration.version, migration.description)
+                )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        else:
+            migration.apply(conn)
+            conn.execute(
+                'INSERT INTO schema_version (version, description) VALUES (?, ?)',
+                (migration.version, migration.description)
+            )
+            conn.commit()
+        current = migration.version
+
+    return current
@@ -2,45 +2,136 @@
 Модуль машинного обучения для классификации сообщений
 """
 import logging
+import threading
 import numpy as np
 from typing import List, Dict, Any, Optional, Tuple
-from sklearn.linear_model import LogisticRegression
-from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score
-from sklearn.model_selection import train_test_split
-from sentence_transformers import SentenceTransformer
 from database import DatabaseManager
+from training_store import EmbeddingBuffer, TrainingMatrixStore
+from retrain_scheduler import RetrainScheduler
+from model_store import ModelStore
+from fast_scorer import LinearScorer, NeighborScorer
+from text_chunking import pool_chunks, split_windows
 from config import config
+from startup_timer import startup_timer
+from utils import get_keyword_index
+
+
+def _sentence_transformer(model_name: str):
+    """Создает модель предложений; sentence_transformers (и torch) импортируются только здесь"""
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name)
 
 class UniversalMessageClassifier:
     """Универсальный классификатор сообщений с автообучением"""
     
-    def __init__(self, model_name: str = None, db_manager: DatabaseManager = None):
+    def __init__(self, model_name: str = None, db_manager: DatabaseManager = None,
+                 load_in_background: bool = False):
         self.model_name = model_name or config.ml.classifier_model
         self.db_manager = db_manager or DatabaseManager()
         self.classifier = None
+        # Скомпилированная линейная модель для инференса без sklearn
+        self.scorer = None
+        # Массивы снимка, по которым sklearn-модель собирается только по требованию
+        self._snapshot_arrays = None
         self.sentence_model = None
         self.is_trained = False
-        self.training_data = []
+        # Рабочая выборка в памяти и ее копия на диске; источник истины - таблица training_data
+        self.training_data = EmbeddingBuffer()
+        self.training_store = TrainingMatrixStore(self.db_manager)
         self.last_metrics = {}
+        self.model_version = None
+        self.model_store = ModelStore(self.model_name, db_path=self.db_manager.db_path)
+        # linear - логистическая модель; knn/prototype - голосование ближайших примеров
+        # или сравнение с центроидами классов, без обучения
+        self.mode = config.ml.classifier_mode
+        
+        # Переобучение идет в фоновом потоке, серия разметок склеивается в один запуск
+        self.retrain_scheduler = RetrainScheduler(self.auto_train)
+        self._train_lock = threading.Lock()
         
-        # Загружаем модель предложений
-        self._load_sentence_model()
-        # Загружаем данные обучения
-        self._load_training_data()
+        # Онлайн-режим: дообучение на каждом примере и редкое полное переобучение в фоне
+        self.online = config.ml.online_learning
+        self._model_lock = threading.Lock()
+        self._labels_since_refit = 0
+        self._online_seen = 0
+        self._online_correct = 0
+        # Растет при откате: обучение, начатое до отката, не публикует свою модель
+        self._rollbacks = 0
+        
+        # Модель и выборка загружаются один раз; до конца загрузки бот решает по правилам
+        self._loaded = threading.Event()
+        self._load_thread = None
+        if load_in_background:
+            self.load_async()
+        else:
+            self.load()
+    
+    def load(self):
+        """Загружает модель предложений, данные обучения и классификатор с замером фаз"""
+        try:
+            with startup_timer.phase('данные обучения'):
+                self._load_training_data()
+            with startup_timer.phase('классификатор'):
+                if self.mode == 'linear':
+                    # Поднимаем последний сохраненный классификатор вместо переобучения
+                    self._load_model_snapshot()
+                elif len(self.training_data) >= config.ml.min_training_examples:
+                    # Индекс соседей строится из буфера в фоне
+                    self.request_retrain(immediate=True)
+            with startup_timer.phase('модель предложений'):
+                self._load_sentence_model()
+            with startup_timer.phase('прогрев'):
+                self._warm_up()
+        finally:
+            self._loaded.set()
+        startup_timer.report('Модель готова')
+        logging.info(
+            f"📊 Модель: {'обучена' if self.is_trained else 'не обучена'}, "
+            f"примеров для обучения: {len(self.training_data)}"
+        )
+    
+    def load_async(self):
+        """Запускает загрузку в фоновом потоке (например, пока подключается клиент)"""
+        if self._load_thread is not None or self._loaded.is_set():
+            return
+        self._load_thread = threading.Thread(target=self.load, name='model-loader', daemon=True)
+        self._load_thread.start()
+    
+    def wait_ready(self, timeout: float = None) -> bool:
+        """Ждет окончания загрузки; True, если модель предложений доступна"""
+        self._loaded.wait(timeout)
+        return self.is_ready
+    
+    @property
+    def is_ready(self) -> bool:
+        """Загрузка завершена и модель предложений доступна"""
+        return self._loaded.is_set() and self.sentence_model is not None
     
     def _load_sentence_model(self):
         """Загружает модель для создания эмбеддингов"""
         try:
-            self.sentence_model = SentenceTransformer(config.ml.model_name)
+            self.sentence_model = _sentence_transformer(config.ml.model_name)
             logging.info(f"✅ Модель предложений загружена: {config.ml.model_name}")
         except Exception as e:
             logging.error(f"❌ Ошибка загрузки модели предложений: {e}")
             self.sentence_model = None
     
+    def _warm_up(self):
+        """Пробный проход модели (первый encode инициализирует веса и буферы) и
+        индекс ключевых фраз, чтобы первое сообщение не кодировало словарь"""
+        if self.sentence_model is None:
+            return
+        try:
+            self.encode(["прогрев модели"])
+            get_keyword_index(self.sentence_model, config.business.keywords)
+        except Exception as e:
+            logging.warning(f"⚠️ Прогрев модели не удался: {e}")
+    
     def _load_training_data(self):
         """Загружает данные обучения из базы данных"""
         try:
-            self.training_data = self.db_manager.get_training_data()
+            self.training_store.sync()
+            self.training_store.load_into(self.training_data)
             logging.info(f"✅ Загружено {len(self.training_data)} примеров для обучения")
             
             # Загружаем последние метрики
@@ -48,35 +139,42 @@ class UniversalMessageClassifier:
             
         except Exception as e:
             logging.error(f"❌ Ошибка загрузки данных обучения: {e}")
-            self.training_data = []
     
-    def add_training_example(self, text: str, label: int) -> bool:
-        """Добавляет пример для обучения"""
-        if not self.sentence_model:
+    def add_training_example(self, text: str, label: int, embedding: np.ndarray = None) -> bool:
+        """Добавляет пример для обучения (готовый эмбеддинг сообщения не кодируется повторно)"""
+        if embedding is not None and self.training_data.dim not in (None, len(embedding)):
+            # Эмбеддинг от другой модели предложений
+            embedding = None
+        if not self._loaded.is_set():
+            # Буфер обучения еще читается из БД
+            logging.warning("⏳ Модель еще загружается, пример не добавлен")
+            return False
+        if embedding is None and not self.sentence_model:
             logging.error("❌ Модель предложений не загружена")
             return False
         
         try:
             # Создаем эмбеддинг
-            embedding = self.sentence_model.encode([text])[0]
+            if embedding is None:
+                embedding = self.encode([text])[0]
             
             # Сохраняем в базу данных
             success = self.db_manager.save_training_example(text, embedding, label)
             
             if success:
-                # Обновляем локальные данные
-                self.training_data.append({
-                    'text': text,
-                    'embedding': embedding,
-                    'label': label
-                })
+                # Дописываем новую строку в файлы и в буфер обучения
+                self.training_store.sync(self.training_data)
                 
                 logging.info(f"✅ Добавлен пример обучения (всего: {len(self.training_data)})")
                 
                 # Автоматическое обучение при накоплении примеров
-                if len(self.training_data) >= config.ml.min_training_examples:
+                if self.mode != 'linear':
+                    self._add_neighbor(embedding, label)
+                elif self.online:
+                    self._learn_online(embedding, label)
+                elif len(self.training_data) >= config.ml.min_training_examples:
                     if len(self.training_data) % config.ml.auto_train_threshold == 0:
-                        self.auto_train()
+                        self.request_retrain()
                 
                 return True
             else:
@@ -86,16 +184,24 @@ class UniversalMessageClassifier:
             logging.error(f"❌ Ошибка добавления примера обучения: {e}")
             return False
     
+    def request_retrain(self, immediate: bool = False):
+        """Ставит переобучение в фоновую очередь; возвращает Future с результатом"""
+        return self.retrain_scheduler.request(immediate)
+    
     def auto_train(self) -> bool:
         """Автоматическое обучение модели"""
+        with self._train_lock:
+            return self._train()
+    
+    def _train(self) -> bool:
         if len(self.training_data) < config.ml.min_training_examples:
             logging.warning(f"❌ Недостаточно данных для обучения (нужно {config.ml.min_training_examples}, есть {len(self.training_data)})")
             return False
         
         try:
-            # Подготавливаем данные
-            X = np.array([item['embedding'] for item in self.training_data])
-            y = np.array([item['label'] for item in self.training_data])
+            rollbacks = self._rollbacks
+            # Подготавливаем данные (срезы буфера без копирования)
+            X, y = self.training_data.arrays()
             
             # Проверяем баланс классов
             unique_labels, counts = np.unique(y, return_counts=True)
@@ -103,20 +209,33 @@ class UniversalMessageClassifier:
                 logging.warning("❌ Недостаточно классов для обучения")
                 return False
             
-            # Создаем новую модель если нужно
-            if self.classifier is None:
-                self.classifier = LogisticRegression(
-                    random_state=42, 
-                    max_iter=1000,
-                    class_weight='balanced'  # Для балансировки классов
-                )
+            if self.mode != 'linear':
+                return self._build_neighbor_model(X, y)
             
-            # Обучаем модель
-            self.classifier.fit(X, y)
-            self.is_trained = True
+            # Обучаем новую модель и подменяем ссылку целиком, чтобы predict
+            # не видел частично обученный классификатор
+            model = self._new_estimator()
+            if self.online:
+                from sklearn.utils.class_weight import compute_sample_weight
+                model.fit(X, y, sample_weight=compute_sample_weight('balanced', y))
+            else:
+                model.fit(X, y)
             
             # Рассчитываем метрики
-            metrics = self._calculate_metrics(X, y)
+            metrics = self._calculate_metrics(X, y, model)
+            
+            with self._model_lock:
+                if self._rollbacks != rollbacks:
+                    logging.warning("⚠️ Модель откатили во время обучения, результат обучения отброшен")
+                    return False
+                if self.online and len(self.training_data) > len(y):
+                    # Догоняем примеры, добавленные во время фонового обучения
+                    X_all, y_all = self.training_data.arrays()
+                    self._partial_fit(model, X_all[len(y):], y_all[len(y):])
+                self._publish(model)
+                # Снимок модели, чтобы после перезапуска не переобучаться; под блокировкой,
+                # чтобы откат не мог вклиниться между публикацией и сменой текущей версии
+                self.model_version = self.model_store.save(model, metrics, training_examples=len(y))
             
             # Сохраняем метрики в базу данных
             self.db_manager.save_model_metrics(self.model_name, metrics)
@@ -131,10 +250,114 @@ class UniversalMessageClassifier:
             logging.error(f"❌ Ошибка автоматического обучения: {e}")
             return False
     
-    def _calculate_metrics(self, X: np.ndarray, y: np.ndarray) -> Dict[str, float]:
+    def _build_neighbor_model(self, X: np.ndarray, y: np.ndarray) -> bool:
+        """Строит индекс соседей (knn) или центроиды классов (prototype) по буферу"""
+        model = NeighborScorer(
+            self.training_data,
+            k=config.ml.knn_k,
+            prototypes=self.mode == 'prototype',
+            ivf_threshold=config.ml.knn_index_threshold
+        )
+        metrics = self._calculate_metrics(X, y, model)
+        
+        with self._model_lock:
+            # Примеры, добавленные во время построения
+            model.sync()
+            self.scorer = model
+            self.classifier = model
+            self._snapshot_arrays = None
+            self.is_trained = True
+        
+        self.db_manager.save_model_metrics(self.model_name, metrics)
+        self.last_metrics = metrics
+        logging.info(f"✅ Индекс примеров построен ({self.mode}, {len(model)} векторов)")
+        logging.info(f"📊 Метрики: Точность: {metrics['accuracy']:.3f}, F1: {metrics['f1']:.3f}")
+        return True
+    
+    def _add_neighbor(self, embedding: np.ndarray, label: int):
+        """Добавляет размеченный пример в индекс соседей без перестроения"""
+        with self._model_lock:
+            scorer = self.scorer
+            if isinstance(scorer, NeighborScorer) and len(scorer) == len(self.training_data) - 1:
+                scorer.add(embedding, len(self.training_data) - 1, label)
+                return
+        if len(self.training_data) >= config.ml.min_training_examples:
+            # Индекса еще нет или буфер перечитан из БД
+            self.request_retrain()
+    
+    def _new_estimator(self):
+        """Новая необученная модель для текущего режима"""
+        from sklearn.linear_model import LogisticRegression, SGDClassifier
+        if self.online:
+            return SGDClassifier(loss='log_loss', alpha=1e-4, random_state=42)
+        return LogisticRegression(
+            random_state=42, 
+            max_iter=1000,
+            class_weight='balanced'  # Для балансировки классов
+        )
+    
+    def _learn_online(self, embedding: np.ndarray, label: int):
+        """Дообучает онлайн-модель на одном примере за O(d)"""
+        if len(self.training_data) < config.ml.min_training_examples:
+            return
+        from sklearn.linear_model import SGDClassifier
+        if not self.is_trained or not isinstance(self.classifier, SGDClassifier):
+            # Первое обучение делается целиком; до него примеры только копятся
+            self.request_retrain()
+            return
+        
+        x = np.asarray(embedding, dtype=np.float32).reshape(1, -1)
+        with self._model_lock:
+            # Точность "до обучения" на каждом новом примере (prequential)
+            self._online_seen += 1
+            self._online_correct += int((self.scorer.score(x[0]) > 0.5) == bool(label))
+            self._partial_fit(self.classifier, x, np.array([label]))
+            self.scorer = LinearScorer.from_estimator(self.classifier)
+        
+        self._labels_since_refit += 1
+        if self._labels_since_refit >= config.ml.full_refit_interval:
+            # Полное переобучение исправляет дрейф онлайн-модели
+            self._labels_since_refit = 0
+            self.request_retrain()
+    
+    def _publish(self, model):
+        """Делает модель текущей: сначала скорер, затем ссылка на классификатор"""
+        self.scorer = LinearScorer.from_estimator(model)
+        self.classifier = model
+        self._snapshot_arrays = None
+        self.is_trained = True
+    
+    def _estimator(self):
+        """sklearn-модель текущего классификатора; для загруженного снимка собирается при первом вызове"""
+        with self._model_lock:
+            if self.classifier is None and self._snapshot_arrays is not None:
+                arrays = self._snapshot_arrays
+                # Логистическая модель полностью задается коэффициентами
+                from sklearn.linear_model import LogisticRegression
+                model = LogisticRegression()
+                model.coef_ = arrays['coef'].reshape(1, -1).astype(np.float64)
+                model.intercept_ = arrays['intercept'].astype(np.float64)
+                model.classes_ = arrays['classes']
+                model.n_features_in_ = model.coef_.shape[1]
+                self.classifier = model
+                self._snapshot_arrays = None
+            return self.classifier
+    
+    def _partial_fit(self, model, X: np.ndarray, y: np.ndarray):
+        """partial_fit с весами классов по всей выборке (class_weight='balanced' тут недоступен)"""
+        if not len(y):
+            return
+        labels = self.training_data.labels
+        positive = max(int(np.count_nonzero(labels)), 1)
+        negative = max(len(labels) - positive, 1)
+        weights = np.where(y == 1, len(labels) / (2 * positive), len(labels) / (2 * negative))
+        model.partial_fit(X, y, classes=np.array([0, 1]), sample_weight=weights)
+    
+    def _calculate_metrics(self, X: np.ndarray, y: np.ndarray, model=None) -> Dict[str, float]:
         """Рассчитывает метрики модели"""
         try:
-            y_pred = self.classifier.predict(X)
+            from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score
+            y_pred = (model or self.classifier).predict(X)
             
             metrics = {
                 'accuracy': accuracy_score(y, y_pred),
@@ -150,39 +373,85 @@ class UniversalMessageClassifier:
             logging.error(f"❌ Ошибка расчета метрик: {e}")
             return {'accuracy': 0.0, 'precision': 0.0, 'recall': 0.0, 'f1': 0.0, 'training_examples': 0}
     
-    def predict(self, text: str) -> Optional[float]:
-        """Предсказывает вероятность для текста"""
-        if not self.is_trained or not self.classifier or not self.sentence_model:
+    def encode(self, texts: List[str]) -> Optional[np.ndarray]:
+        """Эмбеддинги текстов (float32) в том виде, в котором их видит классификатор"""
+        if not self.sentence_model:
             return None
         
         try:
-            # Создаем эмбеддинг
-            embedding = self.sentence_model.encode([text])[0]
-            
-            # Предсказываем вероятность
-            probability = self.classifier.predict_proba([embedding])[0][1]
-            return float(probability)
-            
+            if config.ml.long_text_mode:
+                return self._encode_chunked(texts)
+            return np.asarray(self.sentence_model.encode(texts), dtype=np.float32)
         except Exception as e:
-            logging.error(f"❌ Ошибка предсказания: {e}")
+            logging.error(f"❌ Ошибка создания эмбеддингов: {e}")
             return None
     
-    def predict_batch(self, texts: List[str]) -> List[Optional[float]]:
-        """Предсказывает вероятности для списка текстов"""
-        if not self.is_trained or not self.classifier or not self.sentence_model:
-            return [None] * len(texts)
+    def _encode_chunked(self, texts: List[str]) -> np.ndarray:
+        """Длинные тексты режутся на перекрывающиеся окна токенов; окна всех текстов
+        кодируются одним вызовом, а их эмбеддинги сворачиваются в вектор на текст"""
+        window = config.ml.chunk_tokens or (getattr(self.sentence_model, 'max_seq_length', None) or 128) - 2
+        tokenizer = getattr(self.sentence_model, 'tokenizer', None)
+        chunks, counts = [], []
+        for text in texts:
+            text_chunks = split_windows(
+                text, tokenizer, window=window,
+                overlap=min(config.ml.chunk_overlap, window - 1), max_chunks=config.ml.max_chunks
+            )
+            chunks.extend(text_chunks)
+            counts.append(len(text_chunks))
+        
+        embeddings = np.asarray(self.sentence_model.encode(chunks), dtype=np.float32)
+        if len(chunks) == len(texts):
+            # Все тексты короткие - векторы те же, что и без нарезки
+            return embeddings
+        return pool_chunks(embeddings, counts, config.ml.chunk_pooling)
+    
+    def predict_from_embeddings(self, embeddings: Optional[np.ndarray]) -> List[Optional[float]]:
+        """Предсказывает вероятности по готовым эмбеддингам"""
+        if embeddings is None:
+            return []
+        # Одно чтение ссылки: фоновое обучение подменяет модель целиком
+        scorer = self.scorer
+        if not self.is_trained or scorer is None:
+            return [None] * len(embeddings)
         
         try:
-            # Создаем эмбеддинги
-            embeddings = self.sentence_model.encode(texts)
-            
-            # Предсказываем вероятности
-            probabilities = self.classifier.predict_proba(embeddings)[:, 1]
-            return [float(p) for p in probabilities]
+            return scorer.score(embeddings).tolist()
             
         except Exception as e:
-            logging.error(f"❌ Ошибка batch предсказания: {e}")
+            logging.error(f"❌ Ошибка предсказания: {e}")
+            return [None] * len(embeddings)
+    
+    def predict_with_evidence(self, embeddings: Optional[np.ndarray], k: int = 3) -> Tuple[List[Optional[float]], List[list]]:
+        """Вероятности и ближайшие размеченные примеры (id training_data, сходство, метка)
+
+        Примеры есть только в режимах knn/prototype; для линейной модели списки пустые.
+        """
+        if embeddings is None:
+            return [], []
+        scorer = self.scorer
+        if not isinstance(scorer, NeighborScorer):
+            probabilities = self.predict_from_embeddings(embeddings)
+            return probabilities, [[] for _ in probabilities]
+        
+        try:
+            probabilities, evidence = scorer.explain(embeddings, k)
+            return probabilities.tolist(), evidence
+        except Exception as e:
+            logging.error(f"❌ Ошибка предсказания: {e}")
+            return [None] * len(embeddings), [[] for _ in embeddings]
+    
+    def predict(self, text: str) -> Optional[float]:
+        """Предсказывает вероятность для текста"""
+        return self.predict_batch([text])[0]
+    
+    def predict_batch(self, texts: List[str]) -> List[Optional[float]]:
+        """Предсказывает вероятности для списка текстов"""
+        if not self.is_trained or self.scorer is None or not self.sentence_model:
             return [None] * len(texts)
+        
+        probabilities = self.predict_from_embeddings(self.encode(texts))
+        return probabilities or [None] * len(texts)
     
     def get_stats(self) -> Dict[str, Any]:
         """Получает статистику модели"""
@@ -190,8 +459,14 @@ class UniversalMessageClassifier:
             'is_trained': self.is_trained,
             'training_examples': len(self.training_data),
             'model_name': self.model_name,
-            'sentence_model_loaded': self.sentence_model is not None
+            'sentence_model_loaded': self.sentence_model is not None,
+            'ready': self.is_ready,
+            'classifier_mode': self.mode,
+            'online_learning': self.online,
+            'model_version': self.model_version
         }
+        if self.online and self._online_seen:
+            stats['online_accuracy'] = self._online_correct / self._online_seen
         
         # Добавляем метрики если они есть
         if self.last_metrics:
@@ -210,8 +485,8 @@ class UniversalMessageClassifier:
         if not self.training_data:
             return {'total': 0, 'positive': 0, 'negative': 0, 'balance': 0.0}
         
-        labels = [item['label'] for item in self.training_data]
-        positive_count = sum(labels)
+        labels = self.training_data.labels
+        positive_count = int(np.count_nonzero(labels))
         negative_count = len(labels) - positive_count
         
         return {
@@ -221,6 +496,61 @@ class UniversalMessageClassifier:
             'balance': positive_count / len(self.training_data) if self.training_data else 0.0
         }
     
+    def _load_model_snapshot(self, version: int = None) -> bool:
+        """Загружает снимок модели (по умолчанию текущую версию) и подменяет классификатор"""
+        try:
+            snapshot = self.model_store.activate(version) if version else self.model_store.load()
+            if snapshot is None:
+                return False
+            arrays, meta = snapshot
+            
+            coef = arrays['coef'].reshape(1, -1)
+            if self.training_data.dim not in (None, coef.shape[1]):
+                logging.warning(f"⚠️ Снимок v{meta['version']} от модели с другой размерностью, пропускаем")
+                return False
+            
+            # Для инференса хватает коэффициентов: sklearn не импортируется, пока модель
+            # не понадобится для экспорта; онлайн-режим сначала переобучит ее в SGDClassifier
+            with self._model_lock:
+                self.scorer = LinearScorer.from_snapshot(arrays)
+                self.classifier = None
+                self._snapshot_arrays = arrays
+                self.is_trained = True
+            self.model_version = meta['version']
+            logging.info(f"✅ Загружен снимок модели v{meta['version']} от {meta['created_at']}")
+            return True
+            
+        except Exception as e:
+            logging.error(f"❌ Ошибка загрузки снимка модели: {e}")
+            return False
+    
+    def rollback(self, version: int = None) -> Optional[int]:
+        """Откатывает классификатор к указанной или предыдущей версии, возвращает ее номер
+        
+        Отложенные переобучения снимаются, а идущее сейчас не публикует свою модель.
+        Откат действует до следующего переобучения, которое запустит новая разметка.
+        """
+        if self.mode != 'linear':
+            # Снимки есть только у линейной модели
+            return None
+        if self.online:
+            # Онлайн-модель дообучается на каждой разметке и сразу ушла бы от снимка
+            logging.warning("⚠️ Откат недоступен в режиме онлайн-обучения")
+            return None
+        version = version or self.model_store.previous_version()
+        if version is None or version not in self.model_store.versions():
+            return None
+        
+        cancelled = self.retrain_scheduler.cancel_pending()
+        with self._model_lock:
+            self._rollbacks += 1
+        if not self._load_model_snapshot(version):
+            return None
+        if cancelled:
+            logging.info(f"⏪ Отменено отложенных переобучений: {cancelled}")
+        logging.info(f"⏪ Модель откатена к v{version}; следующая разметка снова запустит переобучение")
+        return version
+    
     def retrain(self) -> bool:
         """Принудительное переобучение модели"""
         logging.info("🔄 Начинаем принудительное переобучение...")
@@ -232,7 +562,7 @@ class UniversalMessageClassifier:
             import pickle
             
             model_data = {
-                'classifier': self.classifier,
+                'classifier': self._estimator(),
                 'model_name': self.model_name,
                 'training_data_count': len(self.training_data),
                 'metrics': self.last_metrics,
@@ -257,9 +587,8 @@ class UniversalMessageClassifier:
             with open(filepath, 'rb') as f:
                 model_data = pickle.load(f)
             
-            self.classifier = model_data['classifier']
+            self._publish(model_data['classifier'])
             self.model_name = model_data.get('model_name', self.model_name)
-            self.is_trained = True
             self.last_metrics = model_data.get('metrics', {})
             
             logging.info(f"✅ Модель импортирована из {filepath}")
@@ -0,0 +1,128 @@
+"""
+Версионированные снимки обученного классификатора в компактном формате .npz
+"""
+import glob
+import json
+import logging
+import os
+import re
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from config import config
+
+
+class ModelStore:
+    """Снимки линейной модели: коэффициенты, смещение и метаданные в одном .npz
+
+    Файлы называются <model_name>-v0001.npz; текущая версия записана в <model_name>-current.json,
+    поэтому откат - это просто переключение указателя. Хранится keep последних версий.
+    """
+
+    def __init__(self, model_name: str, directory: str = None, keep: int = None, db_path: str = None):
+        self.model_name = model_name
+        self.directory = directory or config.ml.model_dir or f'{db_path or config.database.path}.models'
+        self.keep = keep or config.ml.model_keep_versions
+        self._pattern = re.compile(rf'^{re.escape(model_name)}-v(\d+)\.npz$')
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, version: int) -> str:
+        return os.path.join(self.directory, f'{self.model_name}-v{version:04d}.npz')
+
+    @property
+    def _current_path(self) -> str:
+        return os.path.join(self.directory, f'{self.model_name}-current.json')
+
+    def versions(self) -> List[int]:
+        """Номера сохраненных версий по возрастанию"""
+        versions = []
+        for path in glob.glob(os.path.join(self.directory, f'{glob.escape(self.model_name)}-v*.npz')):
+            match = self._pattern.match(os.path.basename(path))
+            if match:
+                versions.append(int(match.group(1)))
+        return sorted(versions)
+
+    def current_version(self) -> Optional[int]:
+        """Версия, на которую указывает указатель (или последняя сохраненная)"""
+        try:
+            with open(self._current_path, 'r', encoding='utf-8') as f:
+                version = int(json.load(f)['version'])
+            if os.path.exists(self._path(version)):
+                return version
+        except (OSError, ValueError, KeyError):
+            pass
+        versions = self.versions()
+        return versions[-1] if versions else None
+
+    def _set_current(self, version: int):
+        tmp_path = f'{self._current_path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': version}, f)
+        os.replace(tmp_path, self._current_path)
+
+    def save(self, model, metrics: Dict[str, Any] = None, **meta) -> Optional[int]:
+        """Сохраняет коэффициенты модели новой версией и делает ее текущей"""
+        try:
+            versions = self.versions()
+            version = versions[-1] + 1 if versions else 1
+            header = {
+                'version': version,
+                'model_name': self.model_name,
+                'estimator': type(model).__name__,
+                'created_at': datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S'),
+                'metrics': {key: float(value) for key, value in (metrics or {}).items()},
+                **meta
+            }
+
+            path = self._path(version)
+            tmp_path = f'{path}.tmp'
+            with open(tmp_path, 'wb') as f:
+                np.savez(
+                    f,
+                    coef=np.asarray(model.coef_, dtype=np.float32),
+                    intercept=np.asarray(model.intercept_, dtype=np.float32),
+                    classes=np.asarray(model.classes_),
+                    meta=np.array(json.dumps(header, ensure_ascii=False))
+                )
+            os.replace(tmp_path, path)
+            self._set_current(version)
+            self._prune(version)
+            return version
+
+        except Exception as e:
+            logging.error(f"❌ Ошибка сохранения снимка модели: {e}")
+            return None
+
+    def _prune(self, current: int):
+        """Удаляет старые версии сверх keep (текущую не трогает)"""
+        for version in self.versions()[:-self.keep]:
+            if version != current:
+                os.remove(self._path(version))
+
+    def load(self, version: int = None) -> Optional[Tuple[Dict[str, np.ndarray], Dict[str, Any]]]:
+        """Читает снимок: (массивы coef/intercept/classes, метаданные)"""
+        version = version or self.current_version()
+        if version is None or not os.path.exists(self._path(version)):
+            return None
+        with np.load(self._path(version), allow_pickle=False) as data:
+            arrays = {key: data[key] for key in ('coef', 'intercept', 'classes')}
+            meta = json.loads(str(data['meta']))
+        return arrays, meta
+
+    def read_meta(self, version: int) -> Dict[str, Any]:
+        """Метаданные версии без чтения коэффициентов"""
+        with np.load(self._path(version), allow_pickle=False) as data:
+            return json.loads(str(data['meta']))
+
+    def activate(self, version: int) -> Optional[Tuple[Dict[str, np.ndarray], Dict[str, Any]]]:
+        """Делает версию текущей (для отката) и возвращает ее снимок"""
+        snapshot = self.load(version)
+        if snapshot is not None:
+            self._set_current(version)
+        return snapshot
+
+    def previous_version(self) -> Optional[int]:
+        """Версия, предшествующая текущей"""
+        current = self.current_version()
+        older = [version for version in self.versions() if current is not None and version < current]
+        return older[-1] if older else None
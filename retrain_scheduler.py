@@ -0,0 +1,120 @@
+"""
+Фоновое переобучение модели с объединением частых запросов
+"""
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List
+from config import config
+
+
+class RetrainScheduler:
+    """Склеивает запросы на переобучение (debounce) и выполняет их в отдельном потоке
+
+    Обучение запускается, когда новых запросов не было debounce секунд, но не позже
+    max_delay секунд после первого необслуженного запроса. Запросы, пришедшие во время
+    обучения, копятся к следующему запуску.
+    """
+
+    def __init__(self, train: Callable[[], bool], debounce_seconds: float = None,
+                 max_delay_seconds: float = None):
+        self._train = train
+        self.debounce = config.ml.retrain_debounce_seconds if debounce_seconds is None else debounce_seconds
+        self.max_delay = config.ml.retrain_max_delay_seconds if max_delay_seconds is None else max_delay_seconds
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopped = False
+        self._first_request = None
+        self._last_request = None
+        self._immediate = False
+        self._waiters: List[Future] = []
+        self.requests = 0
+        self.runs = 0
+
+    def request(self, immediate: bool = False) -> Future:
+        """Запрашивает переобучение; Future получит результат ближайшего запуска"""
+        future = Future()
+        with self._cond:
+            if self._stopped:
+                future.set_result(False)
+                return future
+            now = time.monotonic()
+            if self._first_request is None:
+                self._first_request = now
+            self._last_request = now
+            self._immediate = self._immediate or immediate
+            self._waiters.append(future)
+            self.requests += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='ml-retrain', daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return future
+
+    def _delay_locked(self) -> float:
+        if self._immediate:
+            return 0.0
+        due = min(self._last_request + self.debounce, self._first_request + self.max_delay)
+        return due - time.monotonic()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopped:
+                    if self._first_request is None:
+                        self._cond.wait()
+                        continue
+                    delay = self._delay_locked()
+                    if delay <= 0:
+                        break
+                    self._cond.wait(delay)
+                if self._stopped:
+                    return
+
+                waiters, self._waiters = self._waiters, []
+                coalesced = len(waiters)
+                self._first_request = self._last_request = None
+                self._immediate = False
+
+            try:
+                result = bool(self._train())
+            except Exception as e:
+                logging.error(f"❌ Ошибка фонового переобучения: {e}")
+                result = False
+
+            self.runs += 1
+            if coalesced > 1:
+                logging.info(f"🔄 Переобучение выполнено по {coalesced} запросам")
+            for future in waiters:
+                future.set_result(result)
+
+    def cancel_pending(self) -> int:
+        """Снимает необслуженные запросы (их Future получают False), возвращает их число
+
+        Уже идущее обучение не прерывается.
+        """
+        with self._cond:
+            waiters, self._waiters = self._waiters, []
+            self._first_request = self._last_request = None
+            self._immediate = False
+        for future in waiters:
+            future.set_result(False)
+        return len(waiters)
+
+    def stop(self, timeout: float = 5.0):
+        """Останавливает поток; необслуженные запросы завершаются с результатом False"""
+        with self._cond:
+            self._stopped = True
+            waiters, self._waiters = self._waiters, []
+            self._cond.notify()
+        for future in waiters:
+            future.set_result(False)
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def get_stats(self) -> Dict[str, int]:
+        """Статистика запросов и запусков"""
+        with self._cond:
+            pending = len(self._waiters)
+        return {'requests': self.requests, 'runs': self.runs, 'pending': pending}
@@ -0,0 +1,52 @@
+"""
+Замер длительности фаз запуска и сводка по ним в лог
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+
+class StartupTimer:
+    """Длительности фаз запуска, в том числе идущих в фоновых потоках
+
+    Фазы загрузки модели идут параллельно с подключением клиента, поэтому сумма фаз
+    может быть больше общего времени от старта процесса.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name: str):
+        """Замеряет блок кода как фазу name (повторные замеры складываются)"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def record(self, name: str, seconds: float):
+        with self._lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def elapsed(self) -> float:
+        """Секунды с момента создания таймера (импорта модуля)"""
+        return time.perf_counter() - self.started
+
+    def summary(self) -> str:
+        with self._lock:
+            phases = list(self.phases.items())
+        parts = ', '.join(f"{name} {seconds:.2f} с" for name, seconds in phases)
+        return f"{parts or 'нет фаз'}; с начала запуска {self.elapsed():.2f} с"
+
+    def report(self, title: str):
+        """Пишет в лог сводку по всем замеренным на данный момент фазам"""
+        logging.info(f"⏱️ {title}: {self.summary()}")
+
+
+# Общий таймер процесса: фазы пишут main_universal, бот и загрузчик модели
+startup_timer = StartupTimer()
@@ -0,0 +1,208 @@
+"""
+Подписки получателей: свои ключевые фразы, пороги и классификаторы, оценка всех подписок за один проход
+"""
+import json
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+import numpy as np
+from config import config
+from model_store import ModelStore
+from vector_index import normalize_rows
+
+# Значение поля classifier, при котором используется вероятность основного классификатора
+GLOBAL_CLASSIFIER = 'global'
+
+
+@dataclass
+class Subscription:
+    name: str
+    targets: List[str]
+    keywords: List[str] = field(default_factory=list)
+    threshold: float = None
+    # Имя снимка в ModelStore, 'global' - основной классификатор, '' - только ключевые фразы
+    classifier: str = ''
+    # Пересылать сообщения о полном цикле независимо от сходства
+    full_cycle: bool = True
+
+    def __post_init__(self):
+        if self.threshold is None:
+            self.threshold = config.ml.similarity_threshold
+
+
+def load_subscriptions(path: str = None) -> List[Subscription]:
+    """Читает подписки из JSON-файла; без файла - одна общая подписка на TARGET_USER_IDS"""
+    path = path if path is not None else config.subscriptions.path
+    if not path:
+        return [Subscription(
+            name='default',
+            targets=list(config.business.target_user_ids),
+            keywords=list(config.business.keywords),
+            classifier=GLOBAL_CLASSIFIER
+        )]
+
+    with open(path, 'r', encoding='utf-8') as f:
+        items = json.load(f)
+    subscriptions = []
+    for number, item in enumerate(items, 1):
+        subscriptions.append(Subscription(
+            name=str(item.get('name') or f'subscription_{number}'),
+            targets=[str(target) for target in item.get('targets', [])],
+            keywords=[str(keyword) for keyword in item.get('keywords', [])],
+            threshold=item.get('threshold'),
+            classifier=item.get('classifier', ''),
+            full_cycle=item.get('full_cycle', True)
+        ))
+    logging.info(f"✅ Загружено подписок: {len(subscriptions)} из {path}")
+    return subscriptions
+
+
+def route_by_rules(subscriptions: List[Subscription], texts: List[str],
+                   is_full_cycle: List[bool]) -> List[List[Dict[str, Any]]]:
+    """Маршрутизация без модели предложений: дословное вхождение фраз подписки или полный цикл"""
+    routes = []
+    for text, full_cycle in zip(texts, is_full_cycle):
+        text_lower = (text or '').lower()
+        matched = []
+        for subscription in subscriptions:
+            mentioned = any(keyword.lower() in text_lower for keyword in subscription.keywords if keyword)
+            if mentioned or (full_cycle and subscription.full_cycle):
+                matched.append({
+                    'subscription': subscription.name,
+                    'targets': subscription.targets,
+                    'similarity': 1.0 if mentioned else 0.0,
+                    'ml_probability': None
+                })
+        routes.append(matched)
+    return routes
+
+
+class SubscriptionRouter:
+    """Оценивает сообщения сразу по всем подпискам и решает, кому их доставить
+
+    Уникальные фразы всех подписок лежат в одной нормированной матрице, поэтому сходство
+    пачки текстов со всеми фразами - одно умножение, а максимум по фразам каждой подписки
+    берется через np.maximum.reduceat. Линейные классификаторы подписок сложены в матрицу
+    весов и тоже считаются одним умножением.
+    """
+
+    def __init__(self, model, subscriptions: List[Subscription], db_path: str = None):
+        self.subscriptions = subscriptions
+        self.thresholds = np.array([s.threshold for s in subscriptions], dtype=np.float32)
+        self.full_cycle = np.array([s.full_cycle for s in subscriptions], dtype=bool)
+        self.uses_global = np.array([s.classifier == GLOBAL_CLASSIFIER for s in subscriptions], dtype=bool)
+
+        # Столбцы фраз, сгруппированные по подпискам; подписки без фраз в матрицу не попадают
+        phrases = list(dict.fromkeys(kw.lower() for s in subscriptions for kw in s.keywords))
+        position = {phrase: i for i, phrase in enumerate(phrases)}
+        self._columns = np.array(
+            [position[kw.lower()] for s in subscriptions for kw in dict.fromkeys(s.keywords)], dtype=np.int64
+        )
+        counts = np.array([len(dict.fromkeys(s.keywords)) for s in subscriptions], dtype=np.int64)
+        self._with_keywords = counts > 0
+        self._starts = (np.cumsum(counts) - counts)[self._with_keywords]
+        self._phrases = phrases
+        self._keyword_matrix = normalize_rows(model.encode(phrases)) if phrases else None
+
+        self._load_classifiers(db_path)
+
+    def _load_classifiers(self, db_path: str = None):
+        """Складывает коэффициенты классификаторов подписок в матрицу (s, d)"""
+        self._weights = None
+        self._has_classifier = np.zeros(len(self.subscriptions), dtype=bool)
+        rows = {}
+        for i, subscription in enumerate(self.subscriptions):
+            name = subscription.classifier
+            if not name or name == GLOBAL_CLASSIFIER:
+                continue
+            try:
+                snapshot = ModelStore(name, db_path=db_path).load()
+            except Exception as e:
+                logging.error(f"❌ Ошибка загрузки классификатора {name} подписки {subscription.name}: {e}")
+                snapshot = None
+            if snapshot is None:
+                logging.warning(f"⚠️ Нет снимка классификатора {name}, подписка {subscription.name} работает по фразам")
+                continue
+            arrays, _ = snapshot
+            rows[i] = (arrays['coef'].ravel(), float(np.ravel(arrays['intercept'])[0]))
+
+        if not rows:
+            return
+        dim = next(iter(rows.values()))[0].shape[0]
+        self._weights = np.zeros((len(self.subscriptions), dim), dtype=np.float32)
+        self._biases = np.zeros(len(self.subscriptions), dtype=np.float32)
+        for i, (coef, intercept) in rows.items():
+            if coef.shape[0] != dim:
+                logging.warning(f"⚠️ Классификатор подписки {self.subscriptions[i].name} другой размерности, пропускаем")
+                continue
+            self._weights[i] = coef
+            self._biases[i] = intercept
+            self._has_classifier[i] = True
+
+    def __len__(self) -> int:
+        return len(self.subscriptions)
+
+    @property
+    def has_classifiers(self) -> bool:
+        """Есть ли подписки со своими классификаторами (им нужны эмбеддинги сообщений)"""
+        return bool(self._has_classifier.any())
+
+    @property
+    def phrase_count(self) -> int:
+        return len(self._phrases)
+
+    def keyword_scores(self, text_embeddings: np.ndarray) -> np.ndarray:
+        """Максимальное сходство каждого текста с фразами каждой подписки: (n, s)"""
+        scores = np.zeros((len(text_embeddings), len(self.subscriptions)), dtype=np.float32)
+        if self._keyword_matrix is None or not len(text_embeddings):
+            return scores
+        similarities = normalize_rows(text_embeddings) @ self._keyword_matrix.T
+        scores[:, self._with_keywords] = np.maximum.reduceat(similarities[:, self._columns], self._starts, axis=1)
+        return scores
+
+    def probabilities(self, embeddings: Optional[np.ndarray], global_probabilities: List[Optional[float]]) -> np.ndarray:
+        """Вероятности классификаторов подписок: (n, s), NaN - у подписки нет классификатора"""
+        count = len(global_probabilities)
+        result = np.full((count, len(self.subscriptions)), np.nan, dtype=np.float32)
+        if self._weights is not None and embeddings is not None and count:
+            z = np.asarray(embeddings, dtype=np.float32) @ self._weights.T + self._biases
+            result[:, self._has_classifier] = (0.5 * (1.0 + np.tanh(0.5 * z)))[:, self._has_classifier]
+        if self.uses_global.any():
+            global_column = np.array([np.nan if p is None else p for p in global_probabilities], dtype=np.float32)
+            result[:, self.uses_global] = global_column[:, None]
+        return result
+
+    def route(self, keyword_embeddings: np.ndarray, embeddings: Optional[np.ndarray],
+              global_probabilities: List[Optional[float]], is_full_cycle: List[bool]) -> List[List[Dict[str, Any]]]:
+        """Для каждого сообщения - список сработавших подписок со своими оценками
+
+        Решение подписки: вероятность ее классификатора > 0.5, а без классификатора -
+        сходство с ее фразами выше порога или полный цикл (если он включен в подписке).
+        """
+        similarities = self.keyword_scores(keyword_embeddings)
+        probabilities = self.probabilities(embeddings, global_probabilities)
+        has_probability = ~np.isnan(probabilities)
+        by_rules = (similarities > self.thresholds) | (np.asarray(is_full_cycle, dtype=bool)[:, None] & self.full_cycle)
+        decisions = np.where(has_probability, np.nan_to_num(probabilities) > 0.5, by_rules)
+
+        routes = []
+        for row, columns in enumerate(decisions):
+            matched = []
+            for i in np.flatnonzero(columns):
+                matched.append({
+                    'subscription': self.subscriptions[i].name,
+                    'targets': self.subscriptions[i].targets,
+                    'similarity': float(similarities[row, i]),
+                    'ml_probability': float(probabilities[row, i]) if has_probability[row, i] else None
+                })
+            routes.append(matched)
+        return routes
+
+    @staticmethod
+    def recipients(matched: List[Dict[str, Any]]) -> Dict[str, List[str]]:
+        """Получатель -> имена подписок, по которым ему доставляется сообщение"""
+        recipients = {}
+        for match in matched:
+            for target in match['targets']:
+                recipients.setdefault(target, []).append(match['subscription'])
+        return recipients
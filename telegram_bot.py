@@ -1,33 +1,61 @@
 """
 Модуль для работы с Telegram API
 """
+import asyncio
 import logging
 import os
-from typing import List, Optional, Dict, Any
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Dict, Any, Tuple
 from telethon import TelegramClient, events
 from telethon.sessions import StringSession
 from telethon.tl.types import User, Chat, Channel
 from config import config
 from database import DatabaseManager
+from db_writer import BatchedMessageWriter
+from bot_stats import DailyStatsCounter, hour_bucket
+from entity_cache import EntityInfoCache
 from ml_classifier import UniversalMessageClassifier
+from message_index import MessageIndex
+from subscriptions import SubscriptionRouter, load_subscriptions, route_by_rules
+from startup_timer import startup_timer
 
 class TelegramBot:
     """Основной класс Telegram бота"""
     
-    def __init__(self, db_manager: DatabaseManager = None, classifier: UniversalMessageClassifier = None):
+    # Сколько последних сообщений помнить для отсева повторов между догрузкой и живым режимом
+    PROCESSED_CACHE_SIZE = 10000
+    
+    def __init__(self, db_manager: DatabaseManager = None, classifier: UniversalMessageClassifier = None,
+                 client: TelegramClient = None):
         self.db_manager = db_manager or DatabaseManager()
         self.classifier = classifier or UniversalMessageClassifier(db_manager=self.db_manager)
-        self.client = None
-        self.processed_messages = set()
-        self.daily_stats = {
-            'processed': 0,
-            'forwarded': 0,
-            'rejected': 0,
-            'training_examples': 0
-        }
+        self.client = client
+        # Индекс похожих сообщений пополняется после записи каждой пачки
+        self.message_index = None
+        if config.ml.similar_index and config.ml.store_embeddings:
+            self.message_index = MessageIndex(self.db_manager)
+        # Подписки с собственными фразами и порогами (без SUBSCRIPTIONS_FILE - общая выдача);
+        # матрица фраз строится, когда загрузится модель предложений
+        self.subscriptions = None
+        self._subscription_list = load_subscriptions() if config.subscriptions.path else None
+        self.message_writer = BatchedMessageWriter(
+            self.db_manager,
+            on_commit=self.message_index.add_records if self.message_index else None
+        )
+        # Недавно обработанные (chat_id, message_id): ID сообщений уникальны только внутри чата
+        self.processed_messages = OrderedDict()
+        self.entity_cache = EntityInfoCache(config.telegram.entity_cache_size)
+        # Пока идет догрузка пропущенных сообщений, новые события копятся здесь
+        self._live_buffer = None
+        self.daily_stats = DailyStatsCounter()
+        self._stats_task = None
+        self._maintenance_task = None
         
-        # Инициализируем клиент
-        self._init_client()
+        # Инициализируем клиент, если он не передан снаружи (например, в оффлайн-стендах)
+        if self.client is None:
+            self._init_client()
     
     def _init_client(self):
         """Инициализирует Telegram клиент"""
@@ -56,22 +84,40 @@ class TelegramBot:
             return False
         
         try:
-            # Сохраняем сессию при первом запуске
-            if not os.path.exists(config.telegram.session_file):
-                await self.client.start(phone=config.telegram.phone_number)
-                with open(config.telegram.session_file, 'w') as f:
-                    f.write(self.client.session.save())
-                logging.info("✅ Сессия сохранена")
-            else:
-                await self.client.start()
+            # Индекс похожих сообщений строится в фоне, пока клиент подключается
+            if self.message_index:
+                self.message_index.rebuild_async()
+            
+            with startup_timer.phase('подключение'):
+                await self.connect()
             
             # Предварительная загрузка сущностей пользователей
-            await self._preload_user_entities()
+            with startup_timer.phase('сущности'):
+                await self._preload_user_entities()
             
-            # Регистрируем обработчики
-            self._register_handlers()
+            # Периодически сбрасываем статистику в БД
+            self._stats_task = asyncio.ensure_future(self._stats_flush_loop())
+            # И порциями чистим устаревшие данные
+            self._maintenance_task = asyncio.ensure_future(self._maintenance_loop())
             
+            # Границы пропуска фиксируем до того, как живые сообщения попадут в БД
+            last_ids = self.db_manager.get_last_message_ids() if config.catchup.enabled else None
+            
+            # Пока модель загружается, живые сообщения обрабатываются по правилам
+            self._register_handlers()
             logging.info("🚀 Бот запущен!")
+            startup_timer.report('Бот принимает сообщения')
+            
+            if config.catchup.enabled:
+                # Пропущенные сообщения классифицируем полной моделью; живые
+                # сообщения буферизуются до конца догрузки
+                with startup_timer.phase('ожидание модели'):
+                    await self.wait_for_model()
+                self._live_buffer = []
+                with startup_timer.phase('догрузка'):
+                    await self.catch_up(last_ids)
+                startup_timer.report('Запуск завершен')
+            
             logging.info(f"📊 Статистика модели: {self.classifier.get_stats()}")
             
             return True
@@ -80,6 +126,169 @@ class TelegramBot:
             logging.error(f"❌ Ошибка запуска бота: {e}")
             return False
     
+    async def wait_for_model(self) -> bool:
+        """Ждет фоновой загрузки модели, не блокируя event loop"""
+        if self.classifier.is_ready:
+            return True
+        logging.info("⏳ Ожидание загрузки модели...")
+        return await asyncio.get_running_loop().run_in_executor(None, self.classifier.wait_ready)
+    
+    async def connect(self):
+        """Подключает клиент и сохраняет сессию при первом запуске"""
+        if not os.path.exists(config.telegram.session_file):
+            await self.client.start(phone=config.telegram.phone_number)
+            with open(config.telegram.session_file, 'w') as f:
+                f.write(self.client.session.save())
+            logging.info("✅ Сессия сохранена")
+        else:
+            await self.client.start()
+    
+    async def _stats_flush_loop(self):
+        """Фоновый сброс накопленной статистики в БД"""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(config.stats.flush_interval_seconds)
+            try:
+                await loop.run_in_executor(None, self.daily_stats.flush, self.db_manager)
+            except Exception as e:
+                logging.error(f"❌ Ошибка сброса статистики: {e}")
+    
+    async def _maintenance_loop(self):
+        """Фоновая очистка по срокам хранения и возврат свободного места порциями"""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(config.retention.interval_hours * 3600)
+            try:
+                deleted = await loop.run_in_executor(None, self.db_manager.apply_retention)
+                await loop.run_in_executor(None, self.db_manager.incremental_vacuum)
+                if self.message_index and deleted.get('message_embeddings'):
+                    # Выбрасываем из индекса векторы с истекшим сроком хранения
+                    self.message_index.rebuild_async()
+            except Exception as e:
+                logging.error(f"❌ Ошибка обслуживания базы данных: {e}")
+    
+    async def catch_up(self, last_ids: Dict[int, int] = None) -> Dict[str, Any]:
+        """Классифицирует сообщения, пропущенные за время простоя, затем включает живой режим"""
+        summary = {'chats': 0, 'scanned': 0, 'forwarded': 0, 'seconds': 0.0}
+        started = time.perf_counter()
+        
+        try:
+            if last_ids is None:
+                last_ids = self.db_manager.get_last_message_ids()
+            if last_ids:
+                logging.info(f"⏪ Догрузка пропущенных сообщений по {len(last_ids)} чатам...")
+                # Заполняем кэш сущностей, чтобы iter_messages работал по числовым ID
+                await self.client.get_dialogs()
+                
+                semaphore = asyncio.Semaphore(max(1, config.catchup.concurrency))
+                results = await asyncio.gather(*[
+                    self._catch_up_chat(chat_id, last_id, semaphore)
+                    for chat_id, last_id in last_ids.items()
+                ])
+                for chat_stats in results:
+                    if chat_stats['scanned']:
+                        summary['chats'] += 1
+                    summary['scanned'] += chat_stats['scanned']
+                    summary['forwarded'] += chat_stats['forwarded']
+        except Exception as e:
+            logging.error(f"❌ Ошибка догрузки пропущенных сообщений: {e}")
+        finally:
+            await self._drain_live_buffer()
+        
+        summary['seconds'] = time.perf_counter() - started
+        logging.info(
+            f"✅ Догрузка завершена за {summary['seconds']:.1f} с: чатов {summary['chats']}, "
+            f"сообщений {summary['scanned']}, переслано {summary['forwarded']}"
+        )
+        return summary
+    
+    async def _catch_up_chat(self, chat_id: int, last_id: int, semaphore: asyncio.Semaphore) -> Dict[str, int]:
+        """Догружает пропуск в одном чате и прогоняет его через пакетный конвейер"""
+        stats = {'scanned': 0, 'forwarded': 0}
+        async with semaphore:
+            try:
+                # Берем самые новые сообщения пропуска, обрабатываем от старых к новым
+                missed = [
+                    message async for message in self.client.iter_messages(
+                        chat_id, min_id=last_id, limit=config.catchup.max_messages_per_chat
+                    )
+                ]
+                missed.reverse()
+                if missed:
+                    self._warn_truncated_gap(chat_id, last_id, missed)
+                
+                page_size = config.backfill.page_size
+                for start in range(0, len(missed), page_size):
+                    chunk = missed[start:start + page_size]
+                    page = [
+                        message for message in chunk
+                        if not message.out and not self._is_processed(chat_id, message.id)
+                    ]
+                    stats['scanned'] += len(page)
+                    stats['forwarded'] += await self._process_history_page(page)
+                    # Чекпоинт пишется после записей страницы, отклоненные повторно не классифицируются
+                    self.message_writer.mark_processed(chat_id, chunk[-1].id)
+                
+                if missed:
+                    logging.info(f"⏪ Чат {chat_id}: догружено {stats['scanned']}, переслано {stats['forwarded']}")
+            except Exception as e:
+                logging.error(f"❌ Ошибка догрузки чата {chat_id}: {e}")
+        return stats
+    
+    def _warn_truncated_gap(self, chat_id: int, last_id: int, missed: list):
+        """Предупреждает, что догрузка уперлась в лимит и старая часть пропуска не прочитана"""
+        limit = config.catchup.max_messages_per_chat
+        oldest_id = missed[0].id
+        if len(missed) >= limit and oldest_id > last_id + 1:
+            logging.warning(
+                f"⚠️ Чат {chat_id}: пропуск длиннее лимита CATCHUP_MAX_MESSAGES={limit}, "
+                f"около {oldest_id - last_id - 1} сообщений (ID {last_id + 1}..{oldest_id - 1}) "
+                f"не классифицированы"
+            )
+    
+    def _is_processed(self, chat_id: int, message_id: int) -> bool:
+        return (chat_id, message_id) in self.processed_messages
+    
+    def _mark_seen(self, chat_id: int, message_id: int):
+        """Запоминает сообщение как обработанное, вытесняя самые старые записи"""
+        key = (chat_id, message_id)
+        self.processed_messages[key] = True
+        self.processed_messages.move_to_end(key)
+        while len(self.processed_messages) > self.PROCESSED_CACHE_SIZE:
+            self.processed_messages.popitem(last=False)
+    
+    async def _process_history_page(self, page) -> int:
+        """Обрабатывает страницу пропущенных сообщений как живые, возвращает число пересланных"""
+        if not page:
+            return 0
+        
+        for message in page:
+            self._mark_seen(message.chat_id, message.id)
+        
+        classified = await self.classify_batch(page)
+        saved = self.message_writer.submit_many([record for _, _, record in classified if record])
+        
+        if any(analysis['should_forward'] for _, analysis, _ in classified):
+            await self.message_writer.wait(saved)
+        
+        forwarded = 0
+        for message, analysis, record in classified:
+            if analysis['should_forward']:
+                await self._deliver(message, analysis, record)
+                self.daily_stats.record(message.chat_id, analysis['reason'], 'forwarded', message.date)
+                forwarded += 1
+            else:
+                self.daily_stats.record(message.chat_id, analysis['reason'], 'rejected', message.date)
+        return forwarded
+    
+    async def _drain_live_buffer(self):
+        """Переключает бота в живой режим и обрабатывает накопленные события"""
+        buffered, self._live_buffer = self._live_buffer or [], None
+        if buffered:
+            logging.info(f"▶️ Обработка {len(buffered)} сообщений, пришедших во время догрузки")
+        for event in buffered:
+            await self._handle_message(event)
+    
     async def _preload_user_entities(self):
         """Предварительно загружает сущности пользователей"""
         try:
@@ -127,6 +336,18 @@ class TelegramBot:
         async def wrong_handler(event):
             await self._handle_wrong_command(event)
         
+        @self.client.on(events.NewMessage(pattern=r'/similar_(\d+)'))
+        async def similar_handler(event):
+            await self._handle_similar_command(event)
+        
+        @self.client.on(events.NewMessage(pattern=r'/search(?:\s+(.+))?'))
+        async def search_handler(event):
+            await self._handle_search_command(event)
+        
+        @self.client.on(events.NewMessage(pattern=r'/rollback(?:_(\d+))?'))
+        async def rollback_handler(event):
+            await self._handle_rollback_command(event)
+        
         @self.client.on(events.NewMessage(pattern='/clear_history'))
         async def clear_history_handler(event):
             await self._handle_clear_history_command(event)
@@ -144,7 +365,8 @@ class TelegramBot:
         """Обработчик команды /train"""
         try:
             if len(self.classifier.training_data) >= config.ml.min_training_examples:
-                success = self.classifier.retrain()
+                logging.info("🔄 Начинаем принудительное переобучение...")
+                success = await asyncio.wrap_future(self.classifier.request_retrain(immediate=True))
                 if success:
                     stats = self.classifier.get_stats()
                     response = (
@@ -171,12 +393,22 @@ class TelegramBot:
             ml_stats = self.classifier.get_stats()
             training_stats = self.classifier.get_training_data_stats()
             
-            # Статистика бота
-            bot_stats = self.db_manager.get_stats_summary(7)
+            # Статистика бота (сначала сбрасываем накопленные счетчики)
+            await self._in_executor(self.daily_stats.flush, self.db_manager)
+            bot_stats = await self._in_executor(self.db_manager.get_stats_summary, 7)
+            
+            # Последние 24 часа из часовых роллапов
+            since = hour_bucket(datetime.now(timezone.utc) - timedelta(hours=23))
+            last_day = await self._in_executor(self.db_manager.get_rollup_summary, since)
+            reasons = '\n'.join(
+                f"• {reason}: {item['processed']} (переслано {item['forwarded']})"
+                for reason, item in list(last_day.get('by_reason', {}).items())[:6]
+            )
             
             response = (
                 f"📊 **Статистика модели:**\n"
-                f"• Обучена: {'✅' if ml_stats['is_trained'] else '❌'}\n"
+                f"• Обучена: {'✅' if ml_stats['is_trained'] else '❌'}"
+                f"{' (v' + str(ml_stats['model_version']) + ')' if ml_stats.get('model_version') else ''}\n"
                 f"• Примеров: {ml_stats['training_examples']}\n"
                 f"• Точность: {ml_stats.get('accuracy', 0):.2%}\n"
                 f"• F1-мера: {ml_stats.get('f1_score', 0):.2%}\n\n"
@@ -188,7 +420,11 @@ class TelegramBot:
                 f"• Обработано: {bot_stats.get('total_processed', 0)}\n"
                 f"• Переслано: {bot_stats.get('total_forwarded', 0)}\n"
                 f"• Отклонено: {bot_stats.get('total_rejected', 0)}\n"
-                f"• Процент пересылки: {bot_stats.get('forward_rate', 0):.1%}"
+                f"• Процент пересылки: {bot_stats.get('forward_rate', 0):.1%}\n\n"
+                f"⏱ **Последние 24 часа:**\n"
+                f"• Обработано: {last_day.get('processed', 0)}\n"
+                f"• Переслано: {last_day.get('forwarded', 0)}\n"
+                f"{reasons}"
             )
             
             await event.reply(response)
@@ -198,15 +434,17 @@ class TelegramBot:
             await event.reply("❌ Ошибка получения статистики")
     
     async def _handle_correct_command(self, event):
-        """Обработчик команды /correct_<id>"""
+        """Обработчик команды /correct_<id> (id - номер записи в истории)"""
         try:
-            msg_id = int(event.pattern_match.group(1))
-            message_data = self.db_manager.get_message(msg_id)
+            row_id = int(event.pattern_match.group(1))
+            message_data = await self._in_executor(self.db_manager.get_message_by_id, row_id)
             
             if message_data:
-                success = self.classifier.add_training_example(message_data['text'], 1)
+                success = self.classifier.add_training_example(
+                    message_data['text'], 1, await self._stored_embedding(message_data)
+                )
                 if success:
-                    self.daily_stats['training_examples'] += 1
+                    self.daily_stats.increment('training_examples')
                     await event.reply("✅ Добавлен положительный пример обучения!")
                 else:
                     await event.reply("❌ Ошибка добавления примера")
@@ -218,15 +456,17 @@ class TelegramBot:
             await event.reply("❌ Используйте: /correct_12345")
     
     async def _handle_wrong_command(self, event):
-        """Обработчик команды /wrong_<id>"""
+        """Обработчик команды /wrong_<id> (id - номер записи в истории)"""
         try:
-            msg_id = int(event.pattern_match.group(1))
-            message_data = self.db_manager.get_message(msg_id)
+            row_id = int(event.pattern_match.group(1))
+            message_data = await self._in_executor(self.db_manager.get_message_by_id, row_id)
             
             if message_data:
-                success = self.classifier.add_training_example(message_data['text'], 0)
+                success = self.classifier.add_training_example(
+                    message_data['text'], 0, await self._stored_embedding(message_data)
+                )
                 if success:
-                    self.daily_stats['training_examples'] += 1
+                    self.daily_stats.increment('training_examples')
                     await event.reply("✅ Добавлен отрицательный пример обучения!")
                 else:
                     await event.reply("❌ Ошибка добавления примера")
@@ -237,11 +477,122 @@ class TelegramBot:
             logging.error(f"❌ Ошибка обработки команды /wrong: {e}")
             await event.reply("❌ Используйте: /wrong_12345")
     
+    async def _handle_rollback_command(self, event):
+        """Обработчик команды /rollback[_<версия>]"""
+        try:
+            if self.classifier.online:
+                await event.reply("❌ Откат недоступен в режиме онлайн-обучения (ML_ONLINE_LEARNING)")
+                return
+            
+            requested = event.pattern_match.group(1)
+            version = self.classifier.rollback(int(requested) if requested else None)
+            if version is None:
+                versions = ', '.join(f"v{v}" for v in self.classifier.model_store.versions()) or 'нет'
+                await event.reply(f"❌ Нет версии для отката. Сохраненные версии: {versions}")
+                return
+            
+            metrics = self.classifier.model_store.read_meta(version).get('metrics', {})
+            await event.reply(
+                f"⏪ Модель откатена к версии v{version}\n"
+                f"📊 Точность: {metrics.get('accuracy', 0):.2%}, F1: {metrics.get('f1', 0):.2%}"
+            )
+            
+        except Exception as e:
+            logging.error(f"❌ Ошибка обработки команды /rollback: {e}")
+            await event.reply("❌ Используйте: /rollback или /rollback_<версия>")
+    
+    async def _handle_search_command(self, event):
+        """Обработчик команды /search <запрос>"""
+        try:
+            query = (event.pattern_match.group(1) or '').strip()
+            if not query:
+                await event.reply("❌ Используйте: /search <запрос>")
+                return
+            
+            results = await self._in_executor(self.db_manager.search_messages, query, 10)
+            if not results:
+                await event.reply(f"🔍 По запросу «{query}» ничего не найдено")
+                return
+            
+            lines = [f"🔍 **Результаты по запросу «{query}»:**\n"]
+            for number, result in enumerate(results, 1):
+                forwarded = " 📤" if result['forwarded'] else ""
+                lines.append(
+                    f"{number}. {result['chat_title'] or result['chat_id']} · {result['message_date']}{forwarded}\n"
+                    f"{result['snippet']}\n"
+                    f"{self._label_links(result['id'])}\n"
+                )
+            await event.reply("\n".join(lines))
+            
+        except Exception as e:
+            logging.error(f"❌ Ошибка обработки команды /search: {e}")
+            await event.reply("❌ Ошибка поиска")
+    
+    async def _handle_similar_command(self, event):
+        """Обработчик команды /similar_<id> (id - номер записи в истории)"""
+        try:
+            if not self.message_index:
+                await event.reply("❌ Поиск похожих выключен (ML_SIMILAR_INDEX, ML_STORE_EMBEDDINGS)")
+                return
+            
+            row_id = int(event.pattern_match.group(1))
+            message_data = await self._in_executor(self.db_manager.get_message_by_id, row_id)
+            if not message_data:
+                await event.reply("❌ Сообщение не найдено в истории")
+                return
+            
+            loop = asyncio.get_running_loop()
+            neighbours = await loop.run_in_executor(
+                None, self.message_index.similar, message_data['chat_id'], message_data['message_id'], 10
+            )
+            if neighbours is None:
+                await event.reply("❌ Для сообщения нет сохраненного эмбеддинга")
+                return
+            
+            lines = [f"🧭 **Похожие на сообщение {row_id}:**\n"]
+            for chat_id, message_id, score in neighbours:
+                found = await self._in_executor(self.db_manager.get_message, message_id, chat_id)
+                if not found:
+                    # Сообщение удалено по сроку хранения, а индекс еще не пересобран
+                    continue
+                forwarded = " 📤" if found['forwarded'] else ""
+                text = found['text'][:120] + ("…" if len(found['text']) > 120 else "")
+                lines.append(
+                    f"{len(lines)}. {score:.3f} · {found['chat_title'] or chat_id} · {found['message_date']}{forwarded}\n"
+                    f"{text}\n"
+                    f"{self._label_links(found['id'])}\n"
+                )
+            if len(lines) == 1:
+                await event.reply("🧭 Похожих сообщений не найдено")
+                return
+            await event.reply("\n".join(lines))
+            
+        except Exception as e:
+            logging.error(f"❌ Ошибка обработки команды /similar: {e}")
+            await event.reply("❌ Используйте: /similar_12345")
+    
+    @staticmethod
+    def _label_links(row_id: int) -> str:
+        """Команды разметки по номеру записи в истории (ID сообщений повторяются в разных чатах)"""
+        return f"/correct_{row_id} · /wrong_{row_id} · /similar_{row_id}"
+    
+    async def _stored_embedding(self, message_data: Dict[str, Any]):
+        """Эмбеддинг, посчитанный при классификации сообщения (None, если не сохранялся)"""
+        return await self._in_executor(
+            self.db_manager.get_message_embedding, message_data['message_id'], message_data.get('chat_id')
+        )
+    
+    @staticmethod
+    async def _in_executor(func, *args):
+        """Выполняет блокирующий вызов (чтение из БД) в пуле потоков, не останавливая event loop"""
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+    
     async def _handle_clear_history_command(self, event):
         """Обработчик команды /clear_history"""
         try:
             # Очищаем старые данные (старше 30 дней)
-            success = self.db_manager.clear_old_data(30)
+            loop = asyncio.get_running_loop()
+            success = await loop.run_in_executor(None, self.db_manager.clear_old_data, 30)
             if success:
                 await event.reply("✅ История сообщений очищена!")
             else:
@@ -261,8 +612,12 @@ class TelegramBot:
             f"• `/train` - переобучение модели\n"
             f"• `/correct_<id>` - отметить сообщение как релевантное\n"
             f"• `/wrong_<id>` - отметить сообщение как нерелевантное\n"
+            f"• `/search <запрос>` - поиск по истории сообщений\n"
+            f"• `/similar_<id>` - похожие сообщения из истории\n"
+            f"• `/rollback[_<версия>]` - откатить модель к предыдущей версии\n"
             f"• `/clear_history` - очистить старую историю\n"
-            f"• `/help` - эта справка\n\n"
+            f"• `/help` - эта справка\n"
+            f"`<id>` - номер записи из ссылок под пересланным сообщением\n\n"
             f"🔍 **Ключевые слова:** {', '.join(config.business.keywords[:5])}...\n"
             f"🎯 **Порог сходства:** {config.ml.similarity_threshold}\n"
             f"📚 **Примеров для обучения:** {len(self.classifier.training_data)}"
@@ -272,6 +627,10 @@ class TelegramBot:
     
     async def _handle_message(self, event):
         """Основной обработчик сообщений"""
+        if self._live_buffer is not None:
+            self._live_buffer.append(event)
+            return
+        
         try:
             await self._process_message(event)
         except Exception as e:
@@ -280,136 +639,296 @@ class TelegramBot:
     async def _process_message(self, event):
         """Обрабатывает входящее сообщение"""
         # Пропускаем свои сообщения и уже обработанные
-        if event.message.out or event.message.id in self.processed_messages:
+        if event.message.out or self._is_processed(event.message.chat_id, event.message.id):
             return
         
-        self.processed_messages.add(event.message.id)
-        self.daily_stats['processed'] += 1
+        self._mark_seen(event.message.chat_id, event.message.id)
         
-        message_text = event.message.text or ""
+        message = event.message
+        message_text = message.text or ""
         
         # Проверяем фильтры
-        if not self._passes_filters(message_text):
-            self.daily_stats['rejected'] += 1
+        filter_reason = self._filter_reason(message_text)
+        if filter_reason:
+            self.daily_stats.record(message.chat_id, filter_reason, 'rejected', message.date)
+            # Отклоненные не сохраняются, поэтому догрузка после перезапуска узнает о них по чекпоинту
+            self.message_writer.mark_processed(message.chat_id, message.id)
             return
         
         # Анализируем сообщение
         analysis = await self._analyze_message(message_text)
         
-        # Сохраняем в базу данных
-        message_data = {
-            'message_id': event.message.id,
-            'text': message_text,
-            'sender_info': await self._get_sender_info(event),
-            'chat_title': self._get_chat_title(event),
-            'message_date': event.message.date.strftime("%d.%m.%Y %H:%M") if event.message.date else "",
-            'similarity_score': analysis['similarity'],
-            'is_full_cycle': analysis['is_full_cycle'],
-            'ml_probability': analysis['ml_probability'],
-            'forwarded': analysis['should_forward']
-        }
-        
-        self.db_manager.save_message(message_data)
+        # Сохраняем в базу данных в фоне, не блокируя event loop
+        message_data = self._build_message_record(event.message, analysis)
+        saved = self.message_writer.submit(message_data)
+        self.message_writer.mark_processed(message.chat_id, message.id)
         
         # Пересылаем если нужно
         if analysis['should_forward']:
-            await self._forward_message(event, analysis, message_data)
-            self.daily_stats['forwarded'] += 1
+            # Ссылки /correct_ и /wrong_ должны находить сообщение в БД
+            await self.message_writer.wait([saved])
+            await self._deliver(event.message, analysis, message_data)
+            self.daily_stats.record(message.chat_id, analysis['reason'], 'forwarded', message.date)
         else:
-            self.daily_stats['rejected'] += 1
+            self.daily_stats.record(message.chat_id, analysis['reason'], 'rejected', message.date)
             logging.info(f"✗ Сообщение не переслано [ID: {event.message.id}]")
     
-    def _passes_filters(self, text: str) -> bool:
-        """Проверяет, проходит ли сообщение фильтры"""
+    def _filter_reason(self, text: str) -> Optional[str]:
+        """Возвращает причину отклонения фильтрами или None, если сообщение проходит"""
         if not text:
-            return False
+            return 'empty'
         
         # Проверяем минимальную длину
         if len(text.split()) < config.filter.min_message_length:
             logging.info(f"Пропущено короткое сообщение: '{text[:50]}...'")
-            return False
+            return 'too_short'
         
         # Проверяем черный список
         text_lower = text.lower()
         for word in config.filter.blacklist_words:
             if word.lower() in text_lower:
                 logging.info(f"Пропущено сообщение из черного списка: '{text[:50]}...'")
-                return False
+                return 'blacklist'
         
         # Проверяем служебные сообщения о пересылке
         for pattern in config.filter.forward_patterns:
             import re
             if re.search(pattern, text_lower, re.IGNORECASE):
                 logging.info("Пропущено служебное сообщение о пересылке")
-                return False
+                return 'forward_notice'
         
-        return True
+        return None
     
     async def _analyze_message(self, text: str) -> Dict[str, Any]:
         """Анализирует сообщение на релевантность"""
-        from utils import clean_text, calculate_similarity, is_about_full_cycle_production
+        return (await self.analyze_batch([text]))[0]
+    
+    def _encode_for_classifier(self, texts: List[str]):
+        """Эмбеддинги сообщений, если они нужны модели или сохраняются для разметки"""
+        needed = self.classifier.is_trained or config.ml.store_embeddings or (
+            self.subscriptions is not None and self.subscriptions.has_classifiers
+        )
+        if not needed:
+            return None
+        return self.classifier.encode(texts)
+    
+    async def analyze_batch(self, texts: List[str]) -> List[Dict[str, Any]]:
+        """Анализирует пачку сообщений одним проходом модели"""
+        from utils import clean_text, encode_keyword_texts, match_keywords, is_about_full_cycle_production
+        
+        if not texts:
+            return []
         
-        cleaned_text = clean_text(text)
+        if not self.classifier.is_ready:
+            return self._analyze_by_rules(texts)
+        if self.subscriptions is None and self._subscription_list is not None:
+            self.subscriptions = SubscriptionRouter(
+                self.classifier.sentence_model, self._subscription_list, db_path=self.db_manager.db_path
+            )
         
-        # Семантическое сходство
-        similarity = calculate_similarity(
-            self.classifier.sentence_model, 
-            cleaned_text, 
-            config.business.keywords
+        cleaned_texts = [clean_text(text) for text in texts]
+        keyword_embeddings = None
+        if self.subscriptions is not None:
+            # Одни и те же эмбеддинги идут и в общий индекс фраз, и в подписки
+            keyword_embeddings = encode_keyword_texts(self.classifier.sentence_model, cleaned_texts)
+        matches = match_keywords(
+            self.classifier.sentence_model,
+            cleaned_texts,
+            config.business.keywords,
+            text_embeddings=keyword_embeddings
         )
+        embeddings = self._encode_for_classifier(texts)
+        if embeddings is None:
+            embeddings = [None] * len(texts)
+            ml_probabilities = [None] * len(texts)
+            evidence = [[] for _ in texts]
+        else:
+            # В режимах knn/prototype заодно получаем ближайшие размеченные примеры
+            ml_probabilities, evidence = self.classifier.predict_with_evidence(embeddings)
+        
+        analyses = []
+        for text, (similarity, keywords), ml_probability, embedding, examples in zip(
+                texts, matches, ml_probabilities, embeddings, evidence):
+            analysis = self._make_decision(similarity, is_about_full_cycle_production(text), ml_probability)
+            analysis['keywords'] = keywords
+            analysis['embedding'] = embedding
+            analysis['evidence'] = examples
+            analyses.append(analysis)
+        
+        if self.subscriptions is not None:
+            self._route_subscriptions(analyses, cleaned_texts, keyword_embeddings, embeddings, ml_probabilities)
+        return analyses
+    
+    def _analyze_by_rules(self, texts: List[str]) -> List[Dict[str, Any]]:
+        """Решения без модели предложений (пока она загружается): дословные фразы и полный цикл"""
+        from utils import find_keyword_mentions, is_about_full_cycle_production
         
-        # Проверка на полный цикл
-        is_full_cycle = is_about_full_cycle_production(text)
+        analyses = []
+        for text in texts:
+            mentions = find_keyword_mentions(text, config.business.keywords)
+            analysis = self._make_decision(1.0 if mentions else 0.0, is_about_full_cycle_production(text), None)
+            if analysis['reason'] == 'similarity':
+                analysis['reason'] = 'keyword_rule'
+            analysis['keywords'] = [(keyword, 1.0) for keyword in mentions[:3]]
+            analysis['embedding'] = None
+            analysis['evidence'] = []
+            analyses.append(analysis)
+        
+        if self._subscription_list is not None:
+            routes = route_by_rules(self._subscription_list, texts, [a['is_full_cycle'] for a in analyses])
+            for analysis, matched in zip(analyses, routes):
+                analysis['subscriptions'] = matched
+                analysis['recipients'] = SubscriptionRouter.recipients(matched)
+                analysis['should_forward'] = bool(analysis['recipients'])
+                analysis['reason'] = 'subscription' if matched else 'below_threshold'
+        return analyses
+    
+    def _route_subscriptions(self, analyses: List[Dict[str, Any]], cleaned_texts: List[str],
+                             keyword_embeddings, embeddings, ml_probabilities: List[Optional[float]]):
+        """Заменяет общее решение о пересылке решениями подписок"""
+        has_embeddings = len(embeddings) > 0 and embeddings[0] is not None
+        routes = self.subscriptions.route(
+            keyword_embeddings,
+            embeddings if has_embeddings else None,
+            ml_probabilities,
+            [analysis['is_full_cycle'] for analysis in analyses]
+        )
+        for analysis, text, matched in zip(analyses, cleaned_texts, routes):
+            if not text:
+                # Пустые тексты не сравниваем, как и в общей выдаче
+                matched = [match for match in matched if match['ml_probability'] is not None]
+            analysis['subscriptions'] = matched
+            analysis['recipients'] = SubscriptionRouter.recipients(matched)
+            analysis['should_forward'] = bool(analysis['recipients'])
+            analysis['reason'] = 'subscription' if matched else 'below_threshold'
+    
+    async def classify_batch(self, messages) -> List[Tuple[Any, Dict[str, Any], Optional[Dict[str, Any]]]]:
+        """Фильтрует и классифицирует пачку сообщений
         
-        # ML предсказание
-        ml_probability = self.classifier.predict(text)
+        Возвращает (сообщение, анализ, запись для БД) для каждого сообщения; у отклоненных
+        фильтрами запись равна None, а в анализе указана причина.
+        """
+        reasons = [self._filter_reason(message.text or "") for message in messages]
+        candidates = [message for message, reason in zip(messages, reasons) if reason is None]
+        analyses = iter(await self.analyze_batch([message.text for message in candidates]))
         
-        # Решение о пересылке
+        results = []
+        for message, reason in zip(messages, reasons):
+            if reason is not None:
+                results.append((message, {'reason': reason, 'should_forward': False}, None))
+            else:
+                analysis = next(analyses)
+                results.append((message, analysis, self._build_message_record(message, analysis)))
+        return results
+    
+    def _make_decision(self, similarity: float, is_full_cycle: bool,
+                       ml_probability: Optional[float]) -> Dict[str, Any]:
+        """Принимает решение о пересылке по результатам анализа"""
         if ml_probability is not None and self.classifier.is_trained:
             should_forward = ml_probability > 0.5
+            reason = 'ml'
+        elif is_full_cycle:
+            should_forward = True
+            reason = 'full_cycle'
         else:
-            should_forward = is_full_cycle or similarity > config.ml.similarity_threshold
+            should_forward = similarity > config.ml.similarity_threshold
+            reason = 'similarity' if should_forward else 'below_threshold'
         
         return {
             'similarity': similarity,
             'is_full_cycle': is_full_cycle,
             'ml_probability': ml_probability,
-            'should_forward': should_forward
+            'should_forward': should_forward,
+            'reason': reason
+        }
+    
+    @staticmethod
+    def _build_message_record(message, analysis: Dict[str, Any]) -> Dict[str, Any]:
+        """Формирует запись для БД: только ID, имена резолвятся лениво"""
+        return {
+            'message_id': message.id,
+            'chat_id': message.chat_id,
+            'sender_id': message.sender_id,
+            'text': message.text or "",
+            'message_date': message.date.strftime("%d.%m.%Y %H:%M") if message.date else "",
+            'similarity_score': analysis['similarity'],
+            'is_full_cycle': analysis['is_full_cycle'],
+            'ml_probability': analysis['ml_probability'],
+            'forwarded': analysis['should_forward'],
+            'embedding': analysis.get('embedding') if config.ml.store_embeddings else None
         }
     
-    async def _get_sender_info(self, event) -> str:
-        """Получает информацию об отправителе"""
+    async def _deliver(self, message, analysis: Dict[str, Any], message_data: Dict[str, Any]):
+        """Резолвит имена отправителя и чата и пересылает сообщение"""
+        # Запись уже в БД (пересылка ждет коммита), ее ID нужен для ссылок разметки
+        message_data['id'] = await self._in_executor(self.db_manager.get_message_row_id, message.id, message.chat_id)
+        message_data['sender_info'] = await self._get_sender_info(message)
+        message_data['chat_title'] = await self._get_chat_title(message)
+        await self._forward_message(message, analysis, message_data)
+    
+    async def _get_sender_info(self, message) -> str:
+        """Получает информацию об отправителе (через LRU-кэш)"""
+        sender_id = message.sender_id
+        cached = self.entity_cache.get(('sender', sender_id))
+        if cached is not None:
+            return cached
+        
         try:
-            sender = await event.message.get_sender()
+            sender = await message.get_sender()
             if not sender:
                 return "Неизвестный отправитель"
             
-            info_parts = []
-            if hasattr(sender, 'first_name') and sender.first_name:
-                info_parts.append(sender.first_name)
-            if hasattr(sender, 'last_name') and sender.last_name:
-                info_parts.append(sender.last_name)
-            if hasattr(sender, 'username') and sender.username:
-                info_parts.append(f"(@{sender.username})")
-            if hasattr(sender, 'title') and sender.title:
-                info_parts.append(sender.title)
-            
-            return ' '.join(info_parts) if info_parts else "Неизвестный отправитель"
+            info = self._format_sender(sender)
+            self._remember_entity_name('sender', sender_id, info)
+            return info
             
         except Exception as e:
             logging.warning(f"Не удалось получить информацию об отправителе: {e}")
             return "Неизвестный отправитель"
     
-    def _get_chat_title(self, event) -> str:
-        """Получает название чата"""
+    @staticmethod
+    def _format_sender(sender) -> str:
+        """Форматирует имя отправителя"""
+        info_parts = []
+        if hasattr(sender, 'first_name') and sender.first_name:
+            info_parts.append(sender.first_name)
+        if hasattr(sender, 'last_name') and sender.last_name:
+            info_parts.append(sender.last_name)
+        if hasattr(sender, 'username') and sender.username:
+            info_parts.append(f"(@{sender.username})")
+        if hasattr(sender, 'title') and sender.title:
+            info_parts.append(sender.title)
+        
+        return ' '.join(info_parts) if info_parts else "Неизвестный отправитель"
+    
+    async def _get_chat_title(self, message) -> str:
+        """Получает название чата (через LRU-кэш)"""
+        chat_id = message.chat_id
+        cached = self.entity_cache.get(('chat', chat_id))
+        if cached is not None:
+            return cached
+        
         try:
-            if hasattr(event.message.chat, 'title') and event.message.chat.title:
-                return event.message.chat.title
+            chat = message.chat or await message.get_chat()
+            if hasattr(chat, 'title') and chat.title:
+                self._remember_entity_name('chat', chat_id, chat.title)
+                return chat.title
             return "Приватный чат"
-        except:
+        except Exception:
             return "Неизвестный чат"
     
-    async def _forward_message(self, event, analysis: Dict[str, Any], message_data: Dict[str, Any]):
+    def _remember_entity_name(self, kind: str, entity_id: Optional[int], name: str):
+        """Кладет имя в кэш и сохраняет его в БД для последующих запросов
+        
+        Отправители и чаты хранятся под разными ключами: в личном чате chat_id
+        совпадает с ID собеседника. Запись в БД идет в пуле потоков, не блокируя event loop.
+        """
+        if entity_id is None:
+            return
+        self.entity_cache.put((kind, entity_id), name)
+        asyncio.get_running_loop().run_in_executor(None, self.db_manager.save_entity_name, kind, entity_id, name)
+    
+    async def _forward_message(self, message, analysis: Dict[str, Any], message_data: Dict[str, Any]):
         """Пересылает сообщение целевым пользователям"""
         try:
             chat_title = message_data['chat_title']
@@ -417,34 +936,60 @@ class TelegramBot:
             message_date = message_data['message_date']
             
             ml_info = f", ML: {analysis['ml_probability']:.3f}" if analysis['ml_probability'] is not None else ""
+            keywords = analysis.get('keywords') or []
+            keywords_info = ""
+            if keywords:
+                keywords_info = "🔑 Ключевые фразы: " + ", ".join(
+                    f"{keyword} ({score:.2f})" for keyword, score in keywords
+                ) + "\n"
+            evidence = analysis.get('evidence') or []
+            evidence_info = ""
+            if evidence:
+                examples = ", ".join(
+                    f"#{row_id} ({similarity:.2f}{'+' if label else '-'})" for row_id, similarity, label in evidence
+                )
+                evidence_info = f"🧩 Похожие примеры: {examples}\n"
+            links_info = f"{self._label_links(message_data['id'])}\n" if message_data.get('id') else ""
             
             message_info = (
                 f"📅 {message_date}\n"
                 f"👤 {sender_info}\n"
                 f"💬 {chat_title}\n"
-                f"🔗 ID: {event.message.id}\n"
+                f"🔗 ID: {message.id}\n"
+                f"{links_info}"
                 f"🎯 Сходство: {analysis['similarity']:.3f}{ml_info}\n"
+                f"{keywords_info}"
+                f"{evidence_info}"
                 f"🔁 Полный цикл: {'Да' if analysis['is_full_cycle'] else 'Нет'}\n\n"
             )
             
-            for user_id in config.business.target_user_ids:
+            # С подписками у каждого получателя свой список; иначе всем целевым пользователям
+            recipients = analysis.get('recipients')
+            if recipients is None:
+                recipients = {user_id: [] for user_id in config.business.target_user_ids}
+            
+            for user_id, subscription_names in recipients.items():
                 try:
                     user_entity = await self._get_entity(user_id)
                     if not user_entity:
                         continue
                     
+                    user_info = message_info
+                    if subscription_names:
+                        user_info = f"📬 Подписка: {', '.join(subscription_names)}\n" + message_info
+                    
                     # Пробуем переслать
                     try:
-                        forward_message = await self.client.forward_messages(user_entity, event.message)
+                        forward_message = await self.client.forward_messages(user_entity, message)
                         if forward_message:
-                            await self.client.send_message(user_entity, message_info, reply_to=forward_message.id)
+                            await self.client.send_message(user_entity, user_info, reply_to=forward_message.id)
                             logging.info(f"✅ Сообщение переслано пользователю {user_id}")
                             continue
                     except Exception as forward_error:
                         logging.warning(f"Не удалось переслать: {forward_error}")
                     
                     # Если не получилось переслать, копируем содержимое
-                    await self._copy_message_content(event, user_entity, message_info)
+                    await self._copy_message_content(message, user_entity, user_info)
                     
                 except Exception as e:
                     logging.error(f"❌ Ошибка для пользователя {user_id}: {e}")
@@ -452,19 +997,19 @@ class TelegramBot:
         except Exception as e:
             logging.error(f"❌ Ошибка пересылки сообщения: {e}")
     
-    async def _copy_message_content(self, event, target_user, message_info: str):
+    async def _copy_message_content(self, message, target_user, message_info: str):
         """Копирует содержимое сообщения"""
         try:
             sent_message = None
             
-            if event.message.text:
-                sent_message = await self.client.send_message(target_user, event.message.text)
+            if message.text:
+                sent_message = await self.client.send_message(target_user, message.text)
             
-            if event.message.media and not isinstance(event.message.media, type(None)):
+            if message.media and not isinstance(message.media, type(None)):
                 if sent_message:
-                    await self.client.send_file(target_user, event.message.media, reply_to=sent_message.id)
+                    await self.client.send_file(target_user, message.media, reply_to=sent_message.id)
                 else:
-                    sent_message = await self.client.send_file(target_user, event.message.media)
+                    sent_message = await self.client.send_file(target_user, message.media)
             
             if sent_message:
                 await self.client.send_message(target_user, message_info, reply_to=sent_message.id)
@@ -483,7 +1028,20 @@ class TelegramBot:
             logging.error("❌ Не удалось запустить бота")
     
     async def stop(self):
-        """Останавливает бота"""
+        """Останавливает бота: очередь записи и статистика сбрасываются и после ошибок"""
         if self.client:
-            await self.client.disconnect()
+            try:
+                await self.client.disconnect()
+            except Exception as e:
+                logging.error(f"❌ Ошибка отключения клиента: {e}")
             logging.info("🛑 Бот остановлен")
+        if self._stats_task:
+            self._stats_task.cancel()
+            self._stats_task = None
+        if self._maintenance_task:
+            self._maintenance_task.cancel()
+            self._maintenance_task = None
+        self.classifier.retrain_scheduler.stop()
+        await self.message_writer.close()
+        self.daily_stats.flush(self.db_manager)
+        self.db_manager.close()
@@ -0,0 +1,89 @@
+import asyncio
+import logging
+import sys
+import os
+import numpy as np
+import pytest
+
+# Добавляем путь к проекту
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.harness import FakeClient, FakeMessage
+from config import config
+from database import DatabaseManager
+import ml_classifier
+from ml_classifier import UniversalMessageClassifier
+from telegram_bot import TelegramBot
+
+
+class _Model:
+    def encode(self, texts):
+        return np.ones((len(texts), 8), dtype=np.float32)
+
+
+@pytest.fixture(autouse=True)
+def offline_model(monkeypatch):
+    monkeypatch.setattr(ml_classifier, '_sentence_transformer', lambda name: _Model())
+
+
+def _history(chat_id, ids):
+    return [FakeMessage(message_id, chat_id, 1, f'сообщение {message_id} из {chat_id}') for message_id in ids]
+
+
+def _bot(tmp_path, client):
+    db_manager = DatabaseManager(str(tmp_path / 'bot.db'))
+    bot = TelegramBot(db_manager=db_manager, classifier=UniversalMessageClassifier(db_manager=db_manager),
+                      client=client)
+    scanned = []
+
+    async def classify_batch(messages):
+        scanned.extend((message.chat_id, message.id) for message in messages)
+        return [(message, {'reason': 'test', 'should_forward': False}, None) for message in messages]
+
+    bot.classify_batch = classify_batch
+    return bot, scanned
+
+
+def test_catch_up_keys_messages_by_chat_and_moves_checkpoints(tmp_path):
+    client = FakeClient()
+    client.add_history(_history(-100, range(1, 16)) + _history(-200, range(1, 14)))
+    bot, scanned = _bot(tmp_path, client)
+    # Сообщение 12 чата -100 уже пришло живым событием; то же ID в чате -200 - другое сообщение
+    bot._mark_seen(-100, 12)
+
+    async def run():
+        summary = await bot.catch_up({-100: 10, -200: 10})
+        await bot.message_writer.close()
+        return summary
+
+    summary = asyncio.run(run())
+    assert sorted(scanned) == [(-200, 11), (-200, 12), (-200, 13), (-100, 11), (-100, 13), (-100, 14), (-100, 15)]
+    assert summary['chats'] == 2 and summary['scanned'] == 7
+    assert bot.db_manager.get_last_message_ids() == {-100: 15, -200: 13}
+
+
+def test_catch_up_warns_when_gap_exceeds_limit(tmp_path, monkeypatch, caplog):
+    monkeypatch.setattr(config.catchup, 'max_messages_per_chat', 3)
+    client = FakeClient()
+    client.add_history(_history(-300, range(1, 9)))
+    bot, scanned = _bot(tmp_path, client)
+
+    async def run():
+        with caplog.at_level(logging.WARNING):
+            await bot.catch_up({-300: 0})
+        await bot.message_writer.close()
+
+    asyncio.run(run())
+    # Берутся самые новые сообщения пропуска, о непрочитанной части пишется предупреждение
+    assert scanned == [(-300, 6), (-300, 7), (-300, 8)]
+    assert any('около 5 сообщений' in record.getMessage() for record in caplog.records)
+    assert bot.db_manager.get_last_message_ids() == {-300: 8}
+
+
+def test_processed_messages_are_bounded(tmp_path, monkeypatch):
+    bot, _ = _bot(tmp_path, FakeClient())
+    monkeypatch.setattr(TelegramBot, 'PROCESSED_CACHE_SIZE', 3)
+    for message_id in range(1, 6):
+        bot._mark_seen(-100, message_id)
+    assert list(bot.processed_messages) == [(-100, 3), (-100, 4), (-100, 5)]
+    assert not bot._is_processed(-100, 1)
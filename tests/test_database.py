@@ -0,0 +1,345 @@
+import pytest
+import sys
+import os
+
+# Добавляем путь к проекту
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import DatabaseManager
+from entity_cache import EntityInfoCache
+
+
+@pytest.fixture
+def db_manager(tmp_path):
+    return DatabaseManager(str(tmp_path / 'test.db'))
+
+
+def test_get_message_joins_entity_names(db_manager):
+    """Имена отправителя и чата подставляются при чтении по ID"""
+    db_manager.save_message({'message_id': 1, 'chat_id': -100, 'sender_id': 42, 'text': 'текст'})
+    assert db_manager.get_message(1, -100)['sender_info'] == ''
+
+    db_manager.save_entity_name('sender', 42, 'Иван (@ivan)')
+    db_manager.save_entity_name('chat', -100, 'Чат заказов')
+    message = db_manager.get_message(1, -100)
+    assert message['sender_info'] == 'Иван (@ivan)'
+    assert message['chat_title'] == 'Чат заказов'
+
+    # В личном чате chat_id равен ID собеседника: имя отправителя не становится названием чата
+    db_manager.save_message({'message_id': 2, 'chat_id': 42, 'sender_id': 42, 'text': 'лично'})
+    private = db_manager.get_message(2, 42)
+    assert private['sender_info'] == 'Иван (@ivan)'
+    assert private['chat_title'] == ''
+
+
+def test_entity_cache_evicts_least_recently_used():
+    """LRU-кэш вытесняет самую старую запись"""
+    cache = EntityInfoCache(max_size=2)
+    cache.put(1, 'a')
+    cache.put(2, 'b')
+    assert cache.get(1) == 'a'
+    cache.put(3, 'c')
+    assert 2 not in cache
+    assert cache.get(1) == 'a'
+    assert cache.get(3) == 'c'
+
+
+def test_save_messages_batch_records_checkpoint(db_manager):
+    """Пачка сообщений и чекпоинт бэкфилла пишутся вместе"""
+    assert db_manager.get_backfill_checkpoint(-100) == 0
+    records = [{'message_id': i, 'chat_id': -100, 'text': f'сообщение {i}'} for i in range(1, 4)]
+    assert db_manager.save_messages_batch(records, checkpoint=(-100, 3))
+    assert db_manager.get_backfill_checkpoint(-100) == 3
+    assert db_manager.get_message(2, -100)['text'] == 'сообщение 2'
+
+
+def test_get_last_message_ids_includes_checkpoints(db_manager):
+    """Последний ID по чату учитывает и сообщения, и чекпоинты бэкфилла"""
+    db_manager.save_messages_batch([
+        {'message_id': 5, 'chat_id': -100, 'text': 'a'},
+        {'message_id': 9, 'chat_id': -100, 'text': 'b'},
+        {'message_id': 7, 'chat_id': -200, 'text': 'c'},
+    ], checkpoint=(-200, 12))
+    assert db_manager.get_last_message_ids() == {-100: 9, -200: 12}
+
+
+def test_connection_is_reused_and_thread_safe(db_manager):
+    """Одно подключение в режиме WAL используется из нескольких потоков"""
+    import threading
+
+    with db_manager.get_connection() as conn:
+        assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    with db_manager.get_connection() as again:
+        assert again is conn
+
+    def writer(offset):
+        for i in range(50):
+            db_manager.save_message({'message_id': offset + i, 'chat_id': 1, 'text': 't'})
+
+    threads = [threading.Thread(target=writer, args=(n * 1000,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    with db_manager.get_connection() as conn:
+        assert conn.execute('SELECT COUNT(*) FROM messages').fetchone()[0] == 200
+
+
+def test_reads_do_not_wait_for_write_connection(db_manager):
+    """Чтение идет через отдельное подключение и не ждет писателя, держащего общее"""
+    import sqlite3
+    import threading
+
+    db_manager.save_message({'message_id': 5, 'chat_id': -100, 'text': 'сохранено'})
+    holding, release = threading.Event(), threading.Event()
+
+    def writer():
+        # Фоновый писатель посреди пачки: общее подключение занято, транзакция открыта
+        with db_manager.get_connection() as conn:
+            conn.execute("INSERT INTO messages (message_id, chat_id, text) VALUES (6, -100, 'в пачке')")
+            holding.set()
+            release.wait(5)
+            conn.commit()
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    try:
+        assert holding.wait(5)
+        # Читатель видит последний закоммиченный снимок
+        assert db_manager.get_message_row_id(5, -100) is not None
+        assert db_manager.get_message_row_id(6, -100) is None
+        with pytest.raises(sqlite3.OperationalError):
+            with db_manager.read_connection() as conn:
+                conn.execute("DELETE FROM messages")
+    finally:
+        release.set()
+        thread.join()
+    assert db_manager.get_message(6, -100)['text'] == 'в пачке'
+
+
+def test_batched_writer_flushes_on_close(db_manager):
+    """Фоновая запись группирует сообщения и сбрасывает очередь при закрытии"""
+    import asyncio
+    from db_writer import BatchedMessageWriter
+
+    async def scenario():
+        writer = BatchedMessageWriter(db_manager, batch_size=10, flush_interval_ms=1000)
+        first = writer.submit({'message_id': 1, 'chat_id': 1, 'text': 'первое'})
+        assert await writer.wait([first])
+        assert db_manager.get_message(1, 1)['text'] == 'первое'
+
+        writer.submit_many([{'message_id': i, 'chat_id': 1, 'text': 't'} for i in range(2, 30)])
+        # Отклоненные фильтрами сообщения не сохраняются, но сдвигают чекпоинт чата
+        writer.mark_processed(1, 35)
+        writer.mark_processed(2, 50)
+        writer.mark_processed(2, 40)
+        await writer.close()
+        return writer.get_stats()
+
+    stats = asyncio.run(scenario())
+    assert db_manager.get_last_message_ids() == {1: 35, 2: 50}
+    assert stats['records_written'] == 29
+    assert stats['batches_written'] < 29
+    with db_manager.get_connection() as conn:
+        assert conn.execute('SELECT COUNT(*) FROM messages').fetchone()[0] == 29
+
+
+def test_daily_stats_counter_upserts_increments(db_manager):
+    """Статистика прибавляется к строке за дату и раскладывается по суткам"""
+    from bot_stats import DailyStatsCounter
+
+    counter = DailyStatsCounter()
+    counter.increment('processed', 3, date='2024-01-01')
+    counter.increment('processed', 2, date='2024-01-02')
+    assert counter.flush(db_manager)
+    counter.increment('processed', 4, date='2024-01-01')
+    counter.increment('forwarded', 1, date='2024-01-01')
+    assert counter.flush(db_manager)
+
+    with db_manager.get_connection() as conn:
+        rows = conn.execute(
+            'SELECT date, messages_processed, messages_forwarded FROM bot_stats ORDER BY date'
+        ).fetchall()
+    assert [tuple(row) for row in rows] == [('2024-01-01', 7, 1), ('2024-01-02', 2, 0)]
+
+
+def test_daily_stats_flush_restores_deltas_on_failure(db_manager, monkeypatch):
+    """Если запись не удалась, приращения возвращаются и уходят следующим flush"""
+    from datetime import datetime, timezone
+    from bot_stats import DailyStatsCounter
+
+    counter = DailyStatsCounter()
+    when = datetime(2024, 1, 1, 9, 15, tzinfo=timezone.utc)
+    counter.increment('processed', 2, date='2024-01-01')
+    counter.record(-100, 'similarity', 'forwarded', when)
+
+    real_increment = db_manager.increment_stats
+    monkeypatch.setattr(db_manager, 'increment_stats', lambda pending, rollups: False)
+    assert not counter.flush(db_manager)
+
+    monkeypatch.setattr(db_manager, 'increment_stats', real_increment)
+    assert counter.flush(db_manager)
+    assert counter.take_pending() == ({}, {})
+
+    with db_manager.get_connection() as conn:
+        row = conn.execute(
+            'SELECT messages_processed, messages_forwarded FROM bot_stats WHERE date = ?',
+            ('2024-01-01',)
+        ).fetchone()
+    assert tuple(row) == (3, 1)
+    assert db_manager.get_rollup_summary('2024-01-01', granularity='day')['forwarded'] == 1
+
+
+def test_rollups_aggregate_by_hour_chat_and_reason(db_manager):
+    """Роллапы считаются по часу, чату и причине и читаются диапазоном"""
+    from datetime import datetime, timezone
+    from bot_stats import DailyStatsCounter
+
+    counter = DailyStatsCounter()
+    morning = datetime(2024, 1, 1, 9, 15, tzinfo=timezone.utc)
+    evening = datetime(2024, 1, 1, 18, 40, tzinfo=timezone.utc)
+    counter.record(-100, 'similarity', 'forwarded', morning)
+    counter.record(-100, 'too_short', 'rejected', morning)
+    counter.record(-200, 'similarity', 'forwarded', evening)
+    assert counter.flush(db_manager)
+
+    summary = db_manager.get_rollup_summary('2024-01-01 09:00', '2024-01-01 10:00')
+    assert summary['processed'] == 2
+    assert summary['by_reason']['too_short']['rejected'] == 1
+
+    daily = db_manager.get_rollup_summary('2024-01-01', granularity='day', chat_id=-100)
+    assert daily['forwarded'] == 1
+    assert db_manager.get_stats_summary(100000)['total_processed'] == 3
+
+
+def test_legacy_database_upgrades_in_place(tmp_path):
+    """База первой версии получает schema_version, индексы и ключ (chat_id, message_id)"""
+    import sqlite3
+    from migrations import MIGRATIONS
+
+    db_path = str(tmp_path / 'legacy.db')
+    conn = sqlite3.connect(db_path)
+    conn.execute('''
+        CREATE TABLE messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            message_id INTEGER UNIQUE NOT NULL,
+            text TEXT NOT NULL,
+            sender_info TEXT,
+            chat_title TEXT,
+            message_date TEXT,
+            similarity_score REAL,
+            is_full_cycle BOOLEAN,
+            ml_probability REAL,
+            forwarded BOOLEAN,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.executemany('INSERT INTO messages (message_id, text) VALUES (?, ?)',
+                     [(i, f'старое {i}') for i in range(1, 8)])
+    conn.commit()
+    conn.close()
+
+    db_manager = DatabaseManager(db_path)
+    with db_manager.get_connection() as conn:
+        version = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()[0]
+        indexes = {row[1] for row in conn.execute("SELECT type, name FROM sqlite_master WHERE type = 'index'")}
+    assert version == MIGRATIONS[-1].version
+    assert 'idx_model_metrics_name_created' in indexes
+
+    assert db_manager.get_message(3, 0)['text'] == 'старое 3'
+    db_manager.save_message({'message_id': 3, 'chat_id': -200, 'text': 'другой чат'})
+    assert db_manager.get_message(3, chat_id=0)['text'] == 'старое 3'
+    other = db_manager.get_message(3, chat_id=-200)
+    assert other['text'] == 'другой чат'
+    # Команды ссылаются на ID строки: он однозначен и не меняется при перезаписи
+    assert db_manager.get_message_row_id(3, -200) == other['id']
+    db_manager.save_message({'message_id': 3, 'chat_id': -200, 'text': 'правка'})
+    assert db_manager.get_message_by_id(other['id'])['text'] == 'правка'
+    assert db_manager.get_message(3, chat_id=-300) is None
+
+    # Повторное открытие не применяет миграции заново
+    db_manager.close()
+    assert DatabaseManager(db_path).get_message(7, 0)['text'] == 'старое 7'
+
+
+def test_retention_deletes_in_batches(db_manager):
+    db_manager.save_messages_batch([
+        {'message_id': i, 'chat_id': -100, 'text': f'сообщение {i}'} for i in range(1, 26)
+    ])
+    with db_manager.get_connection() as conn:
+        conn.execute("UPDATE messages SET created_at = datetime('now', '-40 days') WHERE message_id <= 20")
+        conn.execute("INSERT INTO stats_hourly (bucket, chat_id, reason, processed) VALUES ('2000-01-01 10:00', -100, 'ml', 1)")
+        conn.commit()
+        assert conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2
+
+    assert db_manager.delete_expired('messages', 30, batch_size=7, pause_ms=0) == 20
+    deleted = db_manager.apply_retention({'messages': 30, 'stats_hourly': 14, 'model_metrics': 0})
+    assert deleted == {'messages': 0, 'stats_hourly': 1}
+
+    with db_manager.get_connection() as conn:
+        remaining = [row[0] for row in conn.execute('SELECT message_id FROM messages ORDER BY message_id')]
+    assert remaining == list(range(21, 26))
+    assert db_manager.incremental_vacuum() >= 0
+
+
+def test_message_embedding_roundtrip(db_manager):
+    import numpy as np
+
+    embedding = np.linspace(-1, 1, 8, dtype=np.float32)
+    db_manager.save_messages_batch([
+        {'message_id': 1, 'chat_id': -100, 'text': 'с эмбеддингом', 'embedding': embedding},
+        {'message_id': 2, 'chat_id': -100, 'text': 'без эмбеддинга'}
+    ])
+
+    stored = db_manager.get_message_embedding(1, -100)
+    assert stored.dtype == np.float32
+    assert np.allclose(stored, embedding, atol=1e-3)
+    assert db_manager.get_message_embedding(2, -100) is None
+    assert db_manager.get_message_embedding(1, -200) is None
+
+    with db_manager.get_connection() as conn:
+        conn.execute("UPDATE message_embeddings SET created_at = datetime('now', '-10 days')")
+        conn.commit()
+    assert db_manager.apply_retention({'message_embeddings': 7}) == {'message_embeddings': 1}
+    assert db_manager.get_message(1, chat_id=-100)['text'] == 'с эмбеддингом'
+
+
+def test_search_messages_fulltext(db_manager):
+    db_manager.save_messages_batch([
+        {'message_id': 1, 'chat_id': -100, 'text': 'Ищем видеопродакшн полного цикла для рекламы'},
+        {'message_id': 2, 'chat_id': -100, 'text': 'Продам велосипед'},
+        {'message_id': 3, 'chat_id': -200, 'text': 'Нужен монтаж ролика, ещё и съёмка'}
+    ])
+    assert db_manager.fulltext_enabled
+
+    results = db_manager.search_messages('видеопродакшн')
+    assert [r['message_id'] for r in results] == [1]
+    assert '«видеопродакшн»' in results[0]['snippet']
+
+    # Префиксы и ё/е
+    assert [r['message_id'] for r in db_manager.search_messages('съемк')] == [3]
+    assert db_manager.search_messages('монтаж', chat_id=-100) == []
+
+    # Индекс следует за UPSERT и удалением
+    db_manager.save_message({'message_id': 2, 'chat_id': -100, 'text': 'Продам камеру для съемки'})
+    assert {r['message_id'] for r in db_manager.search_messages('съемк')} == {2, 3}
+    db_manager.delete_expired('messages', -1, pause_ms=0)
+    assert db_manager.search_messages('камеру') == []
+
+
+def test_search_chat_filter_applies_before_rank_window(db_manager, monkeypatch):
+    monkeypatch.setattr(DatabaseManager, 'SEARCH_RANK_WINDOW', 3)
+    db_manager.save_messages_batch(
+        [{'message_id': 1, 'chat_id': -100, 'text': 'монтаж ролика'}] +
+        [{'message_id': i, 'chat_id': -200, 'text': f'монтаж {i}'} for i in range(2, 10)]
+    )
+    # Свежие совпадения из другого чата не вытесняют единственное совпадение в нужном
+    assert [r['message_id'] for r in db_manager.search_messages('монтаж', chat_id=-100)] == [1]
+
+
+def test_reclassification_keeps_forwarded_flag(db_manager):
+    db_manager.save_message({'message_id': 5, 'chat_id': -100, 'text': 'переслано', 'forwarded': True})
+    # Бэкфилл того же сообщения пишет forwarded=False
+    db_manager.save_messages_batch([{'message_id': 5, 'chat_id': -100, 'text': 'переслано', 'forwarded': False}])
+    assert db_manager.get_message(5, -100)['forwarded']
@@ -0,0 +1,65 @@
+import asyncio
+import sys
+import os
+import pytest
+
+# Добавляем путь к проекту
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import DatabaseManager
+from db_writer import BatchedMessageWriter
+
+
+@pytest.fixture
+def db_manager(tmp_path):
+    return DatabaseManager(str(tmp_path / 'test.db'))
+
+
+def _records(start, count, chat_id=-100):
+    return [{'message_id': i, 'chat_id': chat_id, 'text': f'сообщение {i}'} for i in range(start, start + count)]
+
+
+def _stored(db_manager) -> int:
+    with db_manager.get_connection() as conn:
+        return conn.execute('SELECT COUNT(*) FROM messages').fetchone()[0]
+
+
+def test_batches_by_size_and_by_timeout(db_manager):
+    # Пачка набрана по размеру: таймаут 10 с не дожидается
+    writer = BatchedMessageWriter(db_manager, batch_size=5, flush_interval_ms=10000)
+    futures = writer.submit_many(_records(1, 5))
+    assert all(future.result(timeout=5) for future in futures)
+    assert writer.get_stats()['batches_written'] == 1
+
+    # Неполная пачка пишется по таймауту
+    writer = BatchedMessageWriter(db_manager, batch_size=100, flush_interval_ms=50)
+    assert writer.submit(_records(10, 1)[0]).result(timeout=5)
+    assert _stored(db_manager) == 6
+
+
+def test_flush_and_close_drain_queue(db_manager):
+    async def scenario():
+        writer = BatchedMessageWriter(db_manager, batch_size=100, flush_interval_ms=10000)
+        writer.submit_many(_records(1, 3))
+        assert await writer.flush()
+        assert _stored(db_manager) == 3
+
+        writer.submit_many(_records(4, 4))
+        await writer.close()
+        return writer.get_stats()
+
+    stats = asyncio.run(scenario())
+    assert _stored(db_manager) == 7
+    assert stats['records_written'] == 7 and stats['pending'] == 0
+
+
+def test_futures_fail_when_batch_is_not_saved(db_manager, monkeypatch):
+    writer = BatchedMessageWriter(db_manager, batch_size=2, flush_interval_ms=10000)
+    monkeypatch.setattr(db_manager, 'save_messages_batch', lambda *args, **kwargs: False)
+    assert [future.result(timeout=5) for future in writer.submit_many(_records(1, 2))] == [False, False]
+
+    def broken(*args, **kwargs):
+        raise RuntimeError('диск заполнен')
+    monkeypatch.setattr(db_manager, 'save_messages_batch', broken)
+    assert [future.result(timeout=5) for future in writer.submit_many(_records(3, 2))] == [False, False]
+    assert writer.get_stats()['records_written'] == 0
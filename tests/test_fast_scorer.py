@@ -0,0 +1,27 @@
+import sys
+import os
+import numpy as np
+
+# Добавляем путь к проекту
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sklearn.linear_model import LogisticRegression, SGDClassifier
+from fast_scorer import LinearScorer
+
+
+def test_parity_with_sklearn():
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(300, 384)).astype(np.float32)
+    y = (X[:, :5].sum(axis=1) > 0).astype(int)
+
+    for model in (LogisticRegression(max_iter=1000), SGDClassifier(loss='log_loss', random_state=0)):
+        model.fit(X, y)
+        scorer = LinearScorer.from_estimator(model)
+        expected = model.predict_proba(X)[:, 1]
+        assert np.allclose(scorer.score(X), expected, atol=1e-5)
+        # Одиночный вектор дает float
+        assert abs(scorer.score(X[7]) - expected[7]) < 1e-5
+
+    # Большие по модулю значения не переполняются
+    extreme = LinearScorer(np.ones(3), 0.0)
+    assert extreme.score(np.array([[1e4] * 3, [-1e4] * 3])).tolist() == [1.0, 0.0]
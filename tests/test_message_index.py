@@ -0,0 +1,39 @@
+import sys
+import os
+import numpy as np
+
+# Добавляем путь к проекту
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import DatabaseManager
+from message_index import MessageIndex
+
+
+def _records(rng, start, count, chat_id=-100):
+    return [
+        {'message_id': start + i, 'chat_id': chat_id, 'text': f'сообщение {start + i}',
+         'embedding': rng.normal(size=16).astype(np.float32)}
+        for i in range(count)
+    ]
+
+
+def test_similar_after_rebuild_and_incremental_add(tmp_path):
+    rng = np.random.default_rng(0)
+    db_manager = DatabaseManager(str(tmp_path / 'test.db'))
+    stored = _records(rng, 1, 40)
+    db_manager.save_messages_batch(stored)
+
+    for twin_id, threshold in ((100, 1000), (101, 10)):
+        index = MessageIndex(db_manager, ivf_threshold=threshold, nprobe=100)
+        assert index.rebuild() == 40 + twin_id - 100
+        assert index.is_ivf == (threshold == 10)
+
+        # Почти копия сообщения 5, добавленная после построения
+        twin = dict(_records(rng, twin_id, 1, chat_id=-200)[0], embedding=stored[4]['embedding'] + 0.01)
+        db_manager.save_messages_batch([twin])
+        index.add_records([twin])
+
+        results = index.similar(-100, 5, k=3)
+        assert results[0][0] == -200 and results[0][2] > 0.99
+        assert (-100, 5) not in [result[:2] for result in results]
+        assert index.similar(-100, 999) is None
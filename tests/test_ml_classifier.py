@@ -0,0 +1,132 @@
+import subprocess
+import sys
+import os
+import threading
+import numpy as np
+
+# Добавляем путь к проекту
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ml_classifier
+from config import config
+from database import DatabaseManager
+from model_store import ModelStore
+from ml_classifier import UniversalMessageClassifier
+
+
+class _SlowModel:
+    def __init__(self, release: threading.Event):
+        release.wait(5)
+        self.calls = []
+
+    def encode(self, texts):
+        self.calls.append(list(texts))
+        return np.ones((len(texts), 8), dtype=np.float32)
+
+
+def test_background_load_and_warm_up(tmp_path, monkeypatch):
+    release = threading.Event()
+    monkeypatch.setattr(ml_classifier, '_sentence_transformer', lambda name: _SlowModel(release))
+    classifier = UniversalMessageClassifier(
+        db_manager=DatabaseManager(str(tmp_path / 'bot.db')), load_in_background=True
+    )
+
+    # Пока модель грузится, классификатор не готов и разметку не принимает
+    assert not classifier.is_ready
+    assert not classifier.add_training_example('текст', 1)
+
+    release.set()
+    assert classifier.wait_ready(5)
+    # Прогрев модели до первого сообщения
+    assert classifier.sentence_model.calls[0] == ['прогрев модели']
+    assert classifier.add_training_example('текст', 1)
+
+
+_LOAD_SNAPSHOT = """
+import sys
+import numpy as np
+sys.path.insert(0, sys.argv[1])
+import ml_classifier
+from database import DatabaseManager
+
+class Model:
+    def encode(self, texts):
+        return np.ones((len(texts), 8), dtype=np.float32)
+
+ml_classifier._sentence_transformer = lambda name: Model()
+classifier = ml_classifier.UniversalMessageClassifier(db_manager=DatabaseManager(sys.argv[2]))
+print(classifier.is_trained, classifier.model_version, 'sklearn' in sys.modules)
+print(classifier.predict_from_embeddings(np.ones((1, 8), dtype=np.float32))[0])
+"""
+
+
+def test_snapshot_loads_without_sklearn(tmp_path):
+    from sklearn.linear_model import LogisticRegression
+
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(40, 8)).astype(np.float32)
+    model = LogisticRegression().fit(X, X[:, 0] > 0)
+    db_path = str(tmp_path / 'bot.db')
+    ModelStore(config.ml.classifier_model, db_path=db_path).save(model)
+
+    # Отдельный процесс: в этом sklearn уже импортирован другими тестами
+    project = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run(
+        [sys.executable, '-c', _LOAD_SNAPSHOT, project, db_path],
+        capture_output=True, text=True, timeout=60, check=True
+    ).stdout.split('\n')
+    assert output[0] == 'True 1 False'
+    expected = model.predict_proba(np.ones((1, 8)))[0, 1]
+    assert abs(float(output[1]) - expected) < 1e-5
+
+
+class _Model:
+    def encode(self, texts):
+        return np.ones((len(texts), 8), dtype=np.float32)
+
+
+def _trained_classifier(tmp_path, monkeypatch):
+    """Линейный классификатор с двумя снимками в ModelStore (текущий - v2)"""
+    monkeypatch.setattr(ml_classifier, '_sentence_transformer', lambda name: _Model())
+    classifier = UniversalMessageClassifier(db_manager=DatabaseManager(str(tmp_path / 'bot.db')))
+    X = np.random.default_rng(0).normal(size=(40, 8)).astype(np.float32)
+    classifier.training_data.extend(X, (X[:, 0] > 0).astype(np.int8))
+    assert classifier.auto_train() and classifier.auto_train()
+    assert classifier.model_version == 2
+    return classifier
+
+
+def test_rollback_cancels_pending_and_in_flight_retrains(tmp_path, monkeypatch):
+    classifier = _trained_classifier(tmp_path, monkeypatch)
+    pending = classifier.request_retrain()
+    assert classifier.rollback() == 1
+    assert not pending.result(timeout=2)
+
+    # Откат во время обучения: новая модель не публикуется и не становится текущей версией
+    new_estimator = classifier._new_estimator
+
+    class _RolledBackDuringFit:
+        def __init__(self):
+            self.model = new_estimator()
+
+        def fit(self, X, y):
+            self.model.fit(X, y)
+            classifier.rollback(1)
+            return self
+
+        def __getattr__(self, name):
+            return getattr(self.model, name)
+
+    monkeypatch.setattr(classifier, '_new_estimator', _RolledBackDuringFit)
+    assert not classifier.auto_train()
+    assert classifier.model_version == 1
+    assert classifier.model_store.current_version() == 1
+    assert classifier.retrain_scheduler.get_stats()['runs'] == 0
+    classifier.retrain_scheduler.stop()
+
+
+def test_rollback_is_rejected_in_online_mode(tmp_path, monkeypatch):
+    classifier = _trained_classifier(tmp_path, monkeypatch)
+    classifier.online = True
+    assert classifier.rollback() is None
+    assert classifier.model_store.current_version() == 2
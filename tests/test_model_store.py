@@ -0,0 +1,36 @@
+import sys
+import os
+import numpy as np
+
+# Добавляем путь к проекту
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sklearn.linear_model import LogisticRegression
+from model_store import ModelStore
+
+
+def _fit(seed):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(40, 6)).astype(np.float32)
+    y = (X[:, 0] > 0).astype(int)
+    return LogisticRegression().fit(X, y), X
+
+
+def test_versions_roundtrip_and_rollback(tmp_path):
+    store = ModelStore('test', directory=str(tmp_path), keep=2)
+    first, X = _fit(1)
+    second, _ = _fit(2)
+    assert store.save(first, {'accuracy': 0.9}) == 1
+    assert store.save(second, {'accuracy': 0.8}, training_examples=40) == 2
+    assert store.current_version() == 2
+
+    arrays, meta = store.load()
+    assert meta['version'] == 2 and meta['training_examples'] == 40
+    assert np.allclose(arrays['coef'], second.coef_, atol=1e-6)
+
+    # Откат переключает указатель, а следующее сохранение снова становится текущим
+    assert store.previous_version() == 1
+    arrays, meta = store.activate(1)
+    assert store.current_version() == 1 and meta['metrics'] == {'accuracy': 0.9}
+    assert store.save(second) == 3
+    assert store.versions() == [2, 3]
@@ -0,0 +1,28 @@
+import sys
+import os
+from datetime import datetime, timezone
+
+# Добавляем путь к проекту
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.replay import _parse_date, forward_metrics
+
+
+def test_parse_date_returns_aware_utc():
+    expected = datetime(2024, 1, 1, 10, 0, tzinfo=timezone.utc)
+    assert _parse_date('2024-01-01T10:00:00Z') == expected
+    assert _parse_date('2024-01-01T10:00:00') == expected
+    assert _parse_date('2024-01-01T13:00:00+03:00') == expected
+    assert _parse_date(expected.timestamp()) == expected
+    # Смешанные форматы сортируются вместе
+    assert sorted([_parse_date('2024-01-01T10:00:01'), _parse_date('2024-01-01T10:00:00Z')])[0] == expected
+
+
+def test_forward_metrics_keys_by_chat_and_message():
+    labeled = [
+        {'chat_id': -100, 'message_id': 7, 'label': 1},
+        {'chat_id': -200, 'message_id': 7, 'label': 0},
+    ]
+    # Пересланное сообщение 7 из чата -100 не засчитывается сообщению 7 из чата -200
+    metrics = forward_metrics(labeled, {(-100, 7)})
+    assert (metrics['tp'], metrics['fp'], metrics['fn'], metrics['tn']) == (1, 0, 0, 1)
@@ -0,0 +1,62 @@
+import sys
+import os
+import threading
+import time
+
+# Добавляем путь к проекту
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from retrain_scheduler import RetrainScheduler
+
+
+def test_burst_of_requests_is_coalesced():
+    runs = []
+    scheduler = RetrainScheduler(lambda: runs.append(time.monotonic()) or True,
+                                 debounce_seconds=0.05, max_delay_seconds=5)
+    futures = [scheduler.request() for _ in range(10)]
+    assert all(future.result(timeout=2) for future in futures)
+    assert len(runs) == 1
+
+    # Немедленный запрос не ждет паузы
+    started = time.monotonic()
+    assert scheduler.request(immediate=True).result(timeout=2)
+    assert time.monotonic() - started < 0.05
+    assert scheduler.get_stats() == {'requests': 11, 'runs': 2, 'pending': 0}
+    scheduler.stop()
+
+
+def test_requests_during_training_run_again():
+    release = threading.Event()
+    runs = []
+
+    def train():
+        runs.append(1)
+        release.wait(2)
+        return True
+
+    scheduler = RetrainScheduler(train, debounce_seconds=0.01, max_delay_seconds=1)
+    first = scheduler.request()
+    while not runs:
+        time.sleep(0.005)
+    second = scheduler.request()
+    release.set()
+    assert first.result(timeout=2) and second.result(timeout=2)
+    assert len(runs) == 2
+
+    scheduler.stop()
+    assert scheduler.request().result(timeout=1) is False
+
+
+def test_cancel_pending_drops_queued_requests():
+    runs = []
+    scheduler = RetrainScheduler(lambda: runs.append(1) or True, debounce_seconds=0.2, max_delay_seconds=5)
+    futures = [scheduler.request() for _ in range(3)]
+    assert scheduler.cancel_pending() == 3
+    assert not any(future.result(timeout=1) for future in futures)
+
+    # Снятые запросы не запускают обучение, новые работают как обычно
+    time.sleep(0.3)
+    assert runs == []
+    assert scheduler.request(immediate=True).result(timeout=2)
+    assert scheduler.get_stats()['pending'] == 0 and runs == [1]
+    scheduler.stop()
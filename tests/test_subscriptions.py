@@ -0,0 +1,76 @@
+import sys
+import os
+import numpy as np
+
+# Добавляем путь к проекту
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sklearn.linear_model import LogisticRegression
+from model_store import ModelStore
+from subscriptions import Subscription, SubscriptionRouter, route_by_rules
+
+
+class _Model:
+    def __init__(self, dim=16, seed=0):
+        self.rng = np.random.default_rng(seed)
+        self.dim = dim
+        self.vectors = {}
+
+    def encode(self, texts):
+        for text in texts:
+            if text not in self.vectors:
+                self.vectors[text] = self.rng.normal(size=self.dim).astype(np.float32)
+        return np.array([self.vectors[text] for text in texts])
+
+
+def test_route_matches_per_subscription_loop(tmp_path):
+    model = _Model()
+    rng = np.random.default_rng(1)
+    phrases = [f'фраза {i}' for i in range(50)]
+    subscriptions = [
+        Subscription(name=f's{i}', targets=[str(i)], threshold=0.3, full_cycle=i % 2 == 0,
+                     keywords=list(rng.choice(phrases, size=rng.integers(0, 6), replace=False)))
+        for i in range(200)
+    ]
+
+    # У одной подписки свой классификатор из ModelStore
+    X = rng.normal(size=(60, 16)).astype(np.float32)
+    ModelStore('team_clf', db_path=str(tmp_path / 'bot.db')).save(LogisticRegression().fit(X, X[:, 0] > 0))
+    subscriptions[5].classifier = 'team_clf'
+
+    router = SubscriptionRouter(model, subscriptions, db_path=str(tmp_path / 'bot.db'))
+    assert router.has_classifiers and router.phrase_count <= 50
+
+    texts = model.encode(phrases[:10]) + 0.3 * rng.normal(size=(10, 16)).astype(np.float32)
+    full_cycle = [False] * 9 + [True]
+    routes = router.route(texts, texts, [None] * 10, full_cycle)
+
+    normalized = texts / np.linalg.norm(texts, axis=1, keepdims=True)
+    for row, matched in enumerate(routes):
+        expected = set()
+        for subscription in subscriptions:
+            if subscription.classifier:
+                continue
+            vectors = model.encode(subscription.keywords) if subscription.keywords else np.zeros((0, 16))
+            vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+            best = float((vectors @ normalized[row]).max()) if len(vectors) else 0.0
+            if best > 0.3 or (full_cycle[row] and subscription.full_cycle):
+                expected.add(subscription.name)
+        names = {match['subscription'] for match in matched}
+        assert names - {'s5'} == expected
+        assert ('s5' in names) == bool(texts[row] @ router._weights[5] + router._biases[5] > 0)
+
+    recipients = SubscriptionRouter.recipients(routes[9])
+    assert all(names for names in recipients.values()) and len(recipients) >= 100
+
+
+def test_route_by_rules_without_model():
+    subscriptions = [
+        Subscription(name='web', targets=['1', '2'], keywords=['Веб-дизайн'], full_cycle=False),
+        Subscription(name='video', targets=['2'], keywords=['монтаж'])
+    ]
+    routes = route_by_rules(
+        subscriptions, ['Нужен веб-дизайн сайта', 'Проект под ключ', 'Просто текст'], [False, True, False]
+    )
+    assert [[m['subscription'] for m in matched] for matched in routes] == [['web'], ['video'], []]
+    assert routes[0][0]['similarity'] == 1.0 and routes[1][0]['similarity'] == 0.0
@@ -0,0 +1,29 @@
+import sys
+import os
+import numpy as np
+
+# Добавляем путь к проекту
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from text_chunking import pool_chunks, split_windows
+
+
+def test_split_windows_overlap_and_cap():
+    assert split_windows('короткий текст', window=10) == ['короткий текст']
+
+    text = ' '.join(f'w{i}' for i in range(100))
+    chunks = split_windows(text, window=30, overlap=10, max_chunks=0)
+    words = [chunk.split() for chunk in chunks]
+    assert all(len(chunk) == 30 for chunk in words)
+    # Соседние окна перекрываются, последнее доходит до конца текста
+    assert words[0][-10:] == words[1][:10]
+    assert words[-1][-1] == 'w99'
+
+    capped = split_windows(text, window=30, overlap=10, max_chunks=2)
+    assert capped == [chunks[0], chunks[-1]]
+
+
+def test_pool_chunks():
+    embeddings = np.array([[1, 0], [3, 4], [5, 6], [0, 2]], dtype=np.float32)
+    assert np.allclose(pool_chunks(embeddings, [1, 3]), [[1, 0], [8 / 3, 4]])
+    assert pool_chunks(embeddings, [1, 3], 'max').tolist() == [[1, 0], [5, 6]]
@@ -0,0 +1,103 @@
+import pytest
+import sys
+import os
+import numpy as np
+
+# Добавляем путь к проекту
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import DatabaseManager
+from training_store import EmbeddingBuffer, TrainingMatrixStore
+
+
+@pytest.fixture
+def db_manager(tmp_path):
+    return DatabaseManager(str(tmp_path / 'test.db'))
+
+
+def _add_examples(db_manager, start, count, dim=4):
+    for i in range(start, start + count):
+        db_manager.save_training_example(f'пример {i}', np.full(dim, i, dtype=np.float32), i % 2)
+
+
+def test_store_syncs_with_training_table(db_manager):
+    _add_examples(db_manager, 0, 5)
+    store = TrainingMatrixStore(db_manager)
+    assert store.sync() == 5
+
+    X, y = store.arrays()
+    assert X.shape == (5, 4)
+    assert X[3].tolist() == [3.0] * 4
+    assert y.tolist() == [0, 1, 0, 1, 0]
+
+    # После перезапуска дочитываются только новые строки
+    _add_examples(db_manager, 5, 2)
+    reopened = TrainingMatrixStore(db_manager)
+    assert len(reopened) == 5
+    buffer = reopened.load_into(EmbeddingBuffer())
+    assert reopened.sync(buffer) == 2
+    assert len(buffer) == 7 and buffer.ids.tolist() == list(range(1, 8))
+    assert reopened.arrays()[0][-1].tolist() == [6.0] * 4
+
+
+def test_store_rebuilds_after_delete_and_torn_write(db_manager):
+    _add_examples(db_manager, 0, 4)
+    store = TrainingMatrixStore(db_manager)
+    store.sync()
+
+    # Недописанная строка после сбоя отрезается при открытии
+    with open(store.embeddings_path, 'ab') as f:
+        f.write(b'\x00' * 8)
+    assert len(TrainingMatrixStore(db_manager)) == 4
+
+    with db_manager.get_connection() as conn:
+        conn.execute('DELETE FROM training_data WHERE id = 2')
+        conn.commit()
+    store = TrainingMatrixStore(db_manager)
+    store.sync()
+    assert store.ids().tolist() == [1, 3, 4]
+    assert store.arrays()[0][:, 0].tolist() == [0.0, 2.0, 3.0]
+
+
+def test_embedding_buffer_grows_without_copying_views():
+    buffer = EmbeddingBuffer(capacity=2)
+    buffer.append(np.ones(3), 1, row_id=10)
+    buffer.append(np.zeros(3), 0, row_id=11)
+    X, y = buffer.arrays()
+
+    buffer.extend(np.full((3, 3), 2.0), [1, 1, 0], [12, 13, 14])
+    assert buffer.capacity == 8
+    assert len(buffer) == 5
+    # Выданный ранее срез не меняется при росте
+    assert X.shape == (2, 3) and y.tolist() == [1, 0]
+    assert buffer.ids.tolist() == [10, 11, 12, 13, 14]
+    assert buffer.arrays()[0].base is not None
+
+
+def test_embedding_buffer_clear_keeps_views_intact():
+    buffer = EmbeddingBuffer(capacity=4)
+    buffer.extend(np.ones((2, 3)), [1, 0], [10, 11])
+    X, y = buffer.arrays()
+
+    # Перечитывание выборки после clear не затирает срезы, которые держит обучение
+    buffer.clear()
+    buffer.extend(np.zeros((2, 3)), [0, 1], [20, 21])
+    assert X.tolist() == [[1.0] * 3] * 2 and y.tolist() == [1, 0]
+    assert buffer.ids.tolist() == [20, 21] and buffer.dim == 3
+
+
+def test_skipped_rows_survive_restart(db_manager):
+    _add_examples(db_manager, 0, 3)
+    _add_examples(db_manager, 3, 1, dim=8)
+    store = TrainingMatrixStore(db_manager)
+    assert store.sync() == 3
+
+    # Пропущенная строка другой размерности не вызывает пересборку после перезапуска
+    reopened = TrainingMatrixStore(db_manager)
+    assert reopened.sync() == 0
+    _add_examples(db_manager, 4, 1)
+    assert reopened.sync() == 1
+
+    restarted = TrainingMatrixStore(db_manager)
+    assert restarted.sync() == 0
+    assert restarted.ids().tolist() == [1, 2, 3, 5]
@@ -54,3 +54,28 @@ def test_extract_keywords_from_text():
         assert "test" in keywords
     except ImportError:
         pytest.skip("Utils module not available")
+
+def test_keyword_index_exact_and_ivf():
+    """IVF с просмотром всех кластеров совпадает с точным перебором"""
+    import numpy as np
+    from utils import KeywordIndex
+
+    rng = np.random.default_rng(0)
+    vectors = {f'фраза {i}': rng.normal(size=16).astype(np.float32) for i in range(300)}
+
+    class Model:
+        def encode(self, texts):
+            return np.array([vectors[text] for text in texts])
+
+    model = Model()
+    keywords = list(vectors)
+    exact = KeywordIndex(model, keywords, mode='exact')
+    ivf = KeywordIndex(model, keywords, mode='ivf', nprobe=1000)
+    assert exact.mode == 'exact' and ivf.mode == 'ivf'
+
+    texts = np.array([vectors['фраза 7'], vectors['фраза 42'] + 0.01])
+    for index in (exact, ivf):
+        (score, top), (_, second_top) = index.match(texts, top_n=3)
+        assert top[0][0] == 'фраза 7' and abs(score - 1.0) < 1e-5 and len(top) == 3
+        assert second_top[0][0] == 'фраза 42'
+    assert exact.match(texts)[1][1] == ivf.match(texts)[1][1]
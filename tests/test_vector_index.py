@@ -0,0 +1,70 @@
+import sys
+import os
+import numpy as np
+
+# Добавляем путь к проекту
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import vector_index
+from vector_index import ExactIndex, IVFIndex
+from fast_scorer import NeighborScorer
+from training_store import EmbeddingBuffer
+
+
+def _clustered(rng, n, dim=32, clusters=20):
+    centers = rng.normal(size=(clusters, dim))
+    return (centers[rng.integers(clusters, size=n)] + 0.3 * rng.normal(size=(n, dim))).astype(np.float32)
+
+
+def test_ivf_recall_against_exact():
+    rng = np.random.default_rng(0)
+    vectors = _clustered(rng, 5000)
+    queries = _clustered(rng, 50)
+
+    exact = ExactIndex()
+    exact.add(vectors, np.arange(len(vectors)))
+    ivf = IVFIndex(nlist=32, nprobe=8)
+    ivf.train(vectors)
+    ivf.add(vectors, np.arange(len(vectors)))
+
+    exact_scores, exact_ids = exact.search(queries, 10)
+    ivf_scores, ivf_ids = ivf.search(queries, 10)
+    assert np.all(np.diff(exact_scores, axis=1) <= 1e-6)
+    recall = np.mean([len(set(a) & set(b)) / 10 for a, b in zip(exact_ids, ivf_ids)])
+    assert recall >= 0.9
+
+
+def test_neighbor_scorer_votes_and_evidence():
+    rng = np.random.default_rng(1)
+    buffer = EmbeddingBuffer()
+    positive = rng.normal(loc=1.0, size=(20, 16))
+    negative = rng.normal(loc=-1.0, size=(20, 16))
+    buffer.extend(np.vstack([positive, negative]), np.array([1] * 20 + [0] * 20), np.arange(100, 140))
+
+    for prototypes in (False, True):
+        scorer = NeighborScorer(buffer, k=5, prototypes=prototypes)
+        probabilities = scorer.score(np.vstack([np.ones(16), -np.ones(16)]))
+        assert probabilities[0] > 0.9 and probabilities[1] < 0.1
+
+    scorer = NeighborScorer(buffer, k=5)
+    # Новый пример попадает в индекс без перестроения
+    buffer.append(np.full(16, 5.0), 1, row_id=500)
+    scorer.add(np.full(16, 5.0), len(buffer) - 1, 1)
+    _, evidence = scorer.explain(np.full((1, 16), 5.0), k=3)
+    row_id, similarity, label = evidence[0][0]
+    assert row_id == 500 and label == 1 and similarity > 0.99
+
+
+def test_float16_search_in_blocks_matches_full_scan(monkeypatch):
+    rng = np.random.default_rng(3)
+    vectors = _clustered(rng, 1000)
+    queries = _clustered(rng, 5)
+    compact = ExactIndex(dtype=np.float16)
+    compact.add(vectors, np.arange(len(vectors)))
+    full_scores, full_ids = compact.search(queries, 7)
+
+    # Матрица больше блока: приводится к float32 по частям
+    monkeypatch.setattr(vector_index, 'SCORE_BLOCK_ROWS', 64)
+    block_scores, block_ids = compact.search(queries, 7)
+    assert np.array_equal(block_ids, full_ids)
+    assert np.allclose(block_scores, full_scores)
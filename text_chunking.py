@@ -0,0 +1,56 @@
+"""
+Нарезка длинных текстов на перекрывающиеся окна токенов и пулинг эмбеддингов окон
+"""
+import logging
+import re
+from typing import List, Tuple
+import numpy as np
+
+
+def token_spans(text: str, tokenizer=None) -> List[Tuple[int, int]]:
+    """Границы токенов в исходном тексте (символьные смещения)
+
+    Используется быстрый токенизатор модели (offset mapping); без него - слова по пробелам.
+    """
+    if tokenizer is not None:
+        try:
+            encoded = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)
+            return [tuple(span) for span in encoded['offset_mapping'] if span[1] > span[0]]
+        except Exception as e:
+            logging.debug(f"Токенизатор без offset mapping, режем по словам: {e}")
+    return [match.span() for match in re.finditer(r'\S+', text)]
+
+
+def split_windows(text: str, tokenizer=None, window: int = 128, overlap: int = 32,
+                  max_chunks: int = 8) -> List[str]:
+    """Делит текст на окна по window токенов с перекрытием overlap
+
+    Короткий текст возвращается как есть. Если окон больше max_chunks, берутся равномерно
+    распределенные окна, включая первое и последнее, чтобы конец текста не терялся.
+    """
+    spans = token_spans(text, tokenizer)
+    if len(spans) <= window:
+        return [text]
+
+    step = max(1, window - overlap)
+    starts = list(range(0, len(spans) - window + 1, step))
+    if starts[-1] + window < len(spans):
+        # Последнее окно выравниваем по концу текста
+        starts.append(len(spans) - window)
+    if max_chunks and len(starts) > max_chunks:
+        picked = np.unique(np.linspace(0, len(starts) - 1, max_chunks).round().astype(int))
+        starts = [starts[i] for i in picked]
+
+    chunks = []
+    for start in starts:
+        chunks.append(text[spans[start][0]:spans[start + window - 1][1]])
+    return chunks
+
+
+def pool_chunks(embeddings: np.ndarray, counts: List[int], mode: str = 'mean') -> np.ndarray:
+    """Сворачивает эмбеддинги окон в один вектор на текст (mean или max)"""
+    offsets = np.concatenate([[0], np.cumsum(counts)[:-1]]).astype(np.int64)
+    if mode == 'max':
+        return np.maximum.reduceat(embeddings, offsets, axis=0)
+    sums = np.add.reduceat(embeddings, offsets, axis=0)
+    return sums / np.asarray(counts, dtype=embeddings.dtype)[:, None]
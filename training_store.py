@@ -0,0 +1,280 @@
+"""
+Колоночное хранилище обучающей выборки: матрица эмбеддингов и вектор меток рядом с БД
+"""
+import json
+import logging
+import os
+import threading
+from typing import Optional, Tuple
+import numpy as np
+from config import config
+
+# Сколько строк training_data читать из SQLite за один запрос при синхронизации
+SYNC_CHUNK_SIZE = 5000
+
+
+class EmbeddingBuffer:
+    """Растущая матрица эмбеддингов с метками и id строк training_data
+
+    Емкость удваивается при заполнении, поэтому добавление амортизированно O(1), а
+    arrays() отдает срезы без копирования. Тексты не хранятся - только id строк.
+    Выданные срезы остаются корректными: новые строки пишутся за их пределами, а при
+    расширении и очистке создается новый массив. Блокировка нужна для согласованного
+    снимка (матрица, метки) при чтении из потока обучения.
+    """
+
+    def __init__(self, dim: int = None, capacity: int = 1024):
+        self.dim = dim
+        self._initial_capacity = max(1, capacity)
+        self._lock = threading.Lock()
+        self._count = 0
+        self._embeddings = None
+        self._labels = np.empty(0, dtype=np.int8)
+        self._ids = np.empty(0, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def capacity(self) -> int:
+        return len(self._labels)
+
+    def _reserve(self, needed: int):
+        """Гарантирует место под needed строк, удваивая емкость"""
+        if needed <= self.capacity:
+            return
+        capacity = max(self.capacity, self._initial_capacity)
+        while capacity < needed:
+            capacity *= 2
+
+        embeddings = np.empty((capacity, self.dim), dtype=np.float32)
+        labels = np.empty(capacity, dtype=np.int8)
+        ids = np.empty(capacity, dtype=np.int64)
+        if self._count:
+            embeddings[:self._count] = self._embeddings[:self._count]
+            labels[:self._count] = self._labels[:self._count]
+            ids[:self._count] = self._ids[:self._count]
+        self._embeddings, self._labels, self._ids = embeddings, labels, ids
+
+    def append(self, embedding: np.ndarray, label: int, row_id: int = -1):
+        """Добавляет одну строку"""
+        embedding = np.asarray(embedding, dtype=np.float32).ravel()
+        with self._lock:
+            if self.dim is None:
+                self.dim = embedding.shape[0]
+            self._reserve(self._count + 1)
+            self._embeddings[self._count] = embedding
+            self._labels[self._count] = label
+            self._ids[self._count] = row_id
+            self._count += 1
+
+    def extend(self, embeddings: np.ndarray, labels: np.ndarray, row_ids: np.ndarray = None):
+        """Добавляет несколько строк одним копированием"""
+        count = len(labels)
+        if not count:
+            return
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(count, -1)
+        with self._lock:
+            if self.dim is None:
+                self.dim = embeddings.shape[1]
+            self._reserve(self._count + count)
+            end = self._count + count
+            self._embeddings[self._count:end] = embeddings
+            self._labels[self._count:end] = labels
+            self._ids[self._count:end] = -1 if row_ids is None else row_ids
+            self._count = end
+
+    def clear(self):
+        """Сбрасывает содержимое; следующая запись идет в новый массив, а не поверх выданных срезов"""
+        with self._lock:
+            self._count = 0
+            self._embeddings = None
+            self._labels = np.empty(0, dtype=np.int8)
+            self._ids = np.empty(0, dtype=np.int64)
+
+    def arrays(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Матрица (n, dim) и метки (n,) - срезы без копирования"""
+        with self._lock:
+            if self._embeddings is None:
+                return np.empty((0, self.dim or 0), dtype=np.float32), np.empty(0, dtype=np.int8)
+            return self._embeddings[:self._count], self._labels[:self._count]
+
+    @property
+    def labels(self) -> np.ndarray:
+        return self._labels[:self._count]
+
+    @property
+    def ids(self) -> np.ndarray:
+        return self._ids[:self._count]
+
+
+class TrainingMatrixStore:
+    """Append-only файлы с эмбеддингами (float32), метками (int8) и id строк training_data
+
+    Источник истины - таблица training_data; файлы-спутники только ускоряют загрузку:
+    при старте дописываются недостающие строки, а при расхождении (удаления, смена модели)
+    выборка пересобирается целиком. Чтение идет через np.memmap без копирования.
+    """
+
+    def __init__(self, db_manager, path: str = None):
+        self.db_manager = db_manager
+        self.path = path or config.ml.training_store_path or f'{db_manager.db_path}.training'
+        self.embeddings_path = f'{self.path}.emb.f32'
+        self.labels_path = f'{self.path}.labels.i8'
+        self.ids_path = f'{self.path}.ids.i64'
+        self.meta_path = f'{self.path}.meta.json'
+        self.dim = None
+        self._count = 0
+        self._skipped = 0
+        self._last_id = 0
+        self._arrays = None
+        self._open()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _open(self):
+        """Читает размеры файлов и отрезает недописанный хвост после сбоя"""
+        count = self._size(self.ids_path) // 8
+        meta = self._read_meta()
+        dim = meta.get('dim')
+        # id пишется последним, поэтому по нему определяется число полных строк
+        if not count or not dim or self._size(self.embeddings_path) < count * dim * 4 \
+                or self._size(self.labels_path) < count:
+            self._reset()
+            return
+
+        self.dim = dim
+        self._count = count
+        self._truncate(self.embeddings_path, count * dim * 4)
+        self._truncate(self.labels_path, count)
+        self._truncate(self.ids_path, count * 8)
+        self._last_id = int(np.fromfile(self.ids_path, dtype=np.int64, count=1, offset=(count - 1) * 8)[0])
+        # Пропущенные строки (другая размерность) в файлах не видны: их число и позиция
+        # после них хранятся в метаданных, иначе каждый запуск начинался бы с пересборки
+        self._skipped = int(meta.get('skipped', 0))
+        self._last_id = max(self._last_id, int(meta.get('last_id', 0)))
+
+    def _read_meta(self) -> dict:
+        try:
+            with open(self.meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            meta['dim'] = int(meta['dim'])
+            return meta
+        except (OSError, ValueError, KeyError, TypeError):
+            return {}
+
+    def _write_meta(self):
+        """Метаданные пишутся после строк, поэтому не опережают содержимое файлов"""
+        with open(self.meta_path, 'w', encoding='utf-8') as f:
+            json.dump({'dim': self.dim, 'skipped': self._skipped, 'last_id': self._last_id}, f)
+
+    @staticmethod
+    def _size(path: str) -> int:
+        return os.path.getsize(path) if os.path.exists(path) else 0
+
+    @staticmethod
+    def _truncate(path: str, size: int):
+        if os.path.getsize(path) != size:
+            with open(path, 'r+b') as f:
+                f.truncate(size)
+
+    def _reset(self):
+        """Удаляет файлы-спутники (уже открытые memmap продолжают читать старые данные)"""
+        for path in (self.embeddings_path, self.labels_path, self.ids_path, self.meta_path):
+            if os.path.exists(path):
+                os.remove(path)
+        self.dim = None
+        self._count = 0
+        self._skipped = 0
+        self._last_id = 0
+        self._arrays = None
+
+    def sync(self, buffer: EmbeddingBuffer = None) -> int:
+        """Дописывает строки training_data, которых еще нет в файлах; возвращает их число
+
+        Если передан buffer, новые строки добавляются и в него (при пересборке он очищается).
+        """
+        try:
+            max_id, known = self.db_manager.get_training_state(self._last_id)
+            if known != self._count + self._skipped or max_id < self._last_id:
+                # Строки удалялись или файлы от другой БД: пересобираем с нуля
+                logging.info("🔄 Пересборка матрицы обучающей выборки")
+                self._reset()
+                if buffer is not None:
+                    buffer.clear()
+
+            added = 0
+            while True:
+                rows = self.db_manager.get_training_rows(self._last_id, SYNC_CHUNK_SIZE)
+                if not rows:
+                    break
+                added += self._append_rows(rows, buffer)
+                if len(rows) < SYNC_CHUNK_SIZE:
+                    break
+            return added
+        except Exception as e:
+            logging.error(f"❌ Ошибка синхронизации матрицы обучения: {e}")
+            return 0
+
+    def _append_rows(self, rows, buffer: EmbeddingBuffer = None) -> int:
+        """Пишет строки (id, embedding bytes, label) в конец файлов"""
+        if self.dim is None:
+            self.dim = len(rows[0][1]) // 4
+            self._write_meta()
+
+        row_bytes = self.dim * 4
+        valid = [row for row in rows if len(row[1]) == row_bytes]
+        if len(valid) != len(rows):
+            self._skipped += len(rows) - len(valid)
+            logging.warning(f"⚠️ Пропущено {len(rows) - len(valid)} примеров с другой размерностью эмбеддинга")
+
+        # Порядок записи важен: id - признак того, что строка записана полностью
+        if valid:
+            with open(self.embeddings_path, 'ab') as f:
+                f.write(b''.join(row[1] for row in valid))
+            with open(self.labels_path, 'ab') as f:
+                f.write(np.array([row[2] for row in valid], dtype=np.int8).tobytes())
+            with open(self.ids_path, 'ab') as f:
+                f.write(np.array([row[0] for row in valid], dtype=np.int64).tobytes())
+            self._count += len(valid)
+            self._arrays = None
+            if buffer is not None:
+                buffer.extend(
+                    np.frombuffer(b''.join(row[1] for row in valid), dtype=np.float32),
+                    [row[2] for row in valid],
+                    [row[0] for row in valid]
+                )
+        # Пропущенные строки тоже сдвигают позицию, чтобы не читать их снова
+        self._last_id = int(rows[-1][0])
+        self._write_meta()
+        return len(valid)
+
+    def arrays(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Матрица эмбеддингов (n, dim) и вектор меток (n,) как memmap только для чтения"""
+        if self._arrays is None:
+            if not self._count:
+                self._arrays = (np.empty((0, self.dim or 0), dtype=np.float32), np.empty(0, dtype=np.int8))
+            else:
+                self._arrays = (
+                    np.memmap(self.embeddings_path, dtype=np.float32, mode='r', shape=(self._count, self.dim)),
+                    np.memmap(self.labels_path, dtype=np.int8, mode='r', shape=(self._count,))
+                )
+        return self._arrays
+
+    @property
+    def labels(self) -> np.ndarray:
+        return self.arrays()[1]
+
+    def ids(self) -> np.ndarray:
+        """id строк training_data в порядке матрицы"""
+        if not self._count:
+            return np.empty(0, dtype=np.int64)
+        return np.memmap(self.ids_path, dtype=np.int64, mode='r', shape=(self._count,))
+
+    def load_into(self, buffer: EmbeddingBuffer) -> EmbeddingBuffer:
+        """Заполняет буфер содержимым файлов одним копированием"""
+        buffer.clear()
+        X, y = self.arrays()
+        buffer.extend(X, y, self.ids())
+        return buffer
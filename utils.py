@@ -3,10 +3,15 @@
 """
 import re
 import logging
-from typing import List, Optional
-from sentence_transformers import SentenceTransformer
-from scipy.spatial.distance import cosine
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+import numpy as np
 from config import config
+from vector_index import ExactIndex, IVFIndex
+
+if TYPE_CHECKING:
+    # Только для аннотаций: sentence_transformers тянет torch и грузится долго
+    from sentence_transformers import SentenceTransformer
+
 
 def clean_text(text: str) -> str:
     """Очищает текст от лишних символов"""
@@ -73,26 +78,105 @@ def is_about_full_cycle_production(text: str) -> bool:
     stages_count = sum([has_planning, has_production, has_completion])
     if stages_count >= 2 and any(phrase in text_lower for phrase in ['полный', 'комплексный', 'под ключ']):
         return True
-    
+
     return False
 
-def calculate_similarity(model: SentenceTransformer, text: str, keywords: List[str]) -> float:
-    """Рассчитывает максимальное сходство текста с ключевыми словами"""
-    if not text or not keywords:
-        return 0.0
+def find_keyword_mentions(text: str, keywords: List[str]) -> List[str]:
+    """Ключевые фразы, встречающиеся в тексте дословно (правило без модели предложений)"""
+    if not text:
+        return []
+
+    text_lower = text.lower()
+    return [keyword for keyword in keywords if keyword and keyword.lower() in text_lower]
+
+class KeywordIndex:
+    """Эмбеддинги ключевых фраз, посчитанные один раз, и поиск лучших фраз для текстов
+
+    Для коротких списков - точный перебор (mode='exact'); для словарей от ivf_threshold
+    фраз - IVF (mode='ivf'): сканируются только nprobe кластеров, поэтому максимум
+    сходства приближенный. mode='auto' выбирает по размеру словаря.
+    """
+    
+    def __init__(self, model: 'SentenceTransformer', keywords: List[str], mode: str = 'auto',
+                 ivf_threshold: int = None, nprobe: int = None):
+        self.model = model
+        self.keywords = list(keywords)
+        embeddings = np.asarray(model.encode([kw.lower() for kw in self.keywords]), dtype=np.float32)
+        
+        if mode == 'auto':
+            threshold = ivf_threshold or config.ml.keyword_ivf_threshold
+            mode = 'ivf' if len(self.keywords) >= threshold else 'exact'
+        if mode == 'ivf':
+            self.index = IVFIndex(nlist=max(1, int(np.sqrt(len(self.keywords)))),
+                                  nprobe=nprobe or config.ml.keyword_nprobe)
+            self.index.train(embeddings)
+        else:
+            self.index = ExactIndex()
+        self.index.add(embeddings, np.arange(len(self.keywords)))
+        self.mode = mode
+    
+    def __len__(self) -> int:
+        return len(self.keywords)
+    
+    def match(self, text_embeddings: np.ndarray, top_n: int = 3) -> List[Tuple[float, List[Tuple[str, float]]]]:
+        """Для каждого текста: (максимальное сходство, [(фраза, сходство), ...] по убыванию)"""
+        scores, ids = self.index.search(text_embeddings, max(1, top_n))
+        results = []
+        for row_scores, row_ids in zip(scores.tolist(), ids.tolist()):
+            matches = [(self.keywords[i], score) for i, score in zip(row_ids, row_scores) if i >= 0]
+            results.append((matches[0][1] if matches else 0.0, matches[:top_n]))
+        return results
+
+# Индексы ключевых фраз по (модель, список фраз): фразы кодируются один раз, а не на каждое сообщение
+_keyword_indexes: Dict[tuple, KeywordIndex] = {}
+
+def get_keyword_index(model: 'SentenceTransformer', keywords: List[str]) -> KeywordIndex:
+    """Возвращает закэшированный индекс ключевых фраз для модели"""
+    key = (id(model), tuple(keywords))
+    index = _keyword_indexes.get(key)
+    if index is None or index.model is not model:
+        if len(_keyword_indexes) >= 8:
+            _keyword_indexes.clear()
+        index = _keyword_indexes[key] = KeywordIndex(model, keywords)
+    return index
+
+def encode_keyword_texts(model: 'SentenceTransformer', texts: List[str]) -> np.ndarray:
+    """Эмбеддинги текстов для сравнения с ключевыми фразами (в нижнем регистре, как и фразы)"""
+    # Один вызов encode на всю пачку вместо вызова на каждый текст
+    return np.asarray(model.encode([text.lower() for text in texts]), dtype=np.float32)
+
+def match_keywords(model: 'SentenceTransformer', texts: List[str], keywords: List[str],
+                   top_n: int = 3, text_embeddings: np.ndarray = None) -> List[Tuple[float, List[Tuple[str, float]]]]:
+    """Максимальное сходство и лучшие ключевые фразы для пачки текстов
+    
+    Готовые эмбеддинги из encode_keyword_texts можно передать, чтобы не кодировать тексты повторно.
+    """
+    if not texts:
+        return []
+    if not keywords:
+        return [(0.0, [])] * len(texts)
     
     try:
-        # Создаем эмбеддинги
-        text_embedding = model.encode([text.lower()])[0]
-        keyword_embeddings = model.encode([kw.lower() for kw in keywords])
-        
-        # Рассчитываем сходство
-        similarities = [1 - cosine(text_embedding, kw_emb) for kw_emb in keyword_embeddings]
-        return max(similarities) if similarities else 0.0
+        index = get_keyword_index(model, keywords)
+        if text_embeddings is None:
+            text_embeddings = encode_keyword_texts(model, texts)
+        results = index.match(text_embeddings, top_n)
+        # Пустые тексты не сравниваем
+        return [result if text else (0.0, []) for text, result in zip(texts, results)]
         
     except Exception as e:
-        logging.error(f"❌ Ошибка при расчете сходства: {e}")
+        logging.error(f"❌ Ошибка при расчете сходства с ключевыми словами: {e}")
+        return [(0.0, [])] * len(texts)
+
+def calculate_similarity(model: 'SentenceTransformer', text: str, keywords: List[str]) -> float:
+    """Рассчитывает максимальное сходство текста с ключевыми словами"""
+    if not text or not keywords:
         return 0.0
+    return float(match_keywords(model, [text], keywords, top_n=1)[0][0])
+
+def calculate_similarity_batch(model: 'SentenceTransformer', texts: List[str], keywords: List[str]) -> List[float]:
+    """Рассчитывает максимальное сходство с ключевыми словами для пачки текстов"""
+    return [float(score) for score, _ in match_keywords(model, texts, keywords, top_n=1)]
 
 def contains_blacklisted_words(text: str) -> bool:
     """Проверяет наличие слов из черного списка"""
@@ -0,0 +1,219 @@
+"""
+Поиск ближайших соседей по косинусному сходству: полный перебор и IVF-разбиение
+"""
+from typing import Optional, Tuple
+import numpy as np
+
+# Сколько строк компактной матрицы (float16) приводится к float32 за раз при поиске
+SCORE_BLOCK_ROWS = 8192
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """Нормирует строки к единичной длине (float32)"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors.reshape(1, -1)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Индексы k наибольших значений в каждой строке по убыванию (argpartition + сортировка k)"""
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        return np.empty((scores.shape[0], 0), dtype=np.int64)
+    if k < scores.shape[1]:
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.tile(np.arange(scores.shape[1]), (scores.shape[0], 1))
+    order = np.argsort(-np.take_along_axis(scores, candidates, axis=1), axis=1)
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+def search_rows(queries: np.ndarray, vectors: np.ndarray, ids: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """k лучших (сходства, id) нормированных запросов по матрице векторов
+
+    float16 умножается в float32 (в numpy так быстрее), но приводится блоками по
+    SCORE_BLOCK_ROWS строк с переносом лучших кандидатов, чтобы запрос не копировал
+    все хранилище и не съедал выигрыш по памяти.
+    """
+    if vectors.dtype == np.float32 or len(vectors) <= SCORE_BLOCK_ROWS:
+        scores = queries @ vectors.astype(np.float32, copy=False).T
+        best = top_k(scores, k)
+        return np.take_along_axis(scores, best, axis=1), ids[best]
+
+    best_scores = np.empty((len(queries), 0), dtype=np.float32)
+    best_ids = np.empty((len(queries), 0), dtype=np.int64)
+    for start in range(0, len(vectors), SCORE_BLOCK_ROWS):
+        end = start + SCORE_BLOCK_ROWS
+        scores = queries @ vectors[start:end].astype(np.float32).T
+        best = top_k(scores, k)
+        merged_scores = np.concatenate([best_scores, np.take_along_axis(scores, best, axis=1)], axis=1)
+        merged_ids = np.concatenate([best_ids, ids[start:end][best]], axis=1)
+        keep = top_k(merged_scores, k)
+        best_scores = np.take_along_axis(merged_scores, keep, axis=1)
+        best_ids = np.take_along_axis(merged_ids, keep, axis=1)
+    return best_scores, best_ids
+
+
+class _GrowableRows:
+    """Матрица векторов с id, емкость которой удваивается при заполнении"""
+
+    def __init__(self, dim: int, dtype=np.float32, capacity: int = 256):
+        self.vectors = np.empty((capacity, dim), dtype=dtype)
+        self.ids = np.empty(capacity, dtype=np.int64)
+        self.count = 0
+
+    def add(self, vectors: np.ndarray, ids: np.ndarray):
+        end = self.count + len(ids)
+        if end > len(self.ids):
+            capacity = len(self.ids)
+            while capacity < end:
+                capacity *= 2
+            grown = np.empty((capacity, self.vectors.shape[1]), dtype=self.vectors.dtype)
+            grown[:self.count] = self.vectors[:self.count]
+            grown_ids = np.empty(capacity, dtype=np.int64)
+            grown_ids[:self.count] = self.ids[:self.count]
+            self.vectors, self.ids = grown, grown_ids
+        self.vectors[self.count:end] = vectors
+        self.ids[self.count:end] = ids
+        self.count = end
+
+    def view(self) -> Tuple[np.ndarray, np.ndarray]:
+        return self.vectors[:self.count], self.ids[:self.count]
+
+
+class ExactIndex:
+    """Полный перебор по нормированной матрице; точный, O(n * d) на запрос"""
+
+    def __init__(self, dim: int = None, dtype=np.float32):
+        self.dim = dim
+        self.dtype = dtype
+        self._rows: Optional[_GrowableRows] = None
+
+    def __len__(self) -> int:
+        return self._rows.count if self._rows else 0
+
+    def add(self, vectors: np.ndarray, ids) -> None:
+        """Добавляет векторы (нормируются при добавлении)"""
+        vectors = normalize_rows(vectors)
+        if not len(vectors):
+            return
+        if self._rows is None:
+            self.dim = vectors.shape[1]
+            self._rows = _GrowableRows(self.dim, self.dtype)
+        self._rows.add(vectors, np.asarray(ids, dtype=np.int64))
+
+    def search(self, queries: np.ndarray, k: int = 10) -> Tuple[np.ndarray, np.ndarray]:
+        """Для каждого запроса k лучших (сходства, id) по убыванию сходства"""
+        queries = normalize_rows(queries)
+        if not len(self):
+            empty = np.empty((len(queries), 0))
+            return empty.astype(np.float32), empty.astype(np.int64)
+        vectors, ids = self._rows.view()
+        return search_rows(queries, vectors, ids, k)
+
+
+class IVFIndex:
+    """Инвертированный индекс: векторы разбиты на nlist кластеров (сферический k-means),
+    запрос сканирует только nprobe ближайших кластеров
+
+    Приближенный: recall растет с nprobe. Центроиды обучаются один раз на выборке,
+    новые векторы просто раскладываются по ближайшим кластерам.
+    """
+
+    def __init__(self, nlist: int = 256, nprobe: int = 8, dtype=np.float32):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.dtype = dtype
+        self.dim = None
+        self.centroids: Optional[np.ndarray] = None
+        self._lists = []
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def train(self, sample: np.ndarray, iterations: int = 10, seed: int = 42):
+        """Обучает центроиды на выборке векторов"""
+        sample = normalize_rows(sample)
+        rng = np.random.default_rng(seed)
+        nlist = max(1, min(self.nlist, len(sample)))
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            for cluster in range(nlist):
+                members = sample[assignment == cluster]
+                if len(members):
+                    centroids[cluster] = members.sum(axis=0)
+                else:
+                    # Пустой кластер переносим в случайную точку
+                    centroids[cluster] = sample[rng.integers(len(sample))]
+            centroids = normalize_rows(centroids)
+
+        self.nlist = nlist
+        self.dim = sample.shape[1]
+        self.centroids = centroids
+        self._lists = [_GrowableRows(self.dim, self.dtype, capacity=16) for _ in range(nlist)]
+        self._count = 0
+
+    def add(self, vectors: np.ndarray, ids) -> None:
+        """Раскладывает векторы по ближайшим кластерам"""
+        vectors = normalize_rows(vectors)
+        ids = np.asarray(ids, dtype=np.int64)
+        if not len(vectors):
+            return
+        if not self.is_trained:
+            self.train(vectors)
+        assignment = np.argmax(vectors @ self.centroids.T, axis=1)
+        order = np.argsort(assignment, kind='stable')
+        clusters, starts = np.unique(assignment[order], return_index=True)
+        bounds = list(starts[1:]) + [len(order)]
+        for cluster, start, end in zip(clusters, starts, bounds):
+            members = order[start:end]
+            self._lists[cluster].add(vectors[members], ids[members])
+        self._count += len(ids)
+
+    def search(self, queries: np.ndarray, k: int = 10, nprobe: int = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Для каждого запроса k лучших (сходства, id) среди nprobe ближайших кластеров
+
+        Если кандидатов меньше k, хвост строки заполнен id -1 и сходством -inf.
+        """
+        queries = normalize_rows(queries)
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        if not self._count:
+            empty = np.empty((len(queries), 0))
+            return empty.astype(np.float32), empty.astype(np.int64)
+
+        # Лучшие k кандидатов от каждого просмотренного кластера: (запрос, кластер, k)
+        probes = top_k(queries @ self.centroids.T, nprobe)
+        candidate_scores = np.full((len(queries), probes.shape[1], k), -np.inf, dtype=np.float32)
+        candidate_ids = np.full((len(queries), probes.shape[1], k), -1, dtype=np.int64)
+
+        # Обходим кластеры, а не запросы: все запросы к кластеру считаются одним умножением
+        flat = probes.ravel()
+        order = np.argsort(flat, kind='stable')
+        clusters, starts = np.unique(flat[order], return_index=True)
+        bounds = list(starts[1:]) + [len(order)]
+        for cluster, start, end in zip(clusters, starts, bounds):
+            vectors, ids = self._lists[cluster].view()
+            if not len(ids):
+                continue
+            rows, slots = np.divmod(order[start:end], probes.shape[1])
+            scores, found_ids = search_rows(queries[rows], vectors, ids, k)
+            columns = np.arange(scores.shape[1])
+            candidate_scores[rows[:, None], slots[:, None], columns] = scores
+            candidate_ids[rows[:, None], slots[:, None], columns] = found_ids
+
+        candidate_scores = candidate_scores.reshape(len(queries), -1)
+        candidate_ids = candidate_ids.reshape(len(queries), -1)
+        best = top_k(candidate_scores, k)
+        all_scores = np.take_along_axis(candidate_scores, best, axis=1)
+        all_ids = np.take_along_axis(candidate_ids, best, axis=1)
+
+        found = int((all_ids >= 0).sum(axis=1).max())
+        return all_scores[:, :found], all_ids[:, :found]